@@ -1,16 +1,53 @@
 try:
+    from channels.db import database_sync_to_async
     from channels.generic.websocket import AsyncJsonWebsocketConsumer
 
+    from . import presence
+    from .realtime import user_group
+
     class FeedConsumer(AsyncJsonWebsocketConsumer):
+        """Per-user push socket at ws/feed/ (see core.realtime for the events)."""
+
         async def connect(self):
+            user = self.scope.get('user')
+            if user is None or not user.is_authenticated:
+                await self.close()
+                return
+            self.user = user
+            self.group = user_group(user.id)
+            await database_sync_to_async(presence.touch)(user.id)
+            await self.channel_layer.group_add(self.group, self.channel_name)
             await self.accept()
 
         async def disconnect(self, code):
-            pass
+            if hasattr(self, 'group'):
+                await self.channel_layer.group_discard(self.group, self.channel_name)
 
         async def receive_json(self, content):
-            # Placeholder: handle events like like/comment notifications
-            await self.send_json({'type': 'ack', 'received': content})
+            kind = content.get('type')
+            if kind == 'ping':
+                # Client heartbeat, also keeps the user online
+                await database_sync_to_async(presence.touch)(self.user.id)
+                await self.send_json({'type': 'pong'})
+            elif kind == 'typing':
+                await self.record_typing(content.get('conversation_id'), bool(content.get('is_typing', True)))
+
+        @database_sync_to_async
+        def record_typing(self, conversation_id, is_typing):
+            from .models import ConversationMember
+            try:
+                conversation_id = int(conversation_id)
+            except (TypeError, ValueError):
+                return
+            members = set(
+                ConversationMember.objects.filter(conversation_id=conversation_id).values_list('user_id', flat=True)
+            )
+            if self.user.id in members:
+                presence.set_typing(conversation_id, self.user, is_typing, members)
+
+        async def push_event(self, event):
+            """Group message sent by core.realtime.push()."""
+            await self.send_json({'type': event['event'], **event['data']})
 except Exception:
     # Channels not installed or available; keep file safe
     pass
@@ -1,32 +1,27 @@
+import logging
+
 from django.contrib.auth.models import User
-from .models import Follow
+from django.utils.functional import SimpleLazyObject
+from .suggestions import get_sidebar_users
+
+logger = logging.getLogger(__name__)
+
+
+def _load_suggestions(user):
+    try:
+        return get_sidebar_users(user, 5, User.objects.select_related('profile'))
+    except Exception:
+        # The sidebar is optional; never break the page over it
+        logger.exception('Could not load sidebar suggestions')
+        return []
+
 
 def suggestions_context(request):
     """
-    Context processor for user suggestions in the sidebar
+    Context processor for user suggestions in the sidebar.
+
+    `suggestions` is lazy: nothing is queried unless a template actually
+    reads it, and the picked IDs are cached per user (see
+    core.suggestions.get_sidebar_users).
     """
-    context = {}
-    
-    try:
-        if request.user.is_authenticated:
-            # Get users that current user is following
-            following_users = User.objects.filter(
-                followers__follower=request.user
-            )
-            
-            # Get random suggestions: users not followed by current user and not current user
-            suggestions = User.objects.exclude(
-                id__in=following_users.values_list('id', flat=True)
-            ).exclude(id=request.user.id).order_by('?')[:5]
-            
-            context['suggestions'] = suggestions
-        else:
-            # For non-authenticated users, show random users
-            context['suggestions'] = User.objects.all().order_by('?')[:5]
-            
-    except Exception as e:
-        # If any error occurs, return empty suggestions
-        print(f"Error in suggestions_context: {e}")
-        context['suggestions'] = User.objects.none()
-    
-    return context
\ No newline at end of file
+    return {'suggestions': SimpleLazyObject(lambda: _load_suggestions(request.user))}
@@ -0,0 +1,74 @@
+"""
+Backend-specific fast paths.
+
+Views stay backend-agnostic and call these helpers, which use the native
+statement when the database has one (PostgreSQL, and SQLite where noted)
+and fall back to the portable ORM equivalent otherwise.
+"""
+from django.db import connections, router, transaction
+from django.db.models.signals import post_save, pre_save
+
+
+def is_postgres(using='default'):
+    return connections[using].vendor == 'postgresql'
+
+
+def insert_ignore(model, **values):
+    """Insert a row unless it would violate a unique constraint.
+
+    Returns ``(obj, created)`` like get_or_create(), except that `obj` is
+    None when the row already existed. Where the backend supports it this
+    is an ``INSERT ... ON CONFLICT DO NOTHING`` (SQLite spells it INSERT OR
+    IGNORE) and a re-select instead of SELECT + SAVEPOINT + INSERT, and
+    concurrent toggles can't fail with IntegrityError. save() signals are
+    still sent for new rows.
+
+    The re-select matches every column, including the created_at that
+    bulk_create() fills in, so it finds the row only if this call wrote it;
+    models without such a timestamp can't tell a new row from an identical
+    old one.
+    """
+    using = router.db_for_write(model)
+    manager = model._default_manager.db_manager(using)
+    if not connections[using].features.supports_ignore_conflicts:
+        return manager.get_or_create(**values)
+
+    obj = model(**values)
+    pre_save.send(sender=model, instance=obj, raw=False, using=using, update_fields=None)
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    with transaction.atomic(using=using, savepoint=False):
+        manager.bulk_create([obj], ignore_conflicts=True)
+        row = manager.filter(**{field.attname: getattr(obj, field.attname) for field in fields}).first()
+    if row is None:
+        return None, False
+    post_save.send(sender=model, instance=row, created=True, raw=False, using=using, update_fields=None)
+    return row, True
+
+
+def rank_by_similarity(queryset, query, *fields):
+    """On PostgreSQL, order `queryset` by best pg_trgm similarity of `fields` to `query`.
+
+    The filtering itself stays an icontains lookup, which the trigram
+    indexes from migration 0018 serve. Other backends get `queryset` back
+    unchanged.
+    """
+    if not is_postgres(queryset.db):
+        return queryset
+    from django.contrib.postgres.search import TrigramSimilarity
+    from django.db.models.functions import Greatest
+    scores = [TrigramSimilarity(field, query) for field in fields]
+    return queryset.annotate(
+        similarity=Greatest(*scores) if len(scores) > 1 else scores[0]
+    ).order_by('-similarity')
+
+
+def skip_locked(queryset):
+    """Lock the rows `queryset` selects, skipping rows other workers hold.
+
+    Lets several job workers claim from the same table without blocking on
+    each other. SQLite has no row locks; there the queryset is returned
+    unchanged and writers are serialized by BEGIN IMMEDIATE instead.
+    """
+    if connections[queryset.db].features.has_select_for_update_skip_locked:
+        return queryset.select_for_update(skip_locked=True)
+    return queryset
@@ -0,0 +1,179 @@
+"""
+Hashtag and @mention extraction, and trending hashtags.
+
+Saving a post (see the post_save receiver in core.models) re-parses its
+content and diffs the result against the links already stored, so a
+create or edit costs a fixed handful of bulk statements however many
+tags the post carries: new Hashtag rows and M2M links are written with
+bulk_create, usage counts move with one UPDATE each way, and newly
+mentioned users are notified through core.notifications.
+
+Every tag use also bumps an hourly HashtagBucket counter. roll_up() turns
+the buckets inside TRENDING_WINDOW into decayed scores (a use loses half
+its weight every TRENDING_HALF_LIFE hours) in a single aggregate query,
+drops buckets that have left the window and caches the top
+TRENDING_POOL tags until the next roll-up. /api/trending-hashtags/ only
+ever reads that cached list (empty until the first roll-up). The roll-up
+runs as a job (core.jobs) every ROLLUP_INTERVAL: each run queues the next
+one for the following slot, and run_workers starts the chain when it
+starts. `manage.py roll_up_trending` rolls up by hand and starts the chain
+too, e.g. with JOBS_INLINE where there are no workers.
+"""
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Case, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast, Greatest
+from django.utils import timezone
+
+from . import jobs
+from .models import Hashtag, HashtagBucket, Post
+
+HASHTAG_RE = re.compile(r'(?<![\w#&])#(\w{1,100})')
+# Usernames may contain . @ + - but not end a sentence with them
+MENTION_RE = re.compile(r'(?<![\w@])@(\w[\w.@+-]{0,149})')
+
+TRENDING_WINDOW = timedelta(hours=getattr(settings, 'TRENDING_WINDOW_HOURS', 24))
+TRENDING_HALF_LIFE = getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 6)
+TRENDING_POOL = 50
+BUCKET_SIZE = timedelta(hours=1)
+ROLLUP_INTERVAL = timedelta(minutes=getattr(settings, 'TRENDING_ROLLUP_INTERVAL_MINUTES', 5))
+
+TRENDING_CACHE_KEY = 'hashtags:trending'
+
+HashtagLink = Hashtag.posts.through
+MentionLink = Post.mentions.through
+
+
+def extract_hashtags(text):
+    """Distinct lowercase tag names in `text`, in order of first use."""
+    return list(dict.fromkeys(tag.casefold() for tag in HASHTAG_RE.findall(text or '')))
+
+
+def extract_mentions(text):
+    """Distinct usernames mentioned in `text`, in order of first use."""
+    return list(dict.fromkeys(name.rstrip('.-+@') for name in MENTION_RE.findall(text or '')))
+
+
+def bucket_start(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _sync_hashtags(post, names, used_at):
+    current = dict(HashtagLink.objects.filter(post_id=post.pk).values_list('hashtag__name', 'hashtag_id'))
+    added = [name for name in names if name not in current]
+    removed = [tag_id for name, tag_id in current.items() if name not in names]
+
+    if removed:
+        HashtagLink.objects.filter(post_id=post.pk, hashtag_id__in=removed).delete()
+        Hashtag.objects.filter(id__in=removed).update(usage_count=Greatest(F('usage_count') - 1, 0))
+    if not added:
+        return
+
+    Hashtag.objects.bulk_create([Hashtag(name=name) for name in added], ignore_conflicts=True)
+    added_ids = list(Hashtag.objects.filter(name__in=added).values_list('id', flat=True))
+    HashtagLink.objects.bulk_create(
+        [HashtagLink(post_id=post.pk, hashtag_id=tag_id) for tag_id in added_ids], ignore_conflicts=True
+    )
+    Hashtag.objects.filter(id__in=added_ids).update(usage_count=F('usage_count') + 1)
+
+    hour = bucket_start(used_at)
+    HashtagBucket.objects.bulk_create(
+        [HashtagBucket(hashtag_id=tag_id, bucket_start=hour, count=0) for tag_id in added_ids],
+        ignore_conflicts=True,
+    )
+    HashtagBucket.objects.filter(hashtag_id__in=added_ids, bucket_start=hour).update(count=F('count') + 1)
+
+
+def _sync_mentions(post, usernames, notify):
+    wanted = dict(
+        User.objects.filter(username__in=usernames, is_active=True)
+        .exclude(id=post.author_id).values_list('id', 'username')
+    )
+    current = set(MentionLink.objects.filter(post_id=post.pk).values_list('user_id', flat=True))
+    added = [user_id for user_id in wanted if user_id not in current]
+
+    stale = current - set(wanted)
+    if stale:
+        MentionLink.objects.filter(post_id=post.pk, user_id__in=stale).delete()
+    if added:
+        MentionLink.objects.bulk_create(
+            [MentionLink(post_id=post.pk, user_id=user_id) for user_id in added], ignore_conflicts=True
+        )
+    if added and notify:
+        from . import notifications
+        for user_id in added:
+            notifications.notify(user_id, post.author_id, 'mention', 'mentioned you in a post', target_post_id=post.pk)
+
+
+def index_post(post, notify=True, used_at=None):
+    """Bring a post's hashtag and mention links in line with its content.
+
+    Newly added tags count towards trending at `used_at` (default now).
+    Newly mentioned users are notified unless `notify` is False. A repost
+    carries a copy of the original's content, which the original already
+    counted, so only a quote's own text is parsed.
+    """
+    text = post.quote_text if post.repost_parent_id else post.content
+    _sync_hashtags(post, extract_hashtags(text), used_at or timezone.now())
+    _sync_mentions(post, extract_mentions(text), notify)
+
+
+def forget_post(post):
+    """Release a deleted post's hashtag uses (its links go with the cascade)."""
+    Hashtag.objects.filter(posts=post).update(usage_count=Greatest(F('usage_count') - 1, 0))
+
+
+def roll_up(now=None):
+    """Recompute trending scores from the hourly buckets and cache the top tags."""
+    now = now or timezone.now()
+    current = bucket_start(now)
+    oldest = current - TRENDING_WINDOW + BUCKET_SIZE
+    HashtagBucket.objects.filter(bucket_start__lt=oldest).delete()
+
+    # One weight per bucket in the window: 1.0 for this hour, halving every half-life
+    hours = int(TRENDING_WINDOW / BUCKET_SIZE)
+    weights = [When(bucket_start=current - n * BUCKET_SIZE, then=Value(0.5 ** (n / TRENDING_HALF_LIFE)))
+               for n in range(hours)]
+    rows = (
+        HashtagBucket.objects.filter(bucket_start__gte=oldest)
+        .values('hashtag__name')
+        .annotate(
+            score=Sum(Cast('count', FloatField()) * Case(*weights, default=Value(0.0), output_field=FloatField())),
+            recent=Sum('count'),
+        )
+        .order_by('-score', 'hashtag__name')[:TRENDING_POOL]
+    )
+    trending = [
+        {'name': row['hashtag__name'], 'count': row['recent'], 'score': round(row['score'], 3)}
+        for row in rows
+    ]
+    cache.set(TRENDING_CACHE_KEY, trending, None)
+    return trending
+
+
+def schedule_roll_up():
+    """Queue a roll-up for the next ROLLUP_INTERVAL slot, unless one is queued already."""
+    now = timezone.now().timestamp()
+    slot = ROLLUP_INTERVAL.total_seconds()
+    due = (now // slot + 1) * slot
+    jobs.enqueue(roll_up_job, key=f'hashtags.roll_up:{int(due)}', delay=timedelta(seconds=due - now))
+
+
+@jobs.task(priority=-5)
+def roll_up_job():
+    """Job task: roll_up(), after queueing the next one so a failure does not end the chain."""
+    schedule_roll_up()
+    roll_up()
+
+
+def trending(limit=10):
+    """Top `limit` tags from the last roll-up: [{'name', 'count', 'score'}, ...].
+
+    Never rolls up itself: before the first roll_up() (or after the cache
+    lost it) this is empty rather than an aggregate query in a request.
+    """
+    return cache.get(TRENDING_CACHE_KEY, [])[:limit]
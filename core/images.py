@@ -0,0 +1,192 @@
+"""
+Resized, re-encoded derivatives of uploaded images.
+
+Every uploaded image is rendered at a few named sizes (SIZES, longest
+edge in pixels) in each of FORMATS that the local Pillow build can
+encode. Derivatives are stored next to the originals under a key derived
+only from the original's name:
+
+    derived/<size>/<original name>.<format>
+
+so serializers can build URLs without touching the database or storage,
+and a derivative can always be traced back to its source. EXIF (GPS
+position, camera serial and the like) is dropped on re-encode after the
+orientation tag has been applied to the pixels.
+
+Saving a model listed in FIELDS with a newly uploaded image (see the
+save receivers in core.models) queues a background job (core.jobs) that
+renders them. Images uploaded before this existed, or requested before a
+worker got to them, are rendered on first request by the derived_image
+view.
+"""
+import os
+import posixpath
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+from . import jobs
+
+# Longest edge in pixels; images are never upscaled
+SIZES = {
+    'avatar': 96,
+    'thumb': 320,
+    'feed': 1080,
+    'full': 2048,
+}
+AVATAR_SIZES = ('avatar', 'thumb')
+PHOTO_SIZES = ('thumb', 'feed', 'full')
+
+# format name -> (Pillow encoder, save options, content type)
+ENCODERS = {
+    'avif': ('AVIF', {'quality': 55, 'speed': 8}, 'image/avif'),
+    'webp': ('WEBP', {'quality': 80, 'method': 4}, 'image/webp'),
+}
+# Preferred first; `src` URLs use the last one, which every browser decodes
+FORMATS = tuple(
+    name for name in getattr(settings, 'IMAGE_DERIVATIVE_FORMATS', ('avif', 'webp'))
+    if name in ENCODERS and features.check(name)
+)
+FALLBACK_FORMAT = FORMATS[-1]
+
+# model label -> {image field: sizes rendered for it}
+FIELDS = {
+    'core.Profile': {'profile_pic': AVATAR_SIZES, 'cover_pic': PHOTO_SIZES},
+    'core.Post': {'image': PHOTO_SIZES},
+    'core.Comment': {'image': PHOTO_SIZES},
+    'core.Story': {'image': PHOTO_SIZES},
+    'core.ConversationMessage': {'image': PHOTO_SIZES},
+}
+
+PREFIX = 'derived'
+
+
+def derived_key(name, size, fmt):
+    return f'{PREFIX}/{size}/{name}.{fmt}'
+
+
+def derived_keys(name):
+    """Every key a derivative of `name` could be stored under."""
+    return [derived_key(name, size, fmt) for size in SIZES for fmt in ENCODERS]
+
+
+def parse_key(key):
+    """(original name, size, format) for a derived key, or None if it is not one we render."""
+    prefix, _, rest = key.partition('/')
+    size, _, path = rest.partition('/')
+    name, _, fmt = path.rpartition('.')
+    if prefix != PREFIX or size not in SIZES or fmt not in FORMATS or not name:
+        return None
+    if posixpath.normpath(name) != name or name.startswith(('/', '.')):
+        return None
+    if not name.startswith(_upload_dirs()):
+        return None
+    return name, size, fmt
+
+
+def _upload_dirs():
+    from django.apps import apps
+    from .storage import PREFIX as CONTENT_PREFIX
+    dirs = [f'{CONTENT_PREFIX}/']
+    for label, fields in FIELDS.items():
+        model = apps.get_model(label)
+        dirs.extend(model._meta.get_field(field).upload_to for field in fields)
+    return tuple(dirs)
+
+
+def url(name, size, fmt=None):
+    return default_storage.url(derived_key(name, size, fmt or FALLBACK_FORMAT))
+
+
+def srcset(name, sizes, fmt=None):
+    """A srcset attribute value listing `name` at each of `sizes`."""
+    return ', '.join(f'{url(name, size, fmt)} {SIZES[size]}w' for size in sizes)
+
+
+def image_urls(field, sizes=PHOTO_SIZES, size='feed'):
+    """URLs for an optional ImageField value: {'src', 'srcset', 'sources', 'original'}, or None.
+
+    `sources` maps each content type to a srcset for <picture><source>;
+    `src` and `srcset` use the universally supported fallback format.
+    """
+    if not field:
+        return None
+    name = field.name
+    return {
+        'src': url(name, size),
+        'srcset': srcset(name, sizes),
+        'sources': {ENCODERS[fmt][2]: srcset(name, sizes, fmt) for fmt in FORMATS},
+        'original': field.url,
+    }
+
+
+def render(name, sizes, formats=FORMATS):
+    """Render and store the derivatives of original `name`; returns the keys written."""
+    with default_storage.open(name, 'rb') as original:
+        with Image.open(original) as source:
+            image = ImageOps.exif_transpose(source)
+            image.load()
+    # Keep the colour profile, drop EXIF/XMP so encoders cannot carry them over
+    image.info = {key: value for key, value in image.info.items() if key in ('icc_profile', 'transparency')}
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+    written = []
+    # Largest first, each size downsampled from the previous one
+    for size in sorted(sizes, key=SIZES.get, reverse=True):
+        image = image.copy()
+        image.thumbnail((SIZES[size], SIZES[size]), Image.LANCZOS)
+        for fmt in formats:
+            encoder, options, _ = ENCODERS[fmt]
+            buffer = BytesIO()
+            image.save(buffer, encoder, **options)
+            key = derived_key(name, size, fmt)
+            _store(key, buffer.getvalue())
+            written.append(key)
+    return written
+
+
+def _store(key, data):
+    # Renders can race (a job and a request, two requests): write a temp file
+    # and rename it over the key, so readers see the old or the new bytes and
+    # the loser never ends up saved under a suffixed name
+    path = default_storage.path(key)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=directory, prefix='.render-', delete=False) as file:
+        file.write(data)
+    try:
+        if default_storage.file_permissions_mode is not None:
+            os.chmod(file.name, default_storage.file_permissions_mode)
+        os.replace(file.name, path)
+    except BaseException:
+        os.remove(file.name)
+        raise
+
+
+def mark_uploads(instance):
+    """Note which image fields of an unsaved `instance` hold newly uploaded files."""
+    instance._new_images = [
+        field for field in FIELDS.get(instance._meta.label, {})
+        if getattr(instance, field) and not getattr(instance, field)._committed
+    ]
+
+
+def schedule(instance):
+    """Queue derivatives of the uploads mark_uploads() saw as background jobs."""
+    fields = FIELDS.get(instance._meta.label, {})
+    for field in getattr(instance, '_new_images', ()):
+        name = getattr(instance, field).name
+        # Identical uploads share a stored name (core.storage), so render each once
+        jobs.enqueue(render_job, key=f'images.render:{name}', name=name, sizes=list(fields[field]))
+    instance._new_images = []
+
+
+@jobs.task(max_attempts=3)
+def render_job(name, sizes):
+    """Job task: render() `name` unless it was deleted before the job ran."""
+    if default_storage.exists(name):
+        render(name, sizes)
@@ -0,0 +1,245 @@
+"""
+Database-backed background jobs.
+
+Slow side effects (notification writes, image derivatives, broadcasts)
+are functions decorated with @task and queued with enqueue(). Each call
+inserts a Job row in the caller's transaction, so work only becomes
+visible to workers once the change that caused it has committed, and a
+rolled-back request queues nothing. There is no broker: the job table is
+the queue, and `manage.py run_workers` runs one or more worker processes
+that poll it.
+
+* Workers take the ready job with the highest priority, oldest first.
+  Claims use SELECT ... FOR UPDATE SKIP LOCKED where the database has it
+  (core.db.skip_locked); on SQLite BEGIN IMMEDIATE serializes them.
+* A task declared with batch=N is handed up to N queued jobs of that task
+  at once, as a list of their kwargs, so bursts are applied together.
+* A job that raises is retried after an exponential, jittered backoff
+  until it has had max_attempts; then it stays in the table as failed
+  with its last traceback. A job whose worker died is re-queued once its
+  lease (LEASE, longer than any job should take) runs out, so tasks
+  should be safe to run twice.
+* An idempotency key makes enqueue() a no-op while a job with the same
+  key is still in the table; finished jobs are pruned after KEEP_DONE.
+  A job that fails for good gives its key up, so the work can be queued
+  again.
+
+With JOBS_INLINE = True (development and tests) there is no worker:
+ready jobs run in the enqueuing process as soon as its transaction
+commits. Jobs that are not ready yet (queued with a delay, or waiting out
+a retry backoff) run on a later request once they are due; see
+run_due() and core.middleware.InlineJobsMiddleware.
+"""
+import logging
+import os
+import random
+import socket
+import time
+import traceback
+from dataclasses import dataclass
+from datetime import timedelta
+from importlib import import_module
+from typing import Callable
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Min
+from django.utils import timezone
+
+from .db import insert_ignore, skip_locked
+from .models import Job
+
+POLL_INTERVAL = getattr(settings, 'JOBS_POLL_INTERVAL', 1.0)
+LEASE = timedelta(seconds=getattr(settings, 'JOBS_LEASE_SECONDS', 10 * 60))
+BACKOFF = getattr(settings, 'JOBS_BACKOFF_SECONDS', 10)
+MAX_BACKOFF = getattr(settings, 'JOBS_MAX_BACKOFF_SECONDS', 60 * 60)
+KEEP_DONE = timedelta(days=getattr(settings, 'JOBS_KEEP_DONE_DAYS', 7))
+# How often a worker re-queues expired leases and prunes finished jobs
+MAINTENANCE_INTERVAL = 60
+
+logger = logging.getLogger(__name__)
+
+_tasks = {}
+# Earliest run_at of a queued job as of the last run_pending() (JOBS_INLINE)
+_next_due = None
+
+
+@dataclass(frozen=True)
+class Task:
+    name: str
+    func: Callable
+    priority: int = 0
+    max_attempts: int = 5
+    batch: int = 0
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+
+def task(priority=0, max_attempts=5, batch=0):
+    """Register a function as a job task; queue calls to it with enqueue().
+
+    A batch task takes a single argument, the list of kwargs of up to
+    `batch` jobs claimed together.
+    """
+    def register(func):
+        registered = Task(f'{func.__module__}.{func.__name__}', func, priority, max_attempts, batch)
+        _tasks[registered.name] = registered
+        return registered
+    return register
+
+
+def get_task(name):
+    if name not in _tasks:
+        # Workers only import the modules their jobs need
+        try:
+            import_module(name.rpartition('.')[0])
+        except ImportError:
+            pass
+    try:
+        return _tasks[name]
+    except KeyError:
+        raise LookupError(f'Unknown task {name!r}')
+
+
+def _inline():
+    return getattr(settings, 'JOBS_INLINE', False)
+
+
+def enqueue(task, key=None, priority=None, delay=None, **kwargs):
+    """Queue `task(**kwargs)` to run after the current transaction commits.
+
+    `kwargs` must be JSON-serializable. Returns the new Job, or None if a
+    job with idempotency `key` is already queued.
+    """
+    values = {
+        'task': task.name,
+        'kwargs': kwargs,
+        'priority': task.priority if priority is None else priority,
+        'max_attempts': task.max_attempts,
+        'run_at': timezone.now() + (delay or timedelta()),
+    }
+    if key is None:
+        job = Job.objects.create(**values)
+    else:
+        job, _ = insert_ignore(Job, idempotency_key=key, **values)
+    if job is not None and _inline():
+        transaction.on_commit(run_pending)
+    return job
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim(worker_id, now=None):
+    """Lease the next ready job, or the next batch for a batch task, to `worker_id`."""
+    now = now or timezone.now()
+    ready = Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+    with transaction.atomic():
+        first = skip_locked(ready.order_by('-priority', 'run_at', 'id')).first()
+        if first is None:
+            return []
+        try:
+            size = get_task(first.task).batch
+        except LookupError:
+            size = 0
+        ids = [first.id]
+        if size > 1:
+            ids = list(skip_locked(ready.filter(task=first.task).order_by('id')).values_list('id', flat=True)[:size])
+        Job.objects.filter(id__in=ids, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1,
+        )
+        return list(Job.objects.filter(id__in=ids, status=Job.RUNNING, locked_by=worker_id).order_by('id'))
+
+
+def backoff(attempts):
+    """Delay before retrying a job that has failed `attempts` times."""
+    delay = min(MAX_BACKOFF, BACKOFF * 2 ** (attempts - 1))
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+
+def execute(jobs):
+    """Run claimed `jobs` (one job, or a batch of one task) and record the outcome."""
+    try:
+        task = get_task(jobs[0].task)
+        if task.batch:
+            task.func([job.kwargs for job in jobs])
+        else:
+            task.func(**jobs[0].kwargs)
+    except Exception:
+        logger.exception('Job %s (%s) failed', jobs[0].task, ', '.join(str(job.id) for job in jobs))
+        error = traceback.format_exc()
+        for job in jobs:
+            if job.attempts >= job.max_attempts:
+                job.status, job.finished_at, job.idempotency_key = Job.FAILED, timezone.now(), None
+            else:
+                job.status, job.run_at = Job.QUEUED, timezone.now() + backoff(job.attempts)
+            job.last_error, job.locked_by, job.locked_at = error, '', None
+            job.save(update_fields=[
+                'status', 'finished_at', 'run_at', 'idempotency_key', 'last_error', 'locked_by', 'locked_at',
+            ])
+        return False
+    Job.objects.filter(id__in=[job.id for job in jobs]).update(
+        status=Job.DONE, finished_at=timezone.now(), locked_by='', locked_at=None,
+    )
+    return True
+
+
+def requeue_stale(now=None):
+    """Re-queue running jobs leased more than LEASE ago, i.e. whose worker died; returns how many."""
+    now = now or timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=now - LEASE)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, finished_at=now, idempotency_key=None, last_error='Lease expired',
+        locked_by='', locked_at=None,
+    )
+    return failed + stale.update(status=Job.QUEUED, run_at=now, locked_by='', locked_at=None)
+
+
+def prune(now=None):
+    """Delete jobs that finished more than KEEP_DONE ago; returns how many."""
+    done = Job.objects.filter(status=Job.DONE, finished_at__lt=(now or timezone.now()) - KEEP_DONE)
+    return done.delete()[0]
+
+
+def work(worker_id=None, burst=False, stop=lambda: False):
+    """Run jobs until stop() is true, or until the queue is empty if `burst`; returns jobs run."""
+    worker_id = worker_id or worker_name()
+    done = 0
+    maintained = None
+    while not stop():
+        if maintained is None or time.monotonic() - maintained > MAINTENANCE_INTERVAL:
+            requeue_stale()
+            prune()
+            maintained = time.monotonic()
+        jobs = claim(worker_id)
+        if jobs:
+            execute(jobs)
+            done += len(jobs)
+            close_old_connections()
+        elif burst:
+            break
+        else:
+            time.sleep(POLL_INTERVAL)
+    return done
+
+
+def run_pending():
+    """Run every ready job in the calling process (JOBS_INLINE)."""
+    global _next_due
+    worker_id = worker_name()
+    while jobs := claim(worker_id):
+        execute(jobs)
+    # Delayed jobs and retries are left to run_due()
+    _next_due = Job.objects.filter(status=Job.QUEUED).aggregate(due=Min('run_at'))['due']
+
+
+def run_due():
+    """With JOBS_INLINE, run_pending() once a job it left waiting is due.
+
+    Costs no query until then; InlineJobsMiddleware calls it after every
+    request.
+    """
+    if _inline() and _next_due is not None and _next_due <= timezone.now():
+        run_pending()
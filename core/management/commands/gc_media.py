@@ -0,0 +1,58 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import images
+from core.models import MediaBlob
+from core.storage import reclaim, recount, references
+
+
+def _original_of(path):
+    """Name of the upload a derived/<size>/<name>.<format> file was rendered from."""
+    parts = path.split('/', 2)
+    return parts[2].rpartition('.')[0] if len(parts) == 3 else None
+
+
+class Command(BaseCommand):
+    help = 'Recount media references and delete files under MEDIA_ROOT that nothing references'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-minutes', type=int, default=60,
+                            help='Leave files younger than this alone (uploads still being attached)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report what would be removed')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        counts = references()
+        if not dry_run:
+            drifted = recount(counts)
+            released = reclaim(list(MediaBlob.objects.filter(refcount=0).values_list('name', flat=True)))
+            self.stdout.write(f'Recounted references: {drifted} drifted, {len(released)} unreferenced blobs removed')
+
+        cutoff = time.time() - options['grace_minutes'] * 60
+        removed = freed = 0
+        for directory, _, files in os.walk(settings.MEDIA_ROOT):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+                if name in counts:
+                    continue
+                if name.startswith(images.PREFIX + '/') and _original_of(name) in counts:
+                    continue
+                stat = os.stat(path)
+                if stat.st_mtime > cutoff:
+                    continue
+                if dry_run:
+                    self.stdout.write(f'Would remove {name}')
+                else:
+                    os.remove(path)
+                removed += 1
+                freed += stat.st_size
+
+        verb = 'Would remove' if dry_run else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {removed} orphaned files ({freed / (1024 * 1024):.1f} MB)'
+        ))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from core.uploads import STALE_AFTER, purge
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked uploads that were abandoned or never attached (schedule hourly)'
+
+    def handle(self, *args, **options):
+        count = purge()
+        self.stdout.write(self.style.SUCCESS(f'Purged {count} uploads untouched for {STALE_AFTER}'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+from core import search
+
+
+class Command(BaseCommand):
+    help = 'Recreate missing full-text search tables and triggers, then repopulate them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias (default: "default")')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        # install() already repopulates when it had to recreate anything
+        if not search.install(connection):
+            search.rebuild(connection)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the search index on {connection.vendor}'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from core.timeline import rebuild_timeline
+
+
+class Command(BaseCommand):
+    help = 'Rebuild precomputed home timelines from posts and follows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Only rebuild these users (default: everyone)')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+
+        rebuilt = 0
+        for user in users.iterator():
+            rebuild_timeline(user)
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} timelines'))
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from core.models import Post, Like, Comment, Share
+
+
+def _count_of(model, fk='post'):
+    rows = (model.objects.filter(**{fk: OuterRef('pk')})
+            .order_by().values(fk).annotate(n=Count('pk')).values('n'))
+    return Coalesce(Subquery(rows), 0)
+
+
+def actual_counts():
+    """Expressions computing the real value of every Post counter column."""
+    return {
+        'likes_count': _count_of(Like),
+        'comments_count': _count_of(Comment),
+        'repost_count': _count_of(Post, fk='repost_parent'),
+        'share_count': _count_of(Share),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized like/comment/repost/share counters on posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of posts repaired per UPDATE')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many posts have drifted')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        expressions = actual_counts()
+
+        annotated = Post.objects.order_by().annotate(
+            **{f'actual_{field}': expr for field, expr in expressions.items()}
+        )
+        drift = Q()
+        for field in Post.COUNTER_FIELDS:
+            drift |= ~Q(**{field: F(f'actual_{field}')})
+        drifted_ids = list(annotated.filter(drift).values_list('pk', flat=True))
+
+        if options['dry_run']:
+            self.stdout.write(f'{len(drifted_ids)} posts have drifted counters')
+            return
+
+        for start in range(0, len(drifted_ids), batch_size):
+            batch = drifted_ids[start:start + batch_size]
+            with transaction.atomic():
+                Post.objects.filter(pk__in=batch).update(**actual_counts())
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Repaired counters on {len(drifted_ids)} posts'
+        ))
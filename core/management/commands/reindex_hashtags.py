@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from core.hashtags import index_post, roll_up
+from core.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Extract hashtags and mentions from existing posts (no mention notifications are sent)'
+
+    def handle(self, *args, **options):
+        indexed = 0
+        for post in Post.objects.order_by('pk').iterator(chunk_size=1000):
+            # Uses land in the bucket of the post's own hour, so old posts don't trend
+            index_post(post, notify=False, used_at=post.created_at)
+            indexed += 1
+        roll_up()
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed hashtags and mentions on {indexed} posts'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from core.hashtags import roll_up, schedule_roll_up
+
+
+class Command(BaseCommand):
+    help = 'Recompute trending hashtags from the hourly buckets and refresh the cache (normally done by queued roll-up jobs)'
+
+    def handle(self, *args, **options):
+        trending = roll_up()
+        schedule_roll_up()
+        top = ', '.join(f"#{entry['name']}" for entry in trending[:5]) or 'nothing yet'
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {len(trending)} trending hashtags: {top}'))
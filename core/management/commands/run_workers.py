@@ -0,0 +1,89 @@
+import os
+import signal
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core import hashtags, jobs
+
+
+def process_local_backends():
+    """Names of the configured backends that only reach the current process.
+
+    Jobs bump cached counters and push to sockets that belong to the web
+    processes, so workers need a cache and channel layer they share.
+    """
+    local = []
+    if isinstance(caches['default'], LocMemCache):
+        local.append('the cache (set CACHE_REDIS_URL)')
+    try:
+        from channels.layers import InMemoryChannelLayer, get_channel_layer
+    except ImportError:  # Channels not installed: nothing is pushed at all
+        return local
+    if isinstance(get_channel_layer(), InMemoryChannelLayer):
+        local.append('the channel layer (set CHANNEL_REDIS_URL)')
+    return local
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers (core.jobs); SIGTERM or Ctrl-C lets running jobs finish first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Number of worker processes to fork')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once no job is ready instead of polling for more')
+
+    def handle(self, *args, **options):
+        local = process_local_backends()
+        if local:
+            raise CommandError(
+                f'Workers would not reach the web processes through {" or ".join(local)}; '
+                f'use JOBS_INLINE instead when everything runs in one process'
+            )
+        # Recurring jobs re-queue themselves; make sure each chain is running
+        hashtags.schedule_roll_up()
+        burst = options['burst']
+        processes = max(1, options['processes'])
+        stopping = []
+        children = []
+
+        def stop(signum, frame):
+            stopping.append(signum)
+            for pid in children:
+                os.kill(pid, signal.SIGTERM)
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        if processes == 1:
+            done = jobs.work(burst=burst, stop=lambda: bool(stopping))
+            self.stdout.write(self.style.SUCCESS(f'Ran {done} jobs'))
+            return
+
+        # Children must not share the parent's database connections
+        connections.close_all()
+        for _ in range(processes):
+            pid = os.fork()
+            if pid == 0:
+                children.clear()
+                status = 0
+                try:
+                    jobs.work(burst=burst, stop=lambda: bool(stopping))
+                except BaseException:
+                    status = 1
+                finally:
+                    os._exit(status)
+            children.append(pid)
+        self.stdout.write(f'Started {processes} workers: {", ".join(map(str, children))}')
+
+        failed = 0
+        for pid in list(children):
+            _, status = os.waitpid(pid, 0)
+            failed += os.waitstatus_to_exitcode(status) != 0
+        children.clear()
+        if failed:
+            self.stderr.write(f'{failed} workers exited with an error')
+        else:
+            self.stdout.write(self.style.SUCCESS('All workers stopped'))
@@ -0,0 +1,107 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+SEED_ROWS = 10000
+OWNERS = 500
+
+
+def _connect_default(path):
+    # What Django did before SQLITE_PRAGMAS: a fresh connection per request,
+    # rollback journal, synchronous=FULL, deferred transactions
+    return sqlite3.connect(path, isolation_level=None)
+
+
+def _connect_production(path):
+    pragmas = settings.SQLITE_PRAGMAS
+    conn = sqlite3.connect(path, timeout=pragmas['busy_timeout'] / 1000, isolation_level=None)
+    for name, value in pragmas.items():
+        conn.execute(f'PRAGMA {name}={value}')
+    return conn
+
+
+PROFILES = {
+    # name: (connect, BEGIN statement, reuse connections)
+    'default': (_connect_default, 'BEGIN', False),
+    'production': (_connect_production, 'BEGIN IMMEDIATE', True),
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare SQLite read/write throughput under concurrency with and without SQLITE_PRAGMAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent worker threads')
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration of each run')
+        parser.add_argument('--write-ratio', type=float, default=0.2,
+                            help='Fraction of operations that write (like/send-message shaped)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{options['workers']} workers, {options['seconds']}s per profile, "
+                          f"{options['write_ratio']:.0%} writes")
+        self.stdout.write(f"{'profile':<12}{'reads/s':>10}{'writes/s':>10}{'locked':>10}")
+        for name in PROFILES:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'bench.sqlite3')
+                reads, writes, locked = self.run_profile(name, path, **options)
+            seconds = options['seconds']
+            self.stdout.write(f'{name:<12}{reads / seconds:>10.0f}{writes / seconds:>10.0f}{locked:>10}')
+
+    def run_profile(self, name, path, workers, seconds, write_ratio, **options):
+        connect, begin, reuse = PROFILES[name]
+        setup = connect(path)
+        setup.execute('CREATE TABLE bench (id INTEGER PRIMARY KEY, owner INTEGER, body TEXT)')
+        setup.execute('CREATE INDEX bench_owner ON bench (owner)')
+        setup.execute('BEGIN')
+        setup.executemany('INSERT INTO bench (owner, body) VALUES (?, ?)',
+                          ((random.randrange(OWNERS), 'x' * 100) for _ in range(SEED_ROWS)))
+        setup.execute('COMMIT')
+        setup.close()
+
+        totals = {'reads': 0, 'writes': 0, 'locked': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + seconds
+
+        def work():
+            counts = dict.fromkeys(totals, 0)
+            conn = connect(path) if reuse else None
+            while time.monotonic() < deadline:
+                request_conn = conn or connect(path)
+                owner = random.randrange(OWNERS)
+                try:
+                    if random.random() < write_ratio:
+                        # Read-then-write, like toggling a like or sending a message
+                        request_conn.execute(begin)
+                        request_conn.execute('SELECT COUNT(*) FROM bench WHERE owner = ?', (owner,)).fetchone()
+                        request_conn.execute('INSERT INTO bench (owner, body) VALUES (?, ?)', (owner, 'x' * 100))
+                        request_conn.execute('COMMIT')
+                        counts['writes'] += 1
+                    else:
+                        request_conn.execute('SELECT id, body FROM bench WHERE owner = ? ORDER BY id DESC LIMIT 20',
+                                             (owner,)).fetchall()
+                        counts['reads'] += 1
+                except sqlite3.OperationalError:
+                    counts['locked'] += 1
+                    if request_conn.in_transaction:
+                        request_conn.execute('ROLLBACK')
+                finally:
+                    if conn is None:
+                        request_conn.close()
+            if conn is not None:
+                conn.close()
+            with lock:
+                for key, value in counts.items():
+                    totals[key] += value
+
+        threads = [threading.Thread(target=work) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return totals['reads'], totals['writes'], totals['locked']
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from core.stories import sweep
+
+
+class Command(BaseCommand):
+    help = 'Delete expired stories and their media and refresh story rings (normally done by queued sweep jobs)'
+
+    def handle(self, *args, **options):
+        deleted = sweep()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired stories'))
@@ -0,0 +1,63 @@
+import random
+import resource
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.typeahead import PrefixIndex
+
+FIRST_NAMES = ['Aarav', 'Abhimanyu', 'Aditi', 'Ananya', 'Arjun', 'Diya', 'Ishaan', 'Kavya', 'Meera', 'Nikhil',
+               'Priya', 'Rahul', 'Riya', 'Rohan', 'Saanvi', 'Siddharth', 'Sneha', 'Tanvi', 'Vihaan', 'Zoya',
+               'José', 'Chloé', 'Liam', 'Olivia', 'Noah', 'Emma', 'Lucas', 'Mia', 'Ethan', 'Sofia']
+LAST_NAMES = ['Vaishnav', 'Sharma', 'Verma', 'Gupta', 'Iyer', 'Reddy', 'Nair', 'Patel', 'Singh', 'Khan',
+              'Das', 'Bose', 'Mehta', 'Joshi', 'Kapoor', 'García', 'Müller', 'Smith', 'Brown', 'Wilson']
+
+
+def _rows(count):
+    rng = random.Random(0)
+    for user_id in range(1, count + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        suffix = ''.join(rng.choices(string.ascii_lowercase + string.digits, k=4))
+        yield user_id, f'{first.lower()}_{last.lower()}{suffix}', first, last
+
+
+def _percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Build the typeahead prefix index over synthetic users and time lookups against it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000, help='Synthetic users to index')
+        parser.add_argument('--queries', type=int, default=10000, help='Lookups per query kind')
+
+    def handle(self, *args, **options):
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        index = PrefixIndex(_rows(options['users']))
+        build_seconds = time.perf_counter() - started
+        # ru_maxrss is KiB on Linux
+        rss_growth = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024
+        self.stdout.write(f'{len(index)} users indexed in {build_seconds:.1f}s, peak RSS +{rss_growth:.0f} MiB')
+
+        rng = random.Random(1)
+        sample = [row for row in _rows(min(options['users'], 10000))]
+        kinds = {
+            # Keystrokes in the chat picker: 2-4 characters of a name or username
+            'prefix': lambda row: index.search(rng.choice(row[1:])[:rng.randint(2, 4)]),
+            'first last': lambda row: index.search(f'{row[2][:3]} {row[3][:2]}'),
+            'username taken': lambda row: index.username_owner(row[1].upper()),
+            'add/remove': lambda row: (index.add(0, *row[1:]), index.remove(0)),
+        }
+        self.stdout.write(f"{'lookup':<16}{'p50 us':>10}{'p99 us':>10}")
+        for name, run in kinds.items():
+            timings = []
+            for _ in range(options['queries']):
+                row = rng.choice(sample)
+                started = time.perf_counter()
+                run(row)
+                timings.append((time.perf_counter() - started) * 1e6)
+            timings.sort()
+            self.stdout.write(f'{name:<16}{_percentile(timings, 0.5):>10.1f}{_percentile(timings, 0.99):>10.1f}')
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+from core import suggestions
+
+
+class Command(BaseCommand):
+    help = 'Precompute "people you may know" candidates for recently active users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7,
+                            help='Only users who logged in within this many days')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        warmed = 0
+        for user in User.objects.filter(is_active=True, last_login__gte=since).iterator():
+            cache.set(suggestions._cache_key(user.pk), suggestions.compute_candidates(user),
+                      suggestions.SUGGESTIONS_TTL)
+            warmed += 1
+        self.stdout.write(self.style.SUCCESS(f'Precomputed suggestions for {warmed} users'))
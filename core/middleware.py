@@ -0,0 +1,26 @@
+from . import jobs, presence
+
+
+class PresenceMiddleware:
+    """Count every authenticated request as a presence heartbeat (cache only)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            presence.touch(user.id)
+        return self.get_response(request)
+
+
+class InlineJobsMiddleware:
+    """With JOBS_INLINE, run delayed jobs and retries that came due (see core.jobs.run_due)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        jobs.run_due()
+        return response
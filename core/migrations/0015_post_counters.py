@@ -0,0 +1,53 @@
+# Generated by Django 5.2.6 on 2025-10-20 10:14
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Post = apps.get_model('core', 'Post')
+
+    def count_of(model_name, fk='post'):
+        model = apps.get_model('core', model_name)
+        rows = (model.objects.filter(**{fk: OuterRef('pk')})
+                .order_by().values(fk).annotate(n=Count('pk')).values('n'))
+        return Coalesce(Subquery(rows), 0)
+
+    Post.objects.update(
+        likes_count=count_of('Like'),
+        comments_count=count_of('Comment'),
+        repost_count=count_of('Post', fk='repost_parent'),
+        share_count=count_of('Share'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_post_poll_end_date_post_poll_multiple_choice_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='repost_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='share_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
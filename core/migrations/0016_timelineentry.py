@@ -0,0 +1,61 @@
+# Generated by Django 5.2.6 on 2025-10-21 09:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BACKFILL_LIMIT = 100
+
+
+def backfill_timelines(apps, schema_editor):
+    Post = apps.get_model('core', 'Post')
+    Follow = apps.get_model('core', 'Follow')
+    TimelineEntry = apps.get_model('core', 'TimelineEntry')
+
+    recent = {}
+    def recent_posts(author_id):
+        if author_id not in recent:
+            recent[author_id] = list(
+                Post.objects.filter(author_id=author_id)
+                .order_by('-created_at').values_list('id', 'created_at')[:BACKFILL_LIMIT]
+            )
+        return recent[author_id]
+
+    # A set: on SQLite the unique index is only created after this runs, so
+    # ignore_conflicts can't drop the duplicates a self-follow would add
+    pairs = {(author_id, author_id) for author_id in Post.objects.values_list('author_id', flat=True).distinct()}
+    pairs |= set(Follow.objects.values_list('follower_id', 'following_id'))
+    for user_id, author_id in pairs:
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(user_id=user_id, post_id=post_id, author_id=author_id, created_at=created_at)
+            for post_id, created_at in recent_posts(author_id)
+        ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_post_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='core.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Timeline Entry',
+                'verbose_name_plural': 'Timeline Entries',
+                'ordering': ['-created_at', '-post'],
+                'indexes': [models.Index(fields=['user', '-created_at', '-post'], name='timeline_user_recent_idx'), models.Index(fields=['user', 'author'], name='timeline_user_author_idx')],
+                'unique_together': {('user', 'post')},
+            },
+        ),
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.6 on 2025-10-23 11:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_members(apps, schema_editor):
+    Conversation = apps.get_model('core', 'Conversation')
+    ConversationMessage = apps.get_model('core', 'ConversationMessage')
+    ConversationMember = apps.get_model('core', 'ConversationMember')
+
+    Participant = Conversation.participants.through
+    for conversation_id, user_id in Participant.objects.values_list('conversation_id', 'user_id'):
+        messages = ConversationMessage.objects.filter(conversation_id=conversation_id)
+        first_unread = messages.filter(is_read=False).exclude(sender_id=user_id).order_by('id').first()
+        if first_unread:
+            last_read = first_unread.id - 1
+        else:
+            last_read = messages.aggregate(last=models.Max('id'))['last'] or 0
+        unread = messages.filter(id__gt=last_read).exclude(sender_id=user_id).count()
+        ConversationMember.objects.create(
+            conversation_id=conversation_id, user_id=user_id,
+            last_read_message_id=last_read, unread_count=unread,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_timelineentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_message_id', models.PositiveBigIntegerField(default=0)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('joined_at', models.DateTimeField(auto_now_add=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='core.conversation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('conversation', 'user')},
+            },
+        ),
+        migrations.RunPython(backfill_members, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='conversationmessage',
+            name='is_read',
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2025-10-25 09:40
+
+from django.db import migrations
+
+# Expression indexes matching the SQL Django emits for `field__icontains` on
+# PostgreSQL, UPPER("col"::text) LIKE UPPER('%q%'), so search_api and
+# search_users get GIN index scans instead of sequential scans.
+TRIGRAM_INDEXES = [
+    ('core_post_content_trgm', 'core_post', 'content'),
+    ('auth_user_username_trgm', 'auth_user', 'username'),
+    ('auth_user_first_name_trgm', 'auth_user', 'first_name'),
+    ('auth_user_last_name_trgm', 'auth_user', 'last_name'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0017_conversationmember'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,113 @@
+# Generated by Django 5.2.6 on 2025-10-26 16:20
+
+from django.db import migrations
+
+# The DDL as of this migration; core.search may move on, this must not
+FTS_OPTIONS = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+
+SQLITE_TABLES = {
+    'core_post_fts': f"fts5(content, content = 'core_post', content_rowid = 'id', {FTS_OPTIONS})",
+    'core_message_fts': f"fts5(content, content = 'core_conversationmessage', content_rowid = 'id', {FTS_OPTIONS})",
+    'core_user_fts': f"fts5(username, first_name, last_name, bio, {FTS_OPTIONS})",
+}
+
+SQLITE_TRIGGERS = {
+    'core_user_fts_user_insert': (
+        "AFTER INSERT ON auth_user BEGIN INSERT INTO core_user_fts(rowid, username, first_name, last_name, bio) "
+        "VALUES (new.id, new.username, new.first_name, new.last_name, ''); END"
+    ),
+    'core_user_fts_user_update': (
+        "AFTER UPDATE OF username, first_name, last_name ON auth_user WHEN old.username IS NOT new.username "
+        "OR old.first_name IS NOT new.first_name OR old.last_name IS NOT new.last_name BEGIN "
+        "UPDATE core_user_fts SET username = new.username, first_name = new.first_name, "
+        "last_name = new.last_name WHERE rowid = new.id; END"
+    ),
+    'core_user_fts_user_delete': 'AFTER DELETE ON auth_user BEGIN DELETE FROM core_user_fts WHERE rowid = old.id; END',
+    'core_user_fts_profile_insert': (
+        'AFTER INSERT ON core_profile BEGIN UPDATE core_user_fts SET bio = new.bio WHERE rowid = new.user_id; END'
+    ),
+    'core_user_fts_profile_update': (
+        'AFTER UPDATE OF bio ON core_profile WHEN old.bio IS NOT new.bio BEGIN '
+        'UPDATE core_user_fts SET bio = new.bio WHERE rowid = new.user_id; END'
+    ),
+    'core_user_fts_profile_delete': (
+        "AFTER DELETE ON core_profile BEGIN UPDATE core_user_fts SET bio = '' WHERE rowid = old.user_id; END"
+    ),
+    'core_post_fts_insert': (
+        'AFTER INSERT ON core_post BEGIN INSERT INTO core_post_fts(rowid, content) VALUES (new.id, new.content); END'
+    ),
+    'core_post_fts_delete': (
+        "AFTER DELETE ON core_post BEGIN INSERT INTO core_post_fts(core_post_fts, rowid, content) "
+        "VALUES ('delete', old.id, old.content); END"
+    ),
+    'core_post_fts_update': (
+        "AFTER UPDATE OF content ON core_post WHEN old.content IS NOT new.content BEGIN "
+        "INSERT INTO core_post_fts(core_post_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+        "INSERT INTO core_post_fts(rowid, content) VALUES (new.id, new.content); END"
+    ),
+    'core_message_fts_insert': (
+        'AFTER INSERT ON core_conversationmessage BEGIN '
+        'INSERT INTO core_message_fts(rowid, content) VALUES (new.id, new.content); END'
+    ),
+    'core_message_fts_delete': (
+        "AFTER DELETE ON core_conversationmessage BEGIN INSERT INTO core_message_fts(core_message_fts, rowid, content) "
+        "VALUES ('delete', old.id, old.content); END"
+    ),
+    'core_message_fts_update': (
+        "AFTER UPDATE OF content ON core_conversationmessage WHEN old.content IS NOT new.content BEGIN "
+        "INSERT INTO core_message_fts(core_message_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+        "INSERT INTO core_message_fts(rowid, content) VALUES (new.id, new.content); END"
+    ),
+}
+
+SQLITE_POPULATE = [
+    "INSERT INTO core_post_fts(core_post_fts) VALUES ('rebuild')",
+    "INSERT INTO core_message_fts(core_message_fts) VALUES ('rebuild')",
+    "INSERT INTO core_user_fts(rowid, username, first_name, last_name, bio) "
+    "SELECT u.id, u.username, u.first_name, u.last_name, COALESCE(p.bio, '') "
+    "FROM auth_user u LEFT JOIN core_profile p ON p.user_id = u.id",
+]
+
+POSTGRES_INDEXES = {
+    'core_post_content_fts': "core_post USING gin (to_tsvector('simple', COALESCE(content, '')))",
+    'core_message_content_fts': "core_conversationmessage USING gin (to_tsvector('simple', COALESCE(content, '')))",
+}
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for name, definition in POSTGRES_INDEXES.items():
+            schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {definition}')
+    elif vendor == 'sqlite':
+        for name, definition in SQLITE_TABLES.items():
+            schema_editor.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING {definition}')
+        for name, body in SQLITE_TRIGGERS.items():
+            schema_editor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}')
+        schema_editor.execute('DELETE FROM core_user_fts')
+        for sql in SQLITE_POPULATE:
+            schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for name in POSTGRES_INDEXES:
+            schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+    elif vendor == 'sqlite':
+        for name in SQLITE_TRIGGERS:
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        for name in SQLITE_TABLES:
+            schema_editor.execute(f'DROP TABLE IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0019_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
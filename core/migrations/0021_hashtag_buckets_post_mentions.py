@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2025-10-27 09:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='mentions',
+            field=models.ManyToManyField(blank=True, related_name='mentioned_in', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='HashtagBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('hashtag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buckets', to='core.hashtag')),
+            ],
+            options={
+                'verbose_name': 'Hashtag Bucket',
+                'verbose_name_plural': 'Hashtag Buckets',
+                'indexes': [models.Index(fields=['bucket_start'], name='hashtagbucket_start_idx')],
+                'unique_together': {('hashtag', 'bucket_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.6 on 2025-10-29 11:20
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_chunked_uploads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Media Blob',
+                'verbose_name_plural': 'Media Blobs',
+            },
+        ),
+        # Only the field's storage changes; the column is untouched, so skip the
+        # table rebuild SQLite would otherwise do for every AlterField.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='chat',
+                    name='group_photo',
+                    field=models.ImageField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to='group_photos/'),
+                ),
+                migrations.AlterField(
+                    model_name='chatmessage',
+                    name='image',
+                    field=models.ImageField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to='chat_images/'),
+                ),
+                migrations.AlterField(
+                    model_name='comment',
+                    name='image',
+                    field=models.ImageField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to='comments/'),
+                ),
+                migrations.AlterField(
+                    model_name='conversation',
+                    name='group_photo',
+                    field=models.ImageField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to='conversations/'),
+                ),
+                migrations.AlterField(
+                    model_name='conversationmessage',
+                    name='image',
+                    field=models.ImageField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to='conversation_messages/'),
+                ),
+                migrations.AlterField(
+                    model_name='message',
+                    name='image',
+                    field=models.ImageField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to='messages/'),
+                ),
+                migrations.AlterField(
+                    model_name='post',
+                    name='image',
+                    field=models.ImageField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to='posts/'),
+                ),
+                migrations.AlterField(
+                    model_name='post',
+                    name='video',
+                    field=models.FileField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to='posts/videos/'),
+                ),
+                migrations.AlterField(
+                    model_name='profile',
+                    name='cover_pic',
+                    field=models.ImageField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to='cover_pics/'),
+                ),
+                migrations.AlterField(
+                    model_name='profile',
+                    name='profile_pic',
+                    field=models.ImageField(blank=True, default='profile_pics/default-avatar.jpg', null=True, storage=core.storage.ContentAddressedStorage(), upload_to='profile_pics/'),
+                ),
+                migrations.AlterField(
+                    model_name='story',
+                    name='image',
+                    field=models.ImageField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to='stories/'),
+                ),
+                migrations.AlterField(
+                    model_name='story',
+                    name='video',
+                    field=models.FileField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to='stories/videos/'),
+                ),
+            ],
+        ),
+    ]
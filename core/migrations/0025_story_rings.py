@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2025-10-31 14:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+
+def backfill_story_rings(apps, schema_editor):
+    Story = apps.get_model('core', 'Story')
+    StoryRing = apps.get_model('core', 'StoryRing')
+    StoryRing.objects.bulk_create([
+        StoryRing(**row) for row in
+        Story.objects.filter(expires_at__gt=timezone.now()).order_by().values('user_id').annotate(
+            story_count=Count('id'),
+            latest_story_id=Max('id'),
+            latest_at=Max('created_at'),
+            next_expiry=Min('expires_at'),
+            last_expiry=Max('expires_at'),
+        )
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0024_background_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoryRing',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='story_ring', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('story_count', models.PositiveIntegerField(default=0)),
+                ('latest_story_id', models.BigIntegerField()),
+                ('latest_at', models.DateTimeField()),
+                ('next_expiry', models.DateTimeField()),
+                ('last_expiry', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Story Ring',
+                'verbose_name_plural': 'Story Rings',
+                'indexes': [models.Index(fields=['next_expiry'], name='story_ring_next_expiry_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_story_rings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2025-11-01 10:30
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def delete_self_follows(apps, schema_editor):
+    # The follow view never allowed these; drop any that older code or the admin created
+    Follow = apps.get_model('core', 'Follow')
+    Follow.objects.filter(follower=F('following')).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_story_rings'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_self_follows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.CheckConstraint(condition=models.Q(('follower', models.F('following')), _negated=True), name='follow_not_self'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.6 on 2025-11-02 11:05
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    # Tables for the DatabaseCache entries in settings.CACHES; a no-op for other backends
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_follow_not_self'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2025-11-02 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediablob',
+            name='touched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
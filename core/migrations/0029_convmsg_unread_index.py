@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2025-11-03 09:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_media_blob_touched_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='conversationmessage',
+            index=models.Index(fields=['conversation', 'id', 'sender'], name='convmsg_conv_unread_idx'),
+        ),
+    ]
@@ -1,10 +1,14 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_init, post_migrate, post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
 from django.urls import reverse
+
+from .storage import media_storage
 import os
 from datetime import timedelta
 
@@ -21,11 +25,12 @@ class Profile(models.Model):
     user = models.OneToOneField(AuthUser, on_delete=models.CASCADE, related_name='profile')
     profile_pic = models.ImageField(
         upload_to='profile_pics/', 
+        storage=media_storage,
         blank=True, 
         null=True,
         default='profile_pics/default-avatar.jpg'
     )
-    cover_pic = models.ImageField(upload_to='cover_pics/', blank=True, null=True)
+    cover_pic = models.ImageField(upload_to='cover_pics/', storage=media_storage, blank=True, null=True)
     bio = models.TextField(blank=True, max_length=500, default='')
     location = models.CharField(max_length=100, blank=True, default='')
     language_preference = models.CharField(max_length=50, blank=True, default='en')
@@ -87,8 +92,8 @@ class Post(models.Model):
     author = models.ForeignKey(AuthUser, on_delete=models.CASCADE, related_name='posts')
     content = models.TextField(max_length=5000)
     post_type = models.CharField(max_length=10, choices=POST_TYPES, default='text')
-    image = models.ImageField(upload_to='posts/', blank=True, null=True)
-    video = models.FileField(upload_to='posts/videos/', blank=True, null=True)
+    image = models.ImageField(upload_to='posts/', storage=media_storage, blank=True, null=True)
+    video = models.FileField(upload_to='posts/videos/', storage=media_storage, blank=True, null=True)
     location = models.CharField(max_length=255, blank=True, default='')
     is_public = models.BooleanField(default=True)
     created_at = models.DateTimeField(default=timezone.now)
@@ -99,45 +104,57 @@ class Post(models.Model):
                                     null=True, blank=True, related_name='reposts')
     is_quote = models.BooleanField(default=False)
     quote_text = models.TextField(max_length=1000, blank=True, default='')
+    # Users @mentioned in content, kept in sync by core.hashtags
+    mentions = models.ManyToManyField(AuthUser, related_name='mentioned_in', blank=True)
     
     # Poll fields
     poll_options = models.JSONField(null=True, blank=True)
     poll_multiple_choice = models.BooleanField(default=False)
     poll_end_date = models.DateTimeField(null=True, blank=True)
 
+    # Denormalized engagement counters. These are only ever changed through
+    # Post.adjust_counter() (see the signal handlers at the bottom of this
+    # module) and repaired in bulk by the recount_post_counters command.
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+    repost_count = models.PositiveIntegerField(default=0)
+    share_count = models.PositiveIntegerField(default=0)
 
-    @property
-    def repost_count(self):
-        return self.reposts.count()
-
+    COUNTER_FIELDS = ('likes_count', 'comments_count', 'repost_count', 'share_count')
 
     def __str__(self):
         return f"{self.author.username}: {self.content[:30]}"
 
-    @property
-    def likes_count(self):
-        return self.likes.count()
-
-    @property
-    def comments_count(self):
-        return self.comments.count()
-
-    @property
-    def share_count(self):
-        return self.shares.count()
-
     def get_absolute_url(self):
         return reverse('post_detail', kwargs={'pk': self.pk})
 
+    @classmethod
+    def adjust_counter(cls, post_id, field, delta):
+        """Atomically add `delta` to one of the counter columns of a post."""
+        if field not in cls.COUNTER_FIELDS:
+            raise ValueError(f"Unknown counter field: {field}")
+        cls.objects.filter(pk=post_id).update(**{field: Greatest(F(field) + delta, 0)})
+
     def save(self, *args, **kwargs):
         if not self.content and self.image:
             self.content = "Check out this image!"
+        # Never write back counters loaded earlier in the request; they may
+        # have been bumped concurrently since this instance was fetched.
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.COUNTER_FIELDS
+            ]
         super().save(*args, **kwargs)
 
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Post'
         verbose_name_plural = 'Posts'
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='post_recent_idx'),
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_recent_idx'),
+        ]
 
 
 class Like(models.Model):
@@ -152,13 +169,16 @@ class Like(models.Model):
         unique_together = ['user', 'post']
         verbose_name = 'Like'
         verbose_name_plural = 'Likes'
+        indexes = [
+            models.Index(fields=['post', '-created_at'], name='like_post_recent_idx'),
+        ]
 
 
 class Comment(models.Model):
     user = models.ForeignKey(AuthUser, on_delete=models.CASCADE, related_name='comments')
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     content = models.TextField(max_length=1000)
-    image = models.ImageField(upload_to='comments/', blank=True, null=True)
+    image = models.ImageField(upload_to='comments/', storage=media_storage, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
@@ -178,6 +198,9 @@ class Comment(models.Model):
         ordering = ['created_at']
         verbose_name = 'Comment'
         verbose_name_plural = 'Comments'
+        indexes = [
+            models.Index(fields=['post', 'created_at'], name='comment_post_created_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -190,6 +213,14 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ['follower', 'following']
+        constraints = [
+            # A self-follow would duplicate the author's own timeline entries
+            models.CheckConstraint(condition=~models.Q(follower=models.F('following')), name='follow_not_self'),
+        ]
+        indexes = [
+            # Reverse of the unique index: "who follows X" without touching the table
+            models.Index(fields=['following', 'follower'], name='follow_following_idx'),
+        ]
         verbose_name = 'Follow'
         verbose_name_plural = 'Follows'
 
@@ -223,13 +254,17 @@ class Notification(models.Model):
         ordering = ['-timestamp']
         verbose_name = 'Notification'
         verbose_name_plural = 'Notifications'
+        indexes = [
+            models.Index(fields=['recipient', 'is_read', '-timestamp'], name='notif_recipient_unread_idx'),
+            models.Index(fields=['recipient', 'notification_type', 'target_post'], name='notif_recipient_group_idx'),
+        ]
 
 
 class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
     content = models.TextField()
-    image = models.ImageField(upload_to='messages/', blank=True, null=True)
+    image = models.ImageField(upload_to='messages/', storage=media_storage, blank=True, null=True)
     is_read = models.BooleanField(default=False)
     timestamp = models.DateTimeField(auto_now_add=True)
 
@@ -248,7 +283,7 @@ class Chat(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_group_chat = models.BooleanField(default=False)
     group_name = models.CharField(max_length=255, blank=True, default='')
-    group_photo = models.ImageField(upload_to='group_photos/', blank=True, null=True)
+    group_photo = models.ImageField(upload_to='group_photos/', storage=media_storage, blank=True, null=True)
 
     def __str__(self):
         if self.is_group_chat:
@@ -267,7 +302,7 @@ class ChatMessage(models.Model):
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
-    image = models.ImageField(upload_to='chat_images/', blank=True, null=True)
+    image = models.ImageField(upload_to='chat_images/', storage=media_storage, blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
@@ -290,8 +325,8 @@ class Story(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stories')
     story_type = models.CharField(max_length=10, choices=STORY_TYPES, default='text')
     text_content = models.TextField(blank=True, default='')
-    image = models.ImageField(upload_to='stories/', blank=True, null=True)
-    video = models.FileField(upload_to='stories/videos/', blank=True, null=True)
+    image = models.ImageField(upload_to='stories/', storage=media_storage, blank=True, null=True)
+    video = models.FileField(upload_to='stories/videos/', storage=media_storage, blank=True, null=True)
     background_color = models.CharField(max_length=7, default='#ff6b35')
     caption = models.CharField(max_length=255, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -316,6 +351,10 @@ class Story(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Story'
         verbose_name_plural = 'Stories'
+        indexes = [
+            models.Index(fields=['user', 'expires_at'], name='story_user_expires_idx'),
+            models.Index(fields=['expires_at'], name='story_expires_idx'),
+        ]
 
 
 class StoryView(models.Model):
@@ -332,6 +371,27 @@ class StoryView(models.Model):
         verbose_name_plural = 'Story Views'
 
 
+class StoryRing(models.Model):
+    """Summary of one user's active stories for the stories tray (see core.stories)."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='story_ring')
+    story_count = models.PositiveIntegerField(default=0)
+    latest_story_id = models.BigIntegerField()
+    latest_at = models.DateTimeField()
+    # The counts go stale when the earliest story expires and the whole ring with the last one
+    next_expiry = models.DateTimeField()
+    last_expiry = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.story_count} stories by {self.user_id}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_expiry'], name='story_ring_next_expiry_idx'),
+        ]
+        verbose_name = 'Story Ring'
+        verbose_name_plural = 'Story Rings'
+
+
 class SavedPost(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='saved_posts')
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
@@ -436,6 +496,24 @@ class Hashtag(models.Model):
         verbose_name_plural = 'Hashtags'
 
 
+class HashtagBucket(models.Model):
+    """Uses of a hashtag within one hour, rolled up into trending scores by core.hashtags."""
+    hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE, related_name='buckets')
+    bucket_start = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"#{self.hashtag_id} x{self.count} at {self.bucket_start:%Y-%m-%d %H:00}"
+
+    class Meta:
+        unique_together = ['hashtag', 'bucket_start']
+        indexes = [
+            models.Index(fields=['bucket_start'], name='hashtagbucket_start_idx'),
+        ]
+        verbose_name = 'Hashtag Bucket'
+        verbose_name_plural = 'Hashtag Buckets'
+
+
 class Share(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='shares')
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='shares')
@@ -463,6 +541,9 @@ class PollVote(models.Model):
         unique_together = ['user', 'post', 'option_index']
         verbose_name = 'Poll Vote'
         verbose_name_plural = 'Poll Votes'
+        indexes = [
+            models.Index(fields=['post', 'option_index'], name='pollvote_post_option_idx'),
+        ]
 
 
 class Conversation(models.Model):
@@ -471,7 +552,7 @@ class Conversation(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_group = models.BooleanField(default=False)
     group_name = models.CharField(max_length=100, blank=True, default='')
-    group_photo = models.ImageField(upload_to='conversations/', blank=True, null=True)
+    group_photo = models.ImageField(upload_to='conversations/', storage=media_storage, blank=True, null=True)
     
     def __str__(self):
         if self.is_group:
@@ -497,9 +578,8 @@ class ConversationMessage(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
-    image = models.ImageField(upload_to='conversation_messages/', blank=True, null=True)
+    image = models.ImageField(upload_to='conversation_messages/', storage=media_storage, blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
     edited_at = models.DateTimeField(null=True, blank=True)
     reply_to = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
     
@@ -514,6 +594,162 @@ class ConversationMessage(models.Model):
         ordering = ['timestamp']
         verbose_name = 'Conversation Message'
         verbose_name_plural = 'Conversation Messages'
+        indexes = [
+            models.Index(fields=['conversation', 'timestamp'], name='convmsg_conv_time_idx'),
+            # Covers ConversationMember._unread_after: a range over the messages
+            # past a watermark, with the sender checked in the index
+            models.Index(fields=['conversation', 'id', 'sender'], name='convmsg_conv_unread_idx'),
+        ]
+
+
+class ConversationMember(models.Model):
+    """One participant's read state in a conversation.
+
+    Everything up to and including `last_read_message_id` has been read;
+    `unread_count` counts other people's messages after it. Rows follow
+    Conversation.participants and new messages via the signals below.
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='members')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_memberships')
+    last_read_message_id = models.PositiveBigIntegerField(default=0)
+    unread_count = models.PositiveIntegerField(default=0)
+    joined_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('conversation', 'user')
+
+    def __str__(self):
+        return f"{self.user.username} in {self.conversation}"
+
+    @staticmethod
+    def _unread_after(conversation_id, user_id, message_id):
+        """Expression counting other people's messages after `message_id`."""
+        from django.db.models import Count, Subquery, Value
+        from django.db.models.functions import Coalesce
+        newer = ConversationMessage.objects.filter(
+            conversation_id=conversation_id, id__gt=message_id
+        ).exclude(sender_id=user_id).values('conversation').annotate(n=Count('pk')).values('n')
+        return Coalesce(Subquery(newer), Value(0))
+
+    @classmethod
+    def mark_read(cls, conversation_id, user_id, message_id):
+        """Move the reader's watermark forward to `message_id`; a single-row UPDATE."""
+        return cls.objects.filter(
+            conversation_id=conversation_id, user_id=user_id, last_read_message_id__lt=message_id
+        ).update(
+            last_read_message_id=message_id,
+            unread_count=cls._unread_after(conversation_id, user_id, message_id),
+        )
+
+    @classmethod
+    def mark_unread_from(cls, message, user_id):
+        """Move the watermark back so `message` and everything after it is unread."""
+        return cls.objects.filter(conversation_id=message.conversation_id, user_id=user_id).update(
+            last_read_message_id=message.id - 1,
+            unread_count=cls._unread_after(message.conversation_id, user_id, message.id - 1),
+        )
+
+
+class TimelineEntry(models.Model):
+    """A post delivered to one user's precomputed home timeline (see core.timeline)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    # Copy of post.created_at so a feed page is a single range scan on the index below
+    created_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Post {self.post_id} in {self.user_id}'s timeline"
+
+    class Meta:
+        ordering = ['-created_at', '-post']
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='timeline_user_recent_idx'),
+            models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ]
+        verbose_name = 'Timeline Entry'
+        verbose_name_plural = 'Timeline Entries'
+
+
+class Upload(models.Model):
+    """A chunked upload in progress, or finished and waiting to be attached (see core.uploads)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploads')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size} bytes)"
+
+    @property
+    def is_complete(self):
+        return self.completed_at is not None
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='upload_updated_idx'),
+        ]
+        verbose_name = 'Upload'
+        verbose_name_plural = 'Uploads'
+
+
+class Job(models.Model):
+    """A unit of background work, run by `manage.py run_workers` (see core.jobs)."""
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    task = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # Higher runs first
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    # Enqueueing a key that is already in the table is a no-op
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.task} [{self.status}]"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_at', 'id'], name='job_ready_idx'),
+            models.Index(fields=['status', 'locked_at'], name='job_lease_idx'),
+        ]
+        verbose_name = 'Job'
+        verbose_name_plural = 'Jobs'
+
+
+class MediaBlob(models.Model):
+    """A content-addressed media file and how many file fields point at it (see core.storage)."""
+    name = models.CharField(max_length=100, unique=True)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last time storage handed the file out again for identical bytes
+    touched_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} x{self.refcount}"
+
+    class Meta:
+        verbose_name = 'Media Blob'
+        verbose_name_plural = 'Media Blobs'
 
 
 # Signal to create profile when user is created
@@ -525,4 +761,269 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=AuthUser)
 def save_user_profile(sender, instance, **kwargs):
     if hasattr(instance, 'profile'):
-        instance.profile.save()
\ No newline at end of file
+        instance.profile.save()
+
+
+# Signals keeping the in-memory typeahead index (core.typeahead) in sync
+@receiver(post_save, sender=AuthUser)
+def user_names_saved(sender, instance, update_fields=None, **kwargs):
+    # Logins save only last_login; skip saves that can't change a name
+    if update_fields is None or set(update_fields) & {'username', 'first_name', 'last_name'}:
+        from . import typeahead
+        typeahead.user_saved(instance)
+
+@receiver(post_delete, sender=AuthUser)
+def user_names_deleted(sender, instance, **kwargs):
+    from . import typeahead
+    typeahead.user_deleted(instance.pk)
+
+
+# Signals keeping the denormalized Post counters in sync
+def _deleted_with_post(origin):
+    """True when a cascade started from deleting posts, so the parent row is going away."""
+    if isinstance(origin, Post):
+        return True
+    return isinstance(origin, models.QuerySet) and origin.model is Post
+
+
+@receiver(post_save, sender=Like)
+def like_created(sender, instance, created, **kwargs):
+    if created:
+        from . import realtime
+        Post.adjust_counter(instance.post_id, 'likes_count', 1)
+        realtime.post_engaged(instance.post_id, instance.user_id, 'post.liked')
+
+@receiver(post_delete, sender=Like)
+def like_deleted(sender, instance, origin=None, **kwargs):
+    if not _deleted_with_post(origin):
+        Post.adjust_counter(instance.post_id, 'likes_count', -1)
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        from . import realtime
+        Post.adjust_counter(instance.post_id, 'comments_count', 1)
+        realtime.post_engaged(instance.post_id, instance.user_id, 'post.commented')
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, origin=None, **kwargs):
+    if not _deleted_with_post(origin):
+        Post.adjust_counter(instance.post_id, 'comments_count', -1)
+
+@receiver(post_save, sender=Share)
+def share_created(sender, instance, created, **kwargs):
+    if created:
+        Post.adjust_counter(instance.post_id, 'share_count', 1)
+
+@receiver(post_delete, sender=Share)
+def share_deleted(sender, instance, origin=None, **kwargs):
+    if not _deleted_with_post(origin):
+        Post.adjust_counter(instance.post_id, 'share_count', -1)
+
+@receiver(post_save, sender=Post)
+def repost_created(sender, instance, created, **kwargs):
+    if created and instance.repost_parent_id:
+        Post.adjust_counter(instance.repost_parent_id, 'repost_count', 1)
+
+@receiver(post_delete, sender=Post)
+def repost_deleted(sender, instance, origin=None, **kwargs):
+    if not instance.repost_parent_id:
+        return
+    if isinstance(origin, Post) and origin.pk == instance.repost_parent_id:
+        return
+    Post.adjust_counter(instance.repost_parent_id, 'repost_count', -1)
+
+
+# Signals keeping hashtag and mention links in sync with post content
+@receiver(post_save, sender=Post)
+def index_post_tags(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'content', 'quote_text'} & set(update_fields):
+        from .hashtags import index_post
+        index_post(instance)
+
+@receiver(pre_delete, sender=Post)
+def release_post_tags(sender, instance, **kwargs):
+    from .hashtags import forget_post
+    forget_post(instance)
+
+
+# Signals queueing resized derivatives of newly uploaded images
+@receiver(pre_save, sender=Profile)
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Comment)
+@receiver(pre_save, sender=Story)
+@receiver(pre_save, sender=ConversationMessage)
+def note_image_uploads(sender, instance, raw=False, **kwargs):
+    if not raw:
+        from . import images
+        images.mark_uploads(instance)
+
+@receiver(post_save, sender=Profile)
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Story)
+@receiver(post_save, sender=ConversationMessage)
+def render_image_derivatives(sender, instance, raw=False, **kwargs):
+    if not raw:
+        from . import images
+        images.schedule(instance)
+
+
+# Signals keeping content-addressed media reference counts (core.storage).
+# post_init remembers which files a row pointed at when it was loaded, so a
+# save only touches the counts of files that actually changed.
+MEDIA_MODELS = (Profile, Post, Comment, Message, Chat, ChatMessage, Story, Conversation, ConversationMessage)
+
+def remember_media(sender, instance, **kwargs):
+    from .storage import media_names
+    instance._media_names = media_names(instance)
+
+def count_media_references(sender, instance, created, update_fields=None, **kwargs):
+    from .storage import media_names, release, retain
+    before = {} if created else getattr(instance, '_media_names', {})
+    after = media_names(instance)
+    added, removed = [], []
+    for field, name in after.items():
+        if update_fields is not None and field not in update_fields:
+            continue
+        if not created and field not in before:
+            continue  # deferred when loaded; gc_media recounts these
+        if name != before.get(field):
+            added.append(name)
+            removed.append(before.get(field))
+    retain(added)
+    release(removed)
+    instance._media_names = after
+
+def release_media_references(sender, instance, **kwargs):
+    from .storage import media_names, release
+    release(media_names(instance).values())
+
+for _model in MEDIA_MODELS:
+    post_init.connect(remember_media, sender=_model)
+    post_save.connect(count_media_references, sender=_model)
+    post_delete.connect(release_media_references, sender=_model)
+
+
+# Remove what a cancelled, claimed or abandoned upload left on disk
+@receiver(post_delete, sender=Upload)
+def upload_deleted(sender, instance, **kwargs):
+    from .uploads import remove_part
+    remove_part(instance)
+
+
+# Signals keeping the precomputed home timelines in sync
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    if created:
+        from .timeline import fan_out_post
+        fan_out_post(instance)
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        from .timeline import backfill_author, followers_changed
+        from . import suggestions
+        backfill_author(instance.follower_id, instance.following_id)
+        followers_changed(instance.following_id, 1)
+        suggestions.invalidate(instance.follower_id)
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    from .timeline import followers_changed, remove_author
+    from . import suggestions
+    remove_author(instance.follower_id, instance.following_id)
+    followers_changed(instance.following_id, -1)
+    suggestions.invalidate(instance.follower_id)
+
+
+# Signals keeping the active story rings in sync (core.stories)
+@receiver(post_save, sender=Story)
+def story_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        from .stories import story_added
+        story_added(instance)
+
+@receiver(post_delete, sender=Story)
+def story_deleted(sender, instance, origin=None, **kwargs):
+    # Bulk deletes (the sweeper) refresh once per batch; a deleted user's ring goes with them
+    if isinstance(origin, (models.QuerySet, User)):
+        return
+    from .stories import refresh
+    refresh([instance.user_id])
+
+
+# Signals keeping ConversationMember read state in sync
+def _add_members(pairs):
+    """Create members for (conversation_id, user_id) pairs; they start with nothing unread."""
+    if not pairs:
+        return
+    latest = dict(
+        ConversationMessage.objects.filter(conversation_id__in={c for c, _ in pairs})
+        .values('conversation_id').annotate(last=models.Max('id')).values_list('conversation_id', 'last')
+    )
+    ConversationMember.objects.bulk_create([
+        ConversationMember(conversation_id=c, user_id=u, last_read_message_id=latest.get(c) or 0)
+        for c, u in pairs
+    ], ignore_conflicts=True)
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Forward: instance is a Conversation and pk_set holds user ids; reverse is the opposite
+    if action == 'post_add':
+        pairs = [(pk, instance.pk) if reverse else (instance.pk, pk) for pk in pk_set]
+        _add_members(pairs)
+    elif action == 'post_remove':
+        key = 'user_id' if reverse else 'conversation_id'
+        other = 'conversation_id__in' if reverse else 'user_id__in'
+        ConversationMember.objects.filter(**{key: instance.pk, other: pk_set}).delete()
+    elif action == 'post_clear':
+        key = 'user_id' if reverse else 'conversation_id'
+        ConversationMember.objects.filter(**{key: instance.pk}).delete()
+
+@receiver(post_save, sender=ConversationMessage)
+def conversation_message_created(sender, instance, created, **kwargs):
+    if not created:
+        return
+    members = ConversationMember.objects.filter(conversation_id=instance.conversation_id)
+    members.exclude(user_id=instance.sender_id).update(unread_count=F('unread_count') + 1)
+    # Replying means the sender has caught up with the conversation
+    members.filter(user_id=instance.sender_id).update(last_read_message_id=instance.id, unread_count=0)
+    from . import realtime
+    realtime.message_created(instance)
+
+@receiver(post_delete, sender=ConversationMessage)
+def conversation_message_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Conversation):
+        return
+    ConversationMember.objects.filter(
+        conversation_id=instance.conversation_id, last_read_message_id__lt=instance.id
+    ).exclude(user_id=instance.sender_id).update(unread_count=Greatest(F('unread_count') - 1, 0))
+
+
+# Unread counter and real-time push for notifications created one at a time
+# (the batched pipeline in core.notifications does both itself)
+@receiver(post_save, sender=Notification)
+def notification_created(sender, instance, created, **kwargs):
+    if created:
+        from . import notifications, realtime
+        if not instance.is_read:
+            notifications.incr_unread(instance.recipient_id)
+        realtime.notification_created(instance)
+
+
+@receiver(post_delete, sender=Notification)
+def notification_deleted(sender, instance, **kwargs):
+    if not instance.is_read:
+        from . import notifications
+        notifications.invalidate_unread([instance.recipient_id])
+
+
+# SQLite drops a table's triggers when a migration rebuilds the table; put
+# the full-text search triggers back (and reindex) if that happened
+@receiver(post_migrate)
+def reinstall_search_index(sender, using, **kwargs):
+    if sender.name == 'core':
+        from django.db import connections
+        from . import search
+        search.repair(connections[using])
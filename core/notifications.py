@@ -0,0 +1,337 @@
+"""
+Batched notification pipeline.
+
+Views describe what happened with notify()/retract()/broadcast() and
+return immediately. Each event is queued as a background job (see
+core.jobs) that workers claim in batches:
+
+* a burst of events for the same (recipient, sender, type, post) collapses
+  to its final state, so like/unlike/like writes one row, not three;
+* new rows are written with bulk_create, removals with one DELETE;
+* recipients get one real-time push per (type, post) per batch, worded
+  like "alice and 12 others liked your post";
+* broadcast() is a separate low-priority job that walks its audience in
+  chunks of BATCH_SIZE, so "send to all" never holds a request open.
+
+Each user's unread count is kept in the shared cache (unread_count();
+see CACHES in settings), bumped as rows are written and reset by
+mark-all-read, so the badge endpoint only touches the database after a
+cache miss.
+"""
+from collections import OrderedDict, defaultdict
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import BigIntegerField, Case, Count, F, Max, Q, Value, When, Window
+from django.db.models.functions import RowNumber
+
+from . import jobs
+from .models import Follow, Like, Message, Notification, Post
+from .pagination import DEFAULT_PAGE_SIZE, encode_cursor, keyset_filter
+
+BATCH_SIZE = getattr(settings, 'NOTIFICATION_BATCH_SIZE', 500)
+
+# Short enough that a counter left off by a lost or racing update (incr is
+# not atomic on every cache backend) is soon recounted from the database
+UNREAD_CACHE_TIMEOUT = 10 * 60
+ACTORS_PER_GROUP = 3
+
+def notify(recipient_id, sender_id, notification_type, verb, target_post_id=None, target_comment_id=None):
+    """Queue a notification; self-notifications are dropped."""
+    if recipient_id == sender_id:
+        return
+    jobs.enqueue(deliver, op='add', target=[recipient_id, sender_id, notification_type, target_post_id], data={
+        'verb': verb, 'target_comment_id': target_comment_id,
+    })
+
+
+def retract(recipient_id, sender_id, notification_type, target_post_id=None):
+    """Queue removal of a notification, e.g. after an unlike or unfollow."""
+    jobs.enqueue(deliver, op='remove', target=[recipient_id, sender_id, notification_type, target_post_id], data=None)
+
+
+def broadcast(sender_id, verb, user_ids=None, notification_type='mention', as_message=False):
+    """Queue a notification (or legacy Message) to `user_ids`, or every active user when None."""
+    jobs.enqueue(send_broadcast, sender_id=sender_id, data={
+        'verb': verb, 'user_ids': None if user_ids is None else list(user_ids),
+        'notification_type': notification_type, 'as_message': as_message,
+    })
+
+
+def summarize(actor_names, verb, total=None):
+    """'alice liked your post', 'alice and bob ...', 'alice and 12 others ...'."""
+    total = len(actor_names) if total is None else total
+    if total <= 1:
+        return f'{actor_names[0]} {verb}'
+    if total == 2 and len(actor_names) >= 2:
+        return f'{actor_names[0]} and {actor_names[1]} {verb}'
+    others = total - 1
+    return f"{actor_names[0]} and {others} other{'s' if others != 1 else ''} {verb}"
+
+
+def _unread_key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def unread_count(user_id):
+    """Cached number of unread notifications for `user_id`."""
+    count = cache.get(_unread_key(user_id))
+    if count is None:
+        count = Notification.objects.filter(recipient_id=user_id, is_read=False).count()
+        cache.add(_unread_key(user_id), count, UNREAD_CACHE_TIMEOUT)
+    return max(count, 0)
+
+
+def incr_unread(user_id, delta=1):
+    """Adjust a cached counter; returns the new value, or None if it wasn't cached."""
+    try:
+        return cache.incr(_unread_key(user_id), delta)
+    except ValueError:
+        # Not cached: the next unread_count() recounts from the database
+        return None
+
+
+def reset_unread(user_id):
+    cache.set(_unread_key(user_id), 0, UNREAD_CACHE_TIMEOUT)
+
+
+def invalidate_unread(user_ids):
+    cache.delete_many([_unread_key(user_id) for user_id in user_ids])
+
+
+def _group_key():
+    # Admin mentions stand alone; everything else groups by (type, post)
+    return Case(When(notification_type='mention', then=F('id')), default=Value(0),
+                output_field=BigIntegerField())
+
+
+def _group_filter(group):
+    if group['group']:
+        return Q(id=group['group'])
+    return Q(notification_type=group['notification_type'], target_post_id=group['target_post_id'])
+
+
+def grouped(user, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """One page of `user`'s notifications grouped by (type, post), newest group first.
+
+    Returns ``(groups, next_cursor)``. Each group is a dict with the latest
+    notification's id and verb, its timestamp, the total and unread counts,
+    and up to ACTORS_PER_GROUP most recent actors (User objects with
+    profiles). Costs two queries whatever the group sizes.
+    """
+    groups = (
+        Notification.objects.filter(recipient=user)
+        .annotate(group=_group_key())
+        .values('notification_type', 'target_post_id', 'group')
+        .annotate(
+            latest=Max('timestamp'),
+            latest_id=Max('id'),
+            actors_count=Count('sender', distinct=True),
+            unread=Count('id', filter=Q(is_read=False)),
+        )
+    )
+    groups = list(keyset_filter(groups, cursor, field='latest', tiebreaker='latest_id')[:limit + 1])
+    next_cursor = None
+    if len(groups) > limit:
+        groups = groups[:limit]
+        last = groups[-1]
+        next_cursor = encode_cursor(SimpleNamespace(latest=last['latest'], latest_id=last['latest_id']),
+                                    'latest', 'latest_id')
+    if not groups:
+        return [], None
+
+    condition = Q()
+    for group in groups:
+        condition |= _group_filter(group)
+    recent = (
+        Notification.objects.filter(condition, recipient=user)
+        .annotate(group=_group_key(), rank=Window(
+            RowNumber(),
+            partition_by=[F('notification_type'), F('target_post_id'), F('group')],
+            order_by=F('id').desc(),
+        ))
+        .filter(rank__lte=ACTORS_PER_GROUP)
+        .select_related('sender__profile')
+        .order_by('-id')
+    )
+    by_group = defaultdict(list)
+    for notification in recent:
+        by_group[(notification.notification_type, notification.target_post_id, notification.group)].append(notification)
+
+    for group in groups:
+        rows = by_group[(group['notification_type'], group['target_post_id'], group['group'])]
+        group['actors'] = [row.sender for row in rows]
+        group['verb'] = rows[0].verb if rows else ''
+    return groups, next_cursor
+
+
+def mark_group_read(user, notification_id):
+    """Mark the group `notification_id` belongs to as read; returns rows updated."""
+    notification = Notification.objects.filter(id=notification_id, recipient=user).annotate(
+        group=_group_key()
+    ).values('notification_type', 'target_post_id', 'group').first()
+    if notification is None:
+        return None
+    updated = Notification.objects.filter(_group_filter(notification), recipient=user, is_read=False).update(
+        is_read=True
+    )
+    if updated:
+        incr_unread(user.id, -updated)
+    return updated
+
+
+@jobs.task(priority=10, batch=BATCH_SIZE)
+def deliver(events):
+    """Job task: apply a batch of notify()/retract() events.
+
+    Retries and parallel workers can apply events out of order, so for
+    likes, follows and mentions the database has the last word: an add
+    whose cause is gone becomes a removal, and a removal whose cause is
+    back is dropped.
+    """
+    events = [(event['op'], tuple(event['target']), event['data']) for event in events]
+    standing = _standing({key for _, key, _ in events if key[2] in CAUSES})
+    settled = []
+    for op, key, data in events:
+        if key[2] in CAUSES:
+            if op == 'add' and key not in standing:
+                op, data = 'remove', None
+            elif op == 'remove' and key in standing:
+                continue
+        settled.append((op, key, data))
+    process(settled)
+
+
+@jobs.task(priority=-10)
+def send_broadcast(sender_id, data):
+    """Job task: write a broadcast() to its whole audience."""
+    _broadcast(sender_id, data)
+
+
+def process(events):
+    """Apply a batch of queued events."""
+    final = OrderedDict()
+    for op, key, data in events:
+        final.pop(key, None)
+        final[key] = (op, data)
+
+    removed = [key for key, (op, _) in final.items() if op == 'remove']
+    added = {key: data for key, (op, data) in final.items() if op == 'add'}
+    if removed:
+        _delete(removed)
+    if added:
+        _insert(added)
+
+
+# notification type -> (model recording its cause, fields matched, key -> their values)
+CAUSES = {
+    'like': (Like, ('user_id', 'post_id'), lambda key: (key[1], key[3])),
+    'follow': (Follow, ('follower_id', 'following_id'), lambda key: (key[1], key[0])),
+    'mention': (Post.mentions.through, ('post_id', 'user_id'), lambda key: (key[3], key[0])),
+}
+
+
+def _standing(keys):
+    """The notification keys among `keys` whose like, follow or mention still exists."""
+    standing = set()
+    for notification_type, (model, fields, cause) in CAUSES.items():
+        wanted = {key: cause(key) for key in keys if key[2] == notification_type}
+        if not wanted:
+            continue
+        condition = Q()
+        for values in set(wanted.values()):
+            condition |= Q(**dict(zip(fields, values)))
+        found = set(model.objects.filter(condition).values_list(*fields))
+        standing.update(key for key, values in wanted.items() if values in found)
+    return standing
+
+
+def _key_filter(keys):
+    condition = Q()
+    for recipient_id, sender_id, notification_type, post_id in keys:
+        condition |= Q(recipient_id=recipient_id, sender_id=sender_id,
+                       notification_type=notification_type, target_post_id=post_id)
+    return condition
+
+
+def _delete(keys):
+    for start in range(0, len(keys), BATCH_SIZE):
+        Notification.objects.filter(_key_filter(keys[start:start + BATCH_SIZE])).delete()
+
+
+def _insert(added):
+    keys = list(added)
+    # Keep get_or_create semantics: an actor notifies once per (type, post)
+    existing = set(
+        Notification.objects.filter(_key_filter(keys))
+        .values_list('recipient_id', 'sender_id', 'notification_type', 'target_post_id')
+    )
+    rows = [
+        Notification(
+            recipient_id=recipient_id, sender_id=sender_id, notification_type=notification_type,
+            target_post_id=post_id, verb=data['verb'], target_comment_id=data['target_comment_id'],
+        )
+        for (recipient_id, sender_id, notification_type, post_id), data in added.items()
+        if (recipient_id, sender_id, notification_type, post_id) not in existing
+    ]
+    Notification.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    _push_summaries(rows)
+
+
+def _push_summaries(rows):
+    from . import realtime
+    groups = defaultdict(list)
+    for row in rows:
+        groups[(row.recipient_id, row.notification_type, row.target_post_id)].append(row)
+    names = dict(User.objects.filter(id__in={row.sender_id for row in rows}).values_list('id', 'username'))
+    for (recipient_id, notification_type, post_id), group in groups.items():
+        actors = [names.get(row.sender_id, 'Someone') for row in reversed(group)]
+        data = {
+            'notification': {
+                'type': notification_type,
+                'verb': summarize(actors, group[-1].verb),
+                'post_id': post_id,
+                'count': len(group),
+            }
+        }
+        unread = incr_unread(recipient_id, len(group))
+        if unread is not None:
+            data['unread_count'] = unread
+        realtime.push([recipient_id], 'notification.new', data)
+
+
+def _broadcast(sender_id, data):
+    if data['user_ids'] is None:
+        audience = User.objects.filter(is_active=True)
+    else:
+        audience = User.objects.filter(id__in=data['user_ids'], is_active=True)
+    user_ids = audience.exclude(id=sender_id).values_list('id', flat=True).order_by('id')
+
+    chunk = []
+    for user_id in user_ids.iterator(chunk_size=BATCH_SIZE):
+        chunk.append(user_id)
+        if len(chunk) == BATCH_SIZE:
+            _write_broadcast_chunk(sender_id, data, chunk)
+            chunk = []
+    if chunk:
+        _write_broadcast_chunk(sender_id, data, chunk)
+
+
+def _write_broadcast_chunk(sender_id, data, user_ids):
+    from . import realtime
+    if data['as_message']:
+        Message.objects.bulk_create([
+            Message(sender_id=sender_id, recipient_id=user_id, content=data['verb']) for user_id in user_ids
+        ])
+        return
+    Notification.objects.bulk_create([
+        Notification(sender_id=sender_id, recipient_id=user_id,
+                     notification_type=data['notification_type'], verb=data['verb'])
+        for user_id in user_ids
+    ])
+    invalidate_unread(user_ids)
+    realtime.push(user_ids, 'notification.new', {
+        'notification': {'type': data['notification_type'], 'verb': data['verb'], 'post_id': None, 'count': 1}
+    })
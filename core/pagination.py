@@ -0,0 +1,69 @@
+"""
+Keyset (cursor) pagination for the feed-style JSON APIs.
+
+Pages are addressed by an opaque cursor that encodes the (created_at, id)
+of the last row the client has seen, so fetching page 500 costs the same
+index range scan as page 1 and rows inserted while the client scrolls
+never shift the window (no duplicates, no skipped posts).
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 50
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we did not issue."""
+
+
+def encode_cursor(obj, field='created_at', tiebreaker='pk'):
+    """Build the opaque cursor pointing just past `obj`."""
+    payload = json.dumps([getattr(obj, field).isoformat(), getattr(obj, tiebreaker)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the (value, pk) pair stored in a cursor."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        return datetime.fromisoformat(value), int(pk)
+    except (ValueError, TypeError, UnicodeDecodeError) as e:
+        raise InvalidCursor('Invalid cursor') from e
+
+
+def get_page_size(request, default=DEFAULT_PAGE_SIZE):
+    """Read ?limit= from the request, clamped to MAX_PAGE_SIZE."""
+    try:
+        limit = int(request.GET.get('limit', default))
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_filter(queryset, cursor=None, field='created_at', tiebreaker='pk'):
+    """Order `queryset` newest first and restrict it to rows after `cursor`."""
+    queryset = queryset.order_by(f'-{field}', f'-{tiebreaker}')
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(**{f'{field}__lt': value}) | Q(**{field: value, f'{tiebreaker}__lt': pk})
+        )
+    return queryset
+
+
+def paginate_keyset(queryset, cursor=None, limit=DEFAULT_PAGE_SIZE, field='created_at', tiebreaker='pk'):
+    """Return ``(items, next_cursor)`` for one page, newest first.
+
+    `next_cursor` is None on the last page. Fetches one extra row to know
+    whether another page exists instead of running a COUNT.
+    """
+    items = list(keyset_filter(queryset, cursor, field, tiebreaker)[:limit + 1])
+    has_more = len(items) > limit
+    items = items[:limit]
+    next_cursor = encode_cursor(items[-1], field, tiebreaker) if has_more and items else None
+    return items, next_cursor
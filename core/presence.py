@@ -0,0 +1,76 @@
+"""
+Presence and typing state, kept only in the cache.
+
+A heartbeat (any authenticated HTTP request via PresenceMiddleware, or a
+ping on the ws/feed/ socket) stamps the user's last-seen time. A user is
+online while that stamp is younger than ONLINE_WINDOW. Nothing here
+writes to the database.
+
+Typing is a short-lived per-conversation map of user id -> expiry, fanned
+out to the other members through core.realtime.
+"""
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+
+ONLINE_WINDOW = getattr(settings, 'PRESENCE_ONLINE_WINDOW', 90)
+LAST_SEEN_TTL = 7 * 24 * 60 * 60
+TYPING_TTL = 6
+
+
+def _seen_key(user_id):
+    return f'presence:seen:{user_id}'
+
+
+def _typing_key(conversation_id):
+    return f'presence:typing:{conversation_id}'
+
+
+def touch(user_id):
+    """Record a heartbeat for `user_id`."""
+    cache.set(_seen_key(user_id), time.time(), LAST_SEEN_TTL)
+
+
+def get_presence(user_ids):
+    """Map each user id to ``{'is_online': bool, 'last_seen': datetime or None}``."""
+    user_ids = list(user_ids)
+    stamps = cache.get_many([_seen_key(user_id) for user_id in user_ids])
+    now = time.time()
+    result = {}
+    for user_id in user_ids:
+        seen = stamps.get(_seen_key(user_id))
+        result[user_id] = {
+            'is_online': seen is not None and now - seen < ONLINE_WINDOW,
+            'last_seen': datetime.fromtimestamp(seen, tz=dt_timezone.utc) if seen else None,
+        }
+    return result
+
+
+def is_online(user_id):
+    return get_presence([user_id])[user_id]['is_online']
+
+
+def set_typing(conversation_id, user, is_typing, member_ids):
+    """Record typing state and push it to the other members of the conversation."""
+    from . import realtime
+    key = _typing_key(conversation_id)
+    now = time.time()
+    typing = {uid: until for uid, until in (cache.get(key) or {}).items() if until > now}
+    if is_typing:
+        typing[user.id] = now + TYPING_TTL
+    else:
+        typing.pop(user.id, None)
+    cache.set(key, typing, TYPING_TTL)
+    realtime.push(
+        [member_id for member_id in member_ids if member_id != user.id],
+        'typing',
+        {'conversation_id': conversation_id, 'user_id': user.id, 'username': user.username, 'is_typing': is_typing},
+    )
+
+
+def typing_user_ids(conversation_id):
+    """Ids of users currently typing in the conversation."""
+    now = time.time()
+    return [uid for uid, until in (cache.get(_typing_key(conversation_id)) or {}).items() if until > now]
@@ -0,0 +1,107 @@
+"""
+Server push over Channels.
+
+Every authenticated socket joins its user's group (see
+core.consumers.FeedConsumer) and the rest of the app sends events to
+users with push(). Events are sent once the surrounding transaction
+commits, and silently dropped when Channels or a channel layer isn't
+configured, so callers never need to care whether anyone is listening.
+
+Event payloads are what the browser receives: ``{"type": <event>, ...data}``.
+"""
+import logging
+
+from django.db import transaction
+
+try:
+    from asgiref.sync import async_to_sync
+    from channels.layers import get_channel_layer
+except ImportError:  # Channels not installed: pushing is a no-op
+    get_channel_layer = None
+
+logger = logging.getLogger(__name__)
+
+
+def user_group(user_id):
+    return f'user.{user_id}'
+
+
+def _send(user_ids, event, data):
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    message = {'type': 'push.event', 'event': event, 'data': data}
+    for user_id in user_ids:
+        try:
+            async_to_sync(layer.group_send)(user_group(user_id), message)
+        except Exception:
+            logger.exception('Could not push %s to user %s', event, user_id)
+
+
+def _on_commit(build):
+    """Run `build` after commit; it returns (user_ids, event, data) or None."""
+    if get_channel_layer is None:
+        return
+
+    def send():
+        try:
+            built = build()
+        except Exception:
+            logger.exception('Could not build push event')
+            return
+        if built:
+            _send(*built)
+
+    transaction.on_commit(send)
+
+
+def push(user_ids, event, data):
+    """Send `event` with `data` to every socket of each user in `user_ids`."""
+    user_ids = list(user_ids)
+    _on_commit(lambda: (user_ids, event, data))
+
+
+def message_created(message):
+    """New conversation message: deliver it to every participant."""
+    def build():
+        from .models import ConversationMember
+        from .serializers import MessageSerializer
+        user_ids = list(
+            ConversationMember.objects.filter(conversation_id=message.conversation_id).values_list('user_id', flat=True)
+        )
+        return user_ids, 'message.new', {
+            'conversation_id': message.conversation_id,
+            'message': MessageSerializer.serialize(message),
+        }
+    _on_commit(build)
+
+
+def notification_created(notification):
+    def build():
+        from .serializers import UserSerializer
+        return [notification.recipient_id], 'notification.new', {
+            'notification': {
+                'id': notification.id,
+                'type': notification.notification_type,
+                'verb': notification.verb,
+                'sender': UserSerializer.serialize(notification.sender),
+                'post_id': notification.target_post_id,
+            }
+        }
+    _on_commit(build)
+
+
+def post_engaged(post_id, actor_id, event):
+    """A like or comment on a post: tell its author, with the fresh counters."""
+    def build():
+        from .models import Post
+        post = Post.objects.filter(pk=post_id).values('author_id', 'likes_count', 'comments_count').first()
+        if not post or post['author_id'] == actor_id:
+            return None
+        return [post['author_id']], event, {
+            'post_id': post_id,
+            'user_id': actor_id,
+            'likes_count': post['likes_count'],
+            'comments_count': post['comments_count'],
+        }
+    _on_commit(build)
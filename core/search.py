@@ -0,0 +1,240 @@
+"""
+Full-text search over posts, people and messages.
+
+On SQLite, migration 0020 creates FTS5 indexes next to the tables they
+cover, and triggers keep them current on every insert, update and delete,
+so bulk_create(), queryset.update() and cascades stay in sync as well as
+save() and delete(). Posts and messages are external-content indexes (the
+text is not stored twice); people get their own table combining
+auth_user names with core_profile.bio.
+
+On PostgreSQL, posts and messages match against to_tsvector() GIN
+expression indexes, and people against the trigram indexes from
+migration 0018 (names only; bios are not indexed there).
+
+Every helper takes the queryset to search, so callers narrow it first
+(exclude the viewer, restrict to one conversation), and returns it
+filtered to matches, best match first. Each word of the query matches as a
+prefix, so "abhi vai" finds "Abhimanyu Vaishnav" while it is being typed.
+"""
+import re
+
+from django.db import connections
+from django.db.models import Q
+
+from . import db
+
+MAX_TERMS = 8
+TERM_RE = re.compile(r'\w+')
+
+# Prefix indexes make 2- and 3-character typeahead a direct lookup
+FTS_OPTIONS = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+
+# name -> (indexed table, column) for the external-content indexes
+CONTENT_INDEXES = {
+    'core_post_fts': ('core_post', 'content'),
+    'core_message_fts': ('core_conversationmessage', 'content'),
+}
+USER_INDEX = 'core_user_fts'
+USER_COLUMNS = ('username', 'first_name', 'last_name', 'bio')
+# bm25() column weights for USER_INDEX: a username hit beats a bio hit
+USER_WEIGHTS = (10.0, 5.0, 5.0, 1.0)
+
+# (index name, table, column) GIN expression indexes used on PostgreSQL
+TSVECTOR_INDEXES = [
+    ('core_post_content_fts', 'core_post', 'content'),
+    ('core_message_content_fts', 'core_conversationmessage', 'content'),
+]
+
+
+def _content_triggers(index, table, column):
+    # External-content indexes need the old value to delete an entry
+    delete = f"INSERT INTO {index}({index}, rowid, {column}) VALUES ('delete', old.id, old.{column});"
+    insert = f"INSERT INTO {index}(rowid, {column}) VALUES (new.id, new.{column});"
+    return {
+        f'{index}_insert': f'AFTER INSERT ON {table} BEGIN {insert} END',
+        f'{index}_delete': f'AFTER DELETE ON {table} BEGIN {delete} END',
+        f'{index}_update': (f'AFTER UPDATE OF {column} ON {table} '
+                            f'WHEN old.{column} IS NOT new.{column} BEGIN {delete} {insert} END'),
+    }
+
+
+def _user_triggers():
+    names_changed = ' OR '.join(f'old.{name} IS NOT new.{name}' for name in USER_COLUMNS[:3])
+    return {
+        f'{USER_INDEX}_user_insert': (
+            f"AFTER INSERT ON auth_user BEGIN INSERT INTO {USER_INDEX}(rowid, username, first_name, last_name, bio) "
+            f"VALUES (new.id, new.username, new.first_name, new.last_name, ''); END"
+        ),
+        f'{USER_INDEX}_user_update': (
+            f"AFTER UPDATE OF username, first_name, last_name ON auth_user WHEN {names_changed} BEGIN "
+            f"UPDATE {USER_INDEX} SET username = new.username, first_name = new.first_name, "
+            f"last_name = new.last_name WHERE rowid = new.id; END"
+        ),
+        f'{USER_INDEX}_user_delete': f'AFTER DELETE ON auth_user BEGIN DELETE FROM {USER_INDEX} WHERE rowid = old.id; END',
+        f'{USER_INDEX}_profile_insert': (
+            f'AFTER INSERT ON core_profile BEGIN UPDATE {USER_INDEX} SET bio = new.bio WHERE rowid = new.user_id; END'
+        ),
+        f'{USER_INDEX}_profile_update': (
+            f'AFTER UPDATE OF bio ON core_profile WHEN old.bio IS NOT new.bio BEGIN '
+            f'UPDATE {USER_INDEX} SET bio = new.bio WHERE rowid = new.user_id; END'
+        ),
+        f'{USER_INDEX}_profile_delete': (
+            f"AFTER DELETE ON core_profile BEGIN UPDATE {USER_INDEX} SET bio = '' WHERE rowid = old.user_id; END"
+        ),
+    }
+
+
+def _triggers():
+    triggers = _user_triggers()
+    for index, (table, column) in CONTENT_INDEXES.items():
+        triggers.update(_content_triggers(index, table, column))
+    return triggers
+
+
+def rebuild(connection):
+    """Repopulate every SQLite index from its source tables."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for index in CONTENT_INDEXES:
+            cursor.execute(f"INSERT INTO {index}({index}) VALUES ('rebuild')")
+        cursor.execute(f'DELETE FROM {USER_INDEX}')
+        cursor.execute(
+            f"INSERT INTO {USER_INDEX}(rowid, username, first_name, last_name, bio) "
+            f"SELECT u.id, u.username, u.first_name, u.last_name, COALESCE(p.bio, '') "
+            f"FROM auth_user u LEFT JOIN core_profile p ON p.user_id = u.id"
+        )
+
+
+def install(connection):
+    """Create any missing index tables and triggers; returns True if anything was missing.
+
+    Safe to call repeatedly; repopulates the indexes if it had to create
+    anything.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for name, table, column in TSVECTOR_INDEXES:
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {name} ON {table} "
+                    f"USING gin (to_tsvector('simple', COALESCE({column}, '')))"
+                )
+            return False
+        if connection.vendor != 'sqlite':
+            return False
+
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {row[0] for row in cursor.fetchall()}
+        triggers = _triggers()
+        if existing.issuperset([*CONTENT_INDEXES, USER_INDEX, *triggers]):
+            return False
+
+        for index, (table, column) in CONTENT_INDEXES.items():
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5("
+                f"{column}, content = '{table}', content_rowid = 'id', {FTS_OPTIONS})"
+            )
+        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {USER_INDEX} USING fts5({', '.join(USER_COLUMNS)}, {FTS_OPTIONS})")
+        for name, body in triggers.items():
+            cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}')
+    rebuild(connection)
+    return True
+
+
+def repair(connection):
+    """Put back triggers lost since migration 0020, if it is applied.
+
+    SQLite drops a table's triggers when a migration rebuilds the table
+    (most AlterField operations do), so this runs after every migrate.
+    """
+    if connection.vendor == 'sqlite' and USER_INDEX in connection.introspection.table_names():
+        return install(connection)
+    return False
+
+
+def uninstall(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for name, table, column in TSVECTOR_INDEXES:
+                cursor.execute(f'DROP INDEX IF EXISTS {name}')
+        elif connection.vendor == 'sqlite':
+            for name in _triggers():
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            for index in [*CONTENT_INDEXES, USER_INDEX]:
+                cursor.execute(f'DROP TABLE IF EXISTS {index}')
+
+
+def terms(query):
+    """The words of `query` that take part in matching."""
+    return TERM_RE.findall(query)[:MAX_TERMS]
+
+
+def fts_query(query):
+    """FTS5 MATCH expression: every word as a quoted prefix term, all required."""
+    return ' '.join(f'"{term}"*' for term in terms(query))
+
+
+def tsquery(query):
+    """PostgreSQL to_tsquery() expression with the same meaning as fts_query()."""
+    return ' & '.join(f'{term}:*' for term in terms(query))
+
+
+def _fts_search(queryset, index, match, weights=()):
+    table = queryset.model._meta.db_table
+    args = ''.join(f', {weight}' for weight in weights)
+    # bm25() is lower-is-better, so ascending order puts the best match first
+    return queryset.extra(
+        select={'search_rank': f'bm25({index}{args})'},
+        tables=[index],
+        where=[f'{index}.rowid = {table}.id', f'{index} MATCH %s'],
+        params=[match],
+    ).order_by('search_rank', '-pk')
+
+
+def _tsvector_search(queryset, column, query):
+    vector = f"to_tsvector('simple', COALESCE({queryset.model._meta.db_table}.{column}, ''))"
+    expression = tsquery(query)
+    return queryset.extra(
+        select={'search_rank': f"-ts_rank({vector}, to_tsquery('simple', %s))"},
+        select_params=[expression],
+        where=[f"{vector} @@ to_tsquery('simple', %s)"],
+        params=[expression],
+    ).order_by('search_rank', '-pk')
+
+
+def _content_search(queryset, index, query):
+    if not terms(query):
+        return queryset.none()
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        return _fts_search(queryset, index, fts_query(query))
+    column = CONTENT_INDEXES[index][1]
+    if vendor == 'postgresql':
+        return _tsvector_search(queryset, column, query)
+    return queryset.filter(**{f'{column}__icontains': query}).order_by('-pk')
+
+
+def search_posts(queryset, query):
+    """Posts in `queryset` whose content matches `query`."""
+    return _content_search(queryset, 'core_post_fts', query)
+
+
+def search_messages(queryset, query):
+    """Conversation messages in `queryset` whose content matches `query`."""
+    return _content_search(queryset, 'core_message_fts', query)
+
+
+def search_users(queryset, query):
+    """Users in `queryset` whose username, first/last name or bio matches `query`."""
+    words = terms(query)
+    if not words:
+        return queryset.none()
+    if connections[queryset.db].vendor == 'sqlite':
+        return _fts_search(queryset, USER_INDEX, fts_query(query), USER_WEIGHTS)
+    # Every word has to hit one of the names, as with the FTS5 query
+    for word in words:
+        queryset = queryset.filter(
+            Q(username__icontains=word) | Q(first_name__icontains=word) | Q(last_name__icontains=word)
+        )
+    return db.rank_by_similarity(queryset, query, 'username', 'first_name', 'last_name')
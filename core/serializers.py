@@ -0,0 +1,271 @@
+"""
+Shared JSON serializers for posts, users, comments and conversations.
+
+Every serializer declares the select_related/prefetch_related/annotations
+its output touches, and prepare() applies that plan to a queryset. Views
+should always run their queryset through prepare() before serializing so
+a page of results costs a fixed number of queries.
+"""
+from django.contrib.auth.models import User
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Count, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from . import images
+from .models import Comment, ConversationMember, ConversationMessage
+from .notifications import summarize
+from .viewer_state import load_viewer_state
+
+DATETIME_FORMAT = '%b %d, %Y %H:%M'
+
+
+def format_timestamp(value):
+    return value.strftime(DATETIME_FORMAT) if value else ''
+
+
+def file_url(field):
+    """URL of an optional File/ImageField value, or None."""
+    return field.url if field else None
+
+
+def image_fields(key, field, sizes=images.PHOTO_SIZES, size='feed'):
+    """`key` (a resized URL) plus `key`_srcset, `key`_sources and `key`_original for an ImageField."""
+    urls = images.image_urls(field, sizes, size) or dict.fromkeys(('src', 'srcset', 'sources', 'original'))
+    return {
+        key: urls['src'],
+        f'{key}_srcset': urls['srcset'],
+        f'{key}_sources': urls['sources'],
+        f'{key}_original': urls['original'],
+    }
+
+
+class Serializer:
+    select_related = ()
+    prefetch_related = ()
+    # name -> zero-argument callable returning a fresh expression
+    annotations = {}
+
+    @classmethod
+    def prepare(cls, queryset):
+        """Apply this serializer's query plan to `queryset`."""
+        if cls.select_related:
+            queryset = queryset.select_related(*cls.select_related)
+        if cls.prefetch_related:
+            queryset = queryset.prefetch_related(*cls.prefetch_related)
+        if cls.annotations:
+            queryset = queryset.annotate(**{name: make() for name, make in cls.annotations.items()})
+        return queryset
+
+
+class UserSerializer(Serializer):
+    select_related = ('profile',)
+
+    @staticmethod
+    def serialize(user):
+        try:
+            profile = user.profile
+        except ObjectDoesNotExist:
+            profile = None
+        data = {
+            'id': user.id,
+            'username': user.username,
+            'name': (profile.full_name if profile else '') or user.username,
+        }
+        data.update(image_fields('avatar', profile.profile_pic if profile else None, images.AVATAR_SIZES, 'avatar'))
+        return data
+
+
+class UserWithStatsSerializer(UserSerializer):
+    annotations = {
+        'posts_count': lambda: Count('posts', distinct=True),
+    }
+
+    @staticmethod
+    def serialize(user):
+        data = UserSerializer.serialize(user)
+        data['posts_count'] = getattr(user, 'posts_count', 0)
+        return data
+
+
+class PostSerializer(Serializer):
+    select_related = ('author__profile', 'repost_parent__author__profile')
+
+    @staticmethod
+    def serialize(post, viewer=None, viewer_state=None):
+        data = {
+            'id': post.id,
+            'content': post.content,
+            'post_type': post.post_type,
+            'author': UserSerializer.serialize(post.author),
+            'video': file_url(post.video),
+            'location': post.location,
+            'created_at': format_timestamp(post.created_at),
+            'likes_count': post.likes_count,
+            'comments_count': post.comments_count,
+            'repost_count': post.repost_count,
+            'share_count': post.share_count,
+            'is_quote': post.is_quote,
+            'quote_text': post.quote_text,
+            'repost_of': None,
+            'is_owner': viewer is not None and post.author_id == viewer.id,
+        }
+        data.update(image_fields('image', post.image))
+        if post.repost_parent_id:
+            parent = post.repost_parent
+            data['repost_of'] = {
+                'id': parent.id,
+                'content': parent.content,
+                'author': UserSerializer.serialize(parent.author),
+                'created_at': format_timestamp(parent.created_at),
+            }
+        if viewer_state is not None:
+            data.update(viewer_state.for_post(post.id))
+        return data
+
+    @classmethod
+    def serialize_many(cls, posts, viewer=None):
+        """Serialize a page of posts, resolving viewer flags in one batch."""
+        posts = list(posts)
+        viewer_state = load_viewer_state(viewer, [post.id for post in posts])
+        return [cls.serialize(post, viewer, viewer_state) for post in posts]
+
+
+class CommentSerializer(Serializer):
+    select_related = ('user__profile',)
+
+    @staticmethod
+    def serialize(comment, viewer=None):
+        return {
+            'id': comment.id,
+            'content': comment.content,
+            'user': UserSerializer.serialize(comment.user),
+            'parent_id': comment.parent_id,
+            'created_at': format_timestamp(comment.created_at),
+            'is_owner': viewer is not None and comment.user_id == viewer.id,
+        }
+
+
+class PostCardSerializer(PostSerializer):
+    """Query plan for rendering core/components/post_card.html."""
+
+    @classmethod
+    def prepare(cls, queryset):
+        comments = CommentSerializer.prepare(Comment.objects.all())
+        return super().prepare(queryset).prefetch_related(Prefetch('comments', queryset=comments))
+
+
+class MessageSerializer(Serializer):
+    select_related = ('sender__profile',)
+
+    @staticmethod
+    def serialize(message, viewer=None, watermarks=None):
+        """`watermarks` maps participant id -> last_read_message_id for the conversation.
+
+        A message counts as read once every other participant has read it.
+        """
+        is_read = watermarks is not None and all(
+            last_read >= message.id for user_id, last_read in watermarks.items() if user_id != message.sender_id
+        )
+        return {
+            'id': message.id,
+            'content': message.content,
+            'sender': UserSerializer.serialize(message.sender),
+            'sender_id': message.sender_id,
+            'timestamp': message.timestamp.strftime('%H:%M'),
+            'created_at': message.timestamp.isoformat(),
+            'is_read': is_read,
+            'is_own': viewer is not None and message.sender_id == viewer.id,
+            'is_edited': message.is_edited,
+            'type': 'text',
+        }
+
+
+class ConversationSerializer(Serializer):
+    """Inbox rows: one annotated query, plus one query each for participants and last messages.
+
+    Unread counts come from the viewer's ConversationMember row.
+    """
+
+    @classmethod
+    def prepare(cls, queryset, viewer):
+        latest = ConversationMessage.objects.filter(
+            conversation=OuterRef('pk')
+        ).order_by('-timestamp', '-pk').values('pk')[:1]
+        unread = ConversationMember.objects.filter(
+            conversation=OuterRef('pk'), user=viewer
+        ).values('unread_count')[:1]
+        return queryset.prefetch_related(
+            Prefetch('participants', queryset=UserSerializer.prepare(User.objects.all()))
+        ).annotate(
+            last_message_pk=Subquery(latest),
+            unread_total=Coalesce(Subquery(unread), Value(0)),
+        )
+
+    @staticmethod
+    def serialize(conversation, viewer, last_message=None):
+        other_user = None
+        if conversation.is_group:
+            name = conversation.group_name or 'Group Chat'
+            avatar = file_url(conversation.group_photo)
+        else:
+            other_user = next((u for u in conversation.participants.all() if u.pk != viewer.pk), None)
+            if other_user:
+                other = UserSerializer.serialize(other_user)
+                name, avatar = other['name'], other['avatar']
+            else:
+                name, avatar = 'Unknown User', None
+        unread = getattr(conversation, 'unread_total', 0)
+        return {
+            'id': conversation.id,
+            'is_group': conversation.is_group,
+            'name': name,
+            'avatar': avatar,
+            'other_user_id': other_user.id if other_user else None,
+            'last_message': {
+                'content': last_message.content,
+                'timestamp': last_message.timestamp.strftime('%H:%M'),
+                'sender': last_message.sender.username,
+                'unread': unread,
+                'is_own': last_message.sender_id == viewer.id,
+            } if last_message else {
+                'content': 'No messages yet',
+                'timestamp': '',
+                'sender': '',
+                'unread': 0,
+                'is_own': False,
+            },
+            'unread_count': unread,
+            'online': False,
+        }
+
+    @classmethod
+    def serialize_many(cls, conversations, viewer):
+        """Serialize prepared conversations, loading all last messages in one query."""
+        conversations = list(conversations)
+        last_messages = ConversationMessage.objects.select_related('sender').in_bulk(
+            [c.last_message_pk for c in conversations if c.last_message_pk]
+        )
+        return [
+            cls.serialize(c, viewer, last_messages.get(c.last_message_pk))
+            for c in conversations
+        ]
+
+
+class NotificationGroupSerializer(Serializer):
+    """One entry of notifications.grouped(): "alice and 12 others liked your post"."""
+
+    @staticmethod
+    def serialize(group):
+        actors = [UserSerializer.serialize(user) for user in group['actors']]
+        names = [actor['username'] for actor in actors] or ['Someone']
+        return {
+            'id': group['latest_id'],
+            'type': group['notification_type'],
+            'post_id': group['target_post_id'],
+            'actors': actors,
+            'actors_count': group['actors_count'],
+            'message': summarize(names, group['verb'], total=group['actors_count']),
+            'created_at': format_timestamp(group['latest']),
+            'is_read': group['unread'] == 0,
+            'unread_count': group['unread'],
+        }
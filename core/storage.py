@@ -0,0 +1,209 @@
+"""
+Content-addressed storage for user media.
+
+Every file saved through media_storage (the storage of the upload fields
+in core.models) is kept once, under the SHA-256 of its bytes:
+
+    cas/<2 hex>/<2 hex>/<digest><extension>
+
+The digest is computed in the same pass that streams the upload to disk,
+and saving bytes that are already stored writes nothing, so reposts,
+re-uploaded avatars and popular memes all share one file.
+
+MediaBlob counts the model fields that point at each stored file. The
+signal receivers in core.models retain and release names as rows are
+created, changed and deleted; once a count reaches zero the file and its
+derivatives (see core.images) are removed after the transaction commits.
+Storage.delete() is a no-op here, so FieldFile.delete() can never pull a
+file from under another row. Saving bytes that are already stored marks
+the blob touched, and reclaim() leaves blobs touched in the last
+RECLAIM_GRACE alone: the row that will reference them is usually still
+being saved, and its count comes in with that save. What stays
+unreferenced is picked up by gc_media. Writes that bypass signals (queryset
+update(), bulk_create) are reconciled by `manage.py gc_media`, which
+recounts every reference and reclaims files under MEDIA_ROOT that
+nothing points at.
+"""
+import hashlib
+import os
+import tempfile
+from collections import Counter
+from functools import lru_cache
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F, FileField, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+PREFIX = 'cas'
+READ_SIZE = 1024 * 1024
+RECLAIM_GRACE = timedelta(minutes=getattr(settings, 'MEDIA_RECLAIM_GRACE_MINUTES', 10))
+
+
+def content_key(digest, extension):
+    return f'{PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def is_content_addressed(name):
+    return bool(name) and name.startswith(PREFIX + '/')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files after their content; see the module docstring."""
+
+    def get_available_name(self, name, max_length=None):
+        # _save() names the file after its content, so any name will do
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        digest = hashlib.sha256()
+        if hasattr(content, 'temporary_file_path'):
+            # Already on disk (large or chunked uploads): hash it, then move it into place
+            source, staged = content.temporary_file_path(), False
+            with open(source, 'rb') as file:
+                for chunk in iter(lambda: file.read(READ_SIZE), b''):
+                    digest.update(chunk)
+        else:
+            staging = self.path(f'{PREFIX}/tmp')
+            os.makedirs(staging, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=staging, delete=False) as file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    file.write(chunk)
+                source, staged = file.name, True
+
+        final = content_key(digest.hexdigest(), extension)
+        path = self.path(final)
+        # Touch before looking: a reclaim() that gets in first has already
+        # removed the file by the time this returns, and one that comes
+        # after skips the blob
+        touch(final)
+        if os.path.exists(path):
+            # Same bytes stored before; a temporary upload file is cleaned up by its owner
+            if staged:
+                os.remove(source)
+            try:
+                # Keeps gc_media's own grace period from starting over an old file
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            return final
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file_move_safe(source, path, allow_overwrite=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+        return final
+
+    def delete(self, name):
+        # Files go when their last reference does (release()) or in gc_media
+        pass
+
+
+media_storage = ContentAddressedStorage()
+
+
+@lru_cache(maxsize=None)
+def media_fields(model):
+    return [field for field in model._meta.concrete_fields if isinstance(field, FileField)]
+
+
+def media_names(instance):
+    """{attname: stored file name or None} for the loaded file fields of `instance`."""
+    names = {}
+    for field in media_fields(type(instance)):
+        if field.attname not in instance.__dict__:
+            continue  # deferred
+        value = instance.__dict__[field.attname]
+        if isinstance(value, str) or value is None:
+            names[field.attname] = value or None
+        else:
+            names[field.attname] = value.name if getattr(value, '_committed', True) and value.name else None
+    return names
+
+
+def retain(names):
+    """Count one more reference to each content-addressed name in `names`."""
+    from .models import MediaBlob
+    counts = Counter(name for name in names if is_content_addressed(name))
+    if not counts:
+        return
+    MediaBlob.objects.bulk_create([MediaBlob(name=name) for name in counts], ignore_conflicts=True)
+    for name, count in counts.items():
+        MediaBlob.objects.filter(name=name).update(refcount=F('refcount') + count)
+
+
+def release(names):
+    """Drop one reference to each name; files left unreferenced go once the transaction commits."""
+    from .models import MediaBlob
+    counts = Counter(name for name in names if is_content_addressed(name))
+    if not counts:
+        return
+    for name, count in counts.items():
+        MediaBlob.objects.filter(name=name).update(refcount=Greatest(F('refcount') - count, 0))
+    transaction.on_commit(lambda: reclaim(list(counts)))
+
+
+def touch(name):
+    """Mark blob `name` as just handed out again, shielding it from reclaim() for RECLAIM_GRACE."""
+    from .models import MediaBlob
+    MediaBlob.objects.filter(name=name).update(touched_at=timezone.now())
+
+
+def reclaim(names):
+    """Remove the files of unreferenced `names` and their derivatives; returns the names removed.
+
+    Blobs touched within RECLAIM_GRACE are skipped. The files go in the
+    transaction that deletes the row, so a concurrent touch() either
+    lands first and keeps them or waits until they are gone.
+    """
+    from .models import MediaBlob
+    from . import images
+    removed = []
+    recent = Q(touched_at__gte=timezone.now() - RECLAIM_GRACE)
+    for name in names:
+        with transaction.atomic():
+            deleted, _ = MediaBlob.objects.filter(name=name, refcount=0).exclude(recent).delete()
+            if not deleted:
+                continue
+            for key in [name] + images.derived_keys(name):
+                try:
+                    os.remove(media_storage.path(key))
+                except FileNotFoundError:
+                    pass
+        removed.append(name)
+    return removed
+
+
+def references():
+    """Counter of every stored file name referenced by a file field, plus field defaults."""
+    from django.apps import apps
+    counts = Counter()
+    for model in apps.get_models():
+        for field in media_fields(model):
+            if isinstance(field.default, str) and field.default:
+                counts[field.default] += 0
+            rows = (model._base_manager.exclude(**{f'{field.attname}__isnull': True})
+                    .exclude(**{field.attname: ''}).values_list(field.attname, flat=True))
+            counts.update(rows.iterator())
+    return counts
+
+
+def recount(counts):
+    """Make MediaBlob counts match `counts` (see references()); returns how many rows changed."""
+    from .models import MediaBlob
+    actual = {name: count for name, count in counts.items() if is_content_addressed(name)}
+    stored = dict(MediaBlob.objects.values_list('name', 'refcount'))
+    missing = [MediaBlob(name=name, refcount=count) for name, count in actual.items() if name not in stored]
+    MediaBlob.objects.bulk_create(missing, ignore_conflicts=True)
+    changed = len(missing)
+    for name, count in stored.items():
+        if actual.get(name, 0) != count:
+            MediaBlob.objects.filter(name=name).update(refcount=actual.get(name, 0))
+            changed += 1
+    return changed
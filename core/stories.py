@@ -0,0 +1,115 @@
+"""
+Active story rings and the expired story sweeper.
+
+Each user with unexpired stories has a StoryRing row holding how many
+they have, the id and time of the newest one and when the earliest and
+last of them expire. Rings are recomputed by refresh() when a story is
+created or deleted (see the Story receivers in core.models) and when the
+sweeper deletes expired stories, so the stories tray is one query over
+the rings of the people a viewer follows. Bulk deletes (QuerySet.delete())
+do not refresh rings per row and must call refresh() themselves.
+
+Creating a story queues a sweep job (core.jobs) for the SWEEP_INTERVAL
+slot it expires in; stories expiring in the same slot share one job.
+sweep() deletes expired stories BATCH_SIZE at a time, and with them their
+views and, through core.storage, their media files. `manage.py
+sweep_stories` runs it by hand, e.g. for stories that expired before
+the sweeper existed.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+
+from . import jobs
+from .models import Follow, Story, StoryRing
+
+BATCH_SIZE = getattr(settings, 'STORY_SWEEP_BATCH_SIZE', 500)
+SWEEP_INTERVAL = timedelta(minutes=getattr(settings, 'STORY_SWEEP_INTERVAL_MINUTES', 5))
+
+
+def refresh(user_ids, now=None):
+    """Recompute the rings of `user_ids` from their unexpired stories."""
+    now = now or timezone.now()
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    rings = [
+        StoryRing(**row) for row in
+        Story.objects.filter(user_id__in=user_ids, expires_at__gt=now)
+        .order_by().values('user_id')
+        .annotate(
+            story_count=Count('id'),
+            latest_story_id=Max('id'),
+            latest_at=Max('created_at'),
+            next_expiry=Min('expires_at'),
+            last_expiry=Max('expires_at'),
+        )
+    ]
+    StoryRing.objects.filter(user_id__in=user_ids - {ring.user_id for ring in rings}).delete()
+    StoryRing.objects.bulk_create(
+        rings, update_conflicts=True, unique_fields=['user'],
+        update_fields=['story_count', 'latest_story_id', 'latest_at', 'next_expiry', 'last_expiry'],
+    )
+
+
+def story_added(story):
+    """Add a new story to its owner's ring and make sure a sweep is queued for when it expires."""
+    refresh([story.user_id])
+    slot = SWEEP_INTERVAL.total_seconds()
+    due = -(-story.expires_at.timestamp() // slot) * slot
+    jobs.enqueue(sweep_job, key=f'stories.sweep:{int(due)}',
+                 delay=timedelta(seconds=max(0, due - timezone.now().timestamp())))
+
+
+def tray(viewer, now=None):
+    """Rings of `viewer` and the people they follow that have unexpired stories, newest first.
+
+    One query, unless a ring has a story that expired since the last
+    sweep; those rings are refreshed first.
+    """
+    now = now or timezone.now()
+    rings = _load(viewer, now)
+    stale = [ring.user_id for ring in rings if ring.next_expiry <= now]
+    if stale:
+        refresh(stale, now)
+        rings = _load(viewer, now)
+    return rings
+
+
+def _load(viewer, now):
+    following = Follow.objects.filter(follower=viewer).values('following')
+    return list(
+        StoryRing.objects.filter(Q(user__in=following) | Q(user=viewer), last_expiry__gt=now)
+        .select_related('user__profile')
+        .order_by('-latest_at')
+    )
+
+
+def sweep(now=None):
+    """Delete expired stories in batches; returns how many were deleted."""
+    now = now or timezone.now()
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Story.objects.filter(expires_at__lte=now).order_by('expires_at')
+                .values_list('id', 'user_id')[:BATCH_SIZE]
+            )
+            if not batch:
+                break
+            # Per-row delete signals release the media (core.storage) once this commits
+            Story.objects.filter(id__in=[story_id for story_id, _ in batch]).delete()
+            refresh({user_id for _, user_id in batch}, now)
+        deleted += len(batch)
+    # Rings whose stories went some other way, e.g. a bulk delete
+    refresh(StoryRing.objects.filter(next_expiry__lte=now).values_list('user_id', flat=True), now)
+    return deleted
+
+
+@jobs.task(priority=-5)
+def sweep_job():
+    """Job task: sweep()."""
+    sweep()
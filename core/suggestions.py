@@ -0,0 +1,162 @@
+"""
+"People you may know" suggestion engine.
+
+Candidates for each user are scored from friends-of-friends, shared
+interests and overall popularity, then cached per user for
+SUGGESTIONS_TTL seconds. Serving suggestions is a cache read plus one
+primary-key lookup; nothing here uses ORDER BY RANDOM().
+"""
+import random
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count, Max, Min
+
+from .models import Follow, Profile
+
+SUGGESTIONS_TTL = getattr(settings, 'SUGGESTIONS_TTL', 60 * 60)
+SIDEBAR_TTL = getattr(settings, 'SUGGESTIONS_SIDEBAR_TTL', 5 * 60)
+POOL_SIZE = 50
+POPULAR_POOL_SIZE = 200
+
+MUTUAL_WEIGHT = 3
+INTEREST_WEIGHT = 2
+POPULARITY_WEIGHT = 1
+
+POPULAR_CACHE_KEY = 'suggestions:popular'
+
+
+def _cache_key(user_id):
+    return f'suggestions:user:{user_id}'
+
+
+def _sidebar_key(user_id):
+    return f'suggestions:sidebar:{user_id or "anon"}'
+
+
+def random_user_ids(limit, exclude=()):
+    """Sample up to `limit` active user IDs by jumping to a random point in the id range.
+
+    Reads at most two short index range scans instead of sorting the whole
+    user table.
+    """
+    bounds = User.objects.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None or limit <= 0:
+        return []
+    start = random.randint(bounds['low'], bounds['high'])
+    exclude = set(exclude)
+    active = User.objects.filter(is_active=True).exclude(id__in=exclude)
+
+    ids = list(active.filter(id__gte=start).order_by('id').values_list('id', flat=True)[:limit])
+    if len(ids) < limit:
+        ids += active.filter(id__lt=start).order_by('id').values_list('id', flat=True)[:limit - len(ids)]
+    return ids[:limit]
+
+
+def popular_user_ids():
+    """Most-followed users, cached globally."""
+    ids = cache.get(POPULAR_CACHE_KEY)
+    if ids is None:
+        ids = list(
+            Follow.objects.values('following').annotate(n=Count('id'))
+            .order_by('-n').values_list('following', flat=True)[:POPULAR_POOL_SIZE]
+        )
+        cache.set(POPULAR_CACHE_KEY, ids, SUGGESTIONS_TTL)
+    return ids
+
+
+def compute_candidates(user):
+    """Rank suggestion candidates for `user`, best first."""
+    following = set(Follow.objects.filter(follower=user).values_list('following_id', flat=True))
+    excluded = following | {user.pk}
+    scores = Counter()
+
+    # Friends of friends, weighted by how many of my followings follow them
+    mutuals = (
+        Follow.objects.filter(follower_id__in=following)
+        .exclude(following_id__in=excluded)
+        .values('following_id').annotate(n=Count('id')).order_by('-n')
+        .values_list('following_id', 'n')[:POOL_SIZE]
+    )
+    for user_id, n in mutuals:
+        scores[user_id] += n * MUTUAL_WEIGHT
+
+    # People sharing my interests
+    ProfileInterest = Profile.interests.through
+    my_interests = ProfileInterest.objects.filter(profile__user=user).values_list('interest_id', flat=True)
+    shared = (
+        ProfileInterest.objects.filter(interest_id__in=my_interests)
+        .exclude(profile__user_id__in=excluded)
+        .values('profile__user_id').annotate(n=Count('id')).order_by('-n')
+        .values_list('profile__user_id', 'n')[:POOL_SIZE]
+    )
+    for user_id, n in shared:
+        scores[user_id] += n * INTEREST_WEIGHT
+
+    # Popular accounts, decaying with rank
+    popular = popular_user_ids()
+    for rank, user_id in enumerate(popular):
+        if user_id not in excluded:
+            scores[user_id] += POPULARITY_WEIGHT * (1 - rank / len(popular))
+
+    ranked = [user_id for user_id, _ in scores.most_common(POOL_SIZE)]
+    if len(ranked) < POOL_SIZE:
+        ranked += random_user_ids(POOL_SIZE - len(ranked), exclude=excluded | set(ranked))
+    return ranked
+
+
+def candidate_ids(user):
+    """Cached candidate list for `user`, computing it on a miss."""
+    key = _cache_key(user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        ids = compute_candidates(user)
+        cache.set(key, ids, SUGGESTIONS_TTL)
+    return ids
+
+
+def invalidate(user_id):
+    cache.delete_many([_cache_key(user_id), _sidebar_key(user_id)])
+
+
+def suggested_user_ids(user, limit=5):
+    """Pick `limit` suggestions, varying between calls among the top candidates."""
+    if user is None or not user.is_authenticated:
+        pool = popular_user_ids()[:limit * 3] or random_user_ids(limit * 3)
+    else:
+        pool = candidate_ids(user)[:limit * 3]
+    return random.sample(pool, min(limit, len(pool)))
+
+
+def _users(ids, queryset=None):
+    if not ids:
+        return []
+    if queryset is None:
+        queryset = User.objects.all()
+    users = {u.pk: u for u in queryset.filter(id__in=ids, is_active=True)}
+    return [users[user_id] for user_id in ids if user_id in users]
+
+
+def get_suggested_users(user, limit=5, queryset=None):
+    """Suggested User objects, in the order suggested_user_ids() picked them.
+
+    `queryset` lets the caller apply its own serializer plan.
+    """
+    return _users(suggested_user_ids(user, limit), queryset)
+
+
+def get_sidebar_users(user, limit=5, queryset=None):
+    """Like get_suggested_users(), for the sidebar's held pick (see sidebar_user_ids())."""
+    return _users(sidebar_user_ids(user, limit), queryset)
+
+
+def sidebar_user_ids(user, limit=5):
+    """The sidebar's pick for `user`, held for SIDEBAR_TTL so it doesn't reshuffle on every page."""
+    key = _sidebar_key(user.pk if user is not None and user.is_authenticated else None)
+    ids = cache.get(key)
+    if ids is None:
+        ids = suggested_user_ids(user, limit)
+        cache.set(key, ids, SIDEBAR_TTL)
+    return ids
@@ -0,0 +1,33 @@
+from django import template
+from django.urls import reverse
+from django.utils.html import conditional_escape, format_html
+from django.utils.safestring import mark_safe
+
+from core.hashtags import HASHTAG_RE, MENTION_RE
+
+register = template.Library()
+
+
+@register.filter(needs_autoescape=True)
+def linkify(text, autoescape=True):
+    """Turn #hashtags and @mentions in post text into links.
+
+    Usage: {{ post.content|linkify }}
+    """
+    escape = conditional_escape if autoescape else (lambda value: value)
+    text = str(text or '')
+    # Match on the raw text so escaping can't create or break a tag
+    links = sorted(
+        [(m.start(), m.group(0), 'hashtag_posts', m.group(1).casefold()) for m in HASHTAG_RE.finditer(text)] +
+        [(m.start(), '@' + name, 'profile', name)
+         for m in MENTION_RE.finditer(text) for name in [m.group(1).rstrip('.-+@')]]
+    )
+    parts, position = [], 0
+    for start, label, url_name, arg in links:
+        if start < position:
+            continue
+        parts.append(escape(text[position:start]))
+        parts.append(format_html('<a href="{}">{}</a>', reverse(url_name, args=[arg]), label))
+        position = start + len(label)
+    parts.append(escape(text[position:]))
+    return mark_safe(''.join(parts))
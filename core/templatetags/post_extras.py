@@ -1,8 +1,15 @@
-
 from django import template
 register = template.Library()
 
 
+def _viewer_state(post, user):
+    """Return the batched ViewerState attached by the view, or None."""
+    state = getattr(post, 'viewer_state', None)
+    if state is None or not user or user.is_anonymous:
+        return None
+    return state
+
+
 @register.simple_tag
 def is_liked(post, user):
     """Return True if `user` has liked `post`.
@@ -10,14 +17,72 @@ def is_liked(post, user):
     Usage in template:
         {% is_liked post request.user as liked %}
         {% if liked %} ... {% endif %}
+
+    Uses the state preloaded by core.viewer_state.attach_viewer_state()
+    when available and falls back to a query otherwise.
     """
     try:
         if not user or user.is_anonymous:
             return False
+        state = _viewer_state(post, user)
+        if state is not None:
+            return post.pk in state.liked
         return post.likes.filter(user_id=user.id).exists()
     except Exception:
         return False
 
+
+@register.simple_tag
+def is_saved(post, user):
+    """Return True if `user` has saved `post`.
+
+    Usage: {% is_saved post request.user as saved %}
+    """
+    try:
+        if not user or user.is_anonymous:
+            return False
+        state = _viewer_state(post, user)
+        if state is not None:
+            return post.pk in state.saved
+        from core.models import SavedPost
+        return SavedPost.objects.filter(user_id=user.id, post_id=post.pk).exists()
+    except Exception:
+        return False
+
+
+@register.simple_tag
+def is_reposted(post, user):
+    """Return True if `user` has a plain (non-quote) repost of `post`.
+
+    Usage: {% is_reposted post request.user as reposted %}
+    """
+    try:
+        if not user or user.is_anonymous:
+            return False
+        state = _viewer_state(post, user)
+        if state is not None:
+            return post.pk in state.reposted
+        return post.reposts.filter(author_id=user.id, is_quote=False).exists()
+    except Exception:
+        return False
+
+
+@register.simple_tag
+def has_voted(post, user):
+    """Return True if `user` has voted in the poll attached to `post`.
+
+    Usage: {% has_voted post request.user as voted %}
+    """
+    try:
+        if not user or user.is_anonymous:
+            return False
+        state = _viewer_state(post, user)
+        if state is not None:
+            return post.pk in state.votes
+        return post.poll_votes.filter(user_id=user.id).exists()
+    except Exception:
+        return False
+
 @register.filter(name='is_liked_by')
 def is_liked_by(comment, user):
     """
@@ -0,0 +1,180 @@
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from core.models import Conversation, ConversationMember, ConversationMessage
+import json
+
+
+class ConversationInboxTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='alice', password='pass')
+        self.client.force_login(self.user)
+
+    def make_conversation(self, username, messages=()):
+        other = User.objects.create_user(username=username, password='pass')
+        conversation = Conversation.objects.create()
+        conversation.participants.add(self.user, other)
+        for sender, content in messages:
+            ConversationMessage.objects.create(
+                conversation=conversation, sender=self.user if sender == 'me' else other, content=content
+            )
+        conversation.save()  # bump updated_at like send_message does
+        return conversation, other
+
+    def test_inbox_row_contents(self):
+        conversation, other = self.make_conversation('bob', [('me', 'Hi'), ('them', 'Hey'), ('them', 'You there?')])
+        data = json.loads(self.client.get('/api/conversations/').content)
+        self.assertTrue(data['success'])
+        row = data['conversations'][0]
+        self.assertEqual(row['id'], conversation.id)
+        self.assertEqual(row['other_user_id'], other.id)
+        self.assertEqual(row['name'], 'bob')
+        self.assertEqual(row['last_message']['content'], 'You there?')
+        self.assertFalse(row['last_message']['is_own'])
+        self.assertEqual(row['unread_count'], 2)
+
+    def test_empty_conversation(self):
+        self.make_conversation('bob')
+        row = json.loads(self.client.get('/api/conversations/').content)['conversations'][0]
+        self.assertEqual(row['last_message']['content'], 'No messages yet')
+        self.assertEqual(row['unread_count'], 0)
+
+    def test_cursor_pagination_walks_every_conversation_once(self):
+        created = [self.make_conversation(f'user{i}', [('them', 'Hi')])[0].id for i in range(5)]
+        seen, cursor = [], None
+        while True:
+            url = '/api/conversations/?limit=2' + (f'&cursor={cursor}' if cursor else '')
+            data = json.loads(self.client.get(url).content)
+            seen += [row['id'] for row in data['conversations']]
+            cursor = data['pagination']['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, list(reversed(created)))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/conversations/?cursor=garbage')
+        self.assertEqual(response.status_code, 400)
+
+
+class MessageHistoryTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='alice', password='pass')
+        self.other = User.objects.create_user(username='bob', password='pass')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.user, self.other)
+        self.messages = [
+            ConversationMessage.objects.create(conversation=self.conversation, sender=self.other, content=f'm{i}')
+            for i in range(7)
+        ]
+        self.client.force_login(self.user)
+        self.url = f'/api/conversations/{self.conversation.id}/messages/'
+
+    def get(self, query=''):
+        return json.loads(self.client.get(self.url + query).content)
+
+    def test_newest_page_then_older_pages(self):
+        data = self.get('?limit=3')
+        self.assertEqual([m['content'] for m in data['messages']], ['m4', 'm5', 'm6'])
+        self.assertTrue(data['pagination']['has_older'])
+
+        older = self.get(f"?limit=3&before={data['pagination']['before']}")
+        self.assertEqual([m['content'] for m in older['messages']], ['m1', 'm2', 'm3'])
+        oldest = self.get(f"?limit=3&before={older['pagination']['before']}")
+        self.assertEqual([m['content'] for m in oldest['messages']], ['m0'])
+        self.assertFalse(oldest['pagination']['has_older'])
+
+    def test_after_returns_only_new_messages(self):
+        last_id = self.get()['pagination']['last_id']
+        self.assertEqual(self.get(f'?after={last_id}')['messages'], [])
+
+        ConversationMessage.objects.create(conversation=self.conversation, sender=self.other, content='new')
+        data = self.get(f'?after={last_id}')
+        self.assertEqual([m['content'] for m in data['messages']], ['new'])
+        self.assertEqual(data['messages'][0]['sender']['username'], 'bob')
+
+    def test_reading_moves_the_watermark_to_the_newest_delivered_message(self):
+        member = ConversationMember.objects.get(conversation=self.conversation, user=self.user)
+        self.assertEqual(member.unread_count, 7)
+
+        last_id = self.get('?limit=3')['pagination']['last_id']
+        ConversationMessage.objects.create(conversation=self.conversation, sender=self.other, content='late')
+        member.refresh_from_db()
+        self.assertEqual((member.last_read_message_id, member.unread_count), (last_id, 1))
+
+        self.get(f'?after={last_id}')
+        member.refresh_from_db()
+        self.assertEqual(member.unread_count, 0)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(self.url + '?after=abc').status_code, 400)
+
+
+class ReadWatermarkTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.alice = User.objects.create_user(username='alice', password='pass')
+        self.bob = User.objects.create_user(username='bob', password='pass')
+        self.carol = User.objects.create_user(username='carol', password='pass')
+        self.group = Conversation.objects.create(is_group=True, group_name='Trio')
+        self.group.participants.add(self.alice, self.bob, self.carol)
+        self.client.force_login(self.alice)
+
+    def member(self, user):
+        return ConversationMember.objects.get(conversation=self.group, user=user)
+
+    def send(self, sender, content='hi'):
+        return ConversationMessage.objects.create(conversation=self.group, sender=sender, content=content)
+
+    def test_each_participant_has_their_own_read_state(self):
+        first = self.send(self.alice)
+        self.send(self.bob)
+        self.assertEqual(self.member(self.alice).unread_count, 1)
+        # Replying implies bob has caught up
+        self.assertEqual(self.member(self.bob).unread_count, 0)
+        self.assertEqual(self.member(self.carol).unread_count, 2)
+
+        self.client.post(f'/api/conversations/{self.group.id}/mark-read/')
+        self.assertEqual(self.member(self.alice).unread_count, 0)
+        self.assertEqual(self.member(self.carol).unread_count, 2)
+
+        # Alice's message is read by bob (he replied) but not yet by carol
+        data = json.loads(self.client.get(f'/api/conversations/{self.group.id}/messages/').content)
+        self.assertEqual(data['messages'][0]['id'], first.id)
+        self.assertFalse(data['messages'][0]['is_read'])
+
+    def test_mark_read_is_a_single_write(self):
+        self.send(self.bob)
+        self.client.get('/api/messages/unread-count/')
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(f'/api/conversations/{self.group.id}/mark-read/')
+        writes = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "core_conversation')]
+        self.assertEqual(len(writes), 1)
+
+    def test_unread_counters_endpoints(self):
+        self.send(self.bob)
+        self.send(self.carol)
+        data = json.loads(self.client.get('/api/messages/unread-count/').content)
+        self.assertEqual((data['total_unread'], data['unique_senders']), (2, 1))
+        data = json.loads(self.client.get('/api/messages/unread-persons-count/').content)
+        self.assertEqual(data['unread_persons_count'], 1)
+
+    def test_mark_message_unread_and_membership_changes(self):
+        message = self.send(self.bob)
+        self.send(self.carol)
+        self.client.post(f'/api/conversations/{self.group.id}/mark-read/')
+        self.client.post(f'/api/messages/{message.id}/mark-unread/')
+        self.assertEqual(self.member(self.alice).unread_count, 2)
+
+        self.group.participants.remove(self.carol)
+        self.assertFalse(ConversationMember.objects.filter(user=self.carol).exists())
+        dave = User.objects.create_user(username='dave', password='pass')
+        dave.conversations.add(self.group)
+        self.assertEqual(self.member(dave).unread_count, 0)
+
+    def test_deleting_an_unread_message_decrements(self):
+        message = self.send(self.bob)
+        message.delete()
+        self.assertEqual(self.member(self.alice).unread_count, 0)
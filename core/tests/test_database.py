@@ -0,0 +1,59 @@
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from core import db
+from core.models import Like, Post
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite profile')
+class SQLiteProfileTests(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_are_applied_on_connect(self):
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('temp_store'), 2)  # MEMORY
+        self.assertEqual(self.pragma('cache_size'), -20000)
+
+    def test_transactions_take_the_write_lock_up_front(self):
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+class SQLiteBenchTests(SimpleTestCase):
+    def test_bench_reports_both_profiles(self):
+        out = StringIO()
+        call_command('sqlite_bench', workers=2, seconds=0.2, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines[2:]], ['default', 'production'])
+
+
+class InsertIgnoreTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='fan', password='pass')
+        self.post = Post.objects.create(author=self.user, content='Hello')
+
+    def test_second_insert_is_ignored(self):
+        like, created = db.insert_ignore(Like, user=self.user, post=self.post)
+        self.assertTrue(created)
+        self.assertEqual(Like.objects.get().pk, like.pk)
+        self.assertEqual(db.insert_ignore(Like, user=self.user, post=self.post), (None, False))
+        self.assertEqual(Like.objects.count(), 1)
+
+    def test_signals_fire_for_new_rows_only(self):
+        db.insert_ignore(Like, user=self.user, post=self.post)
+        db.insert_ignore(Like, user=self.user, post=self.post)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+    def test_toggle_needs_no_savepoint_when_supported(self):
+        if not connection.features.supports_ignore_conflicts:
+            self.skipTest('backend falls back to get_or_create')
+        with self.assertNumQueries(3):  # INSERT ... ON CONFLICT, re-select, likes_count update
+            db.insert_ignore(Like, user=self.user, post=self.post)
@@ -0,0 +1,62 @@
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from core.models import Post
+import json
+
+
+class FeedCursorPaginationTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='alice', password='pass')
+        now = timezone.now()
+        # Several posts share a timestamp to exercise the id tie-breaker
+        self.posts = [
+            Post.objects.create(author=self.user, content=f'Post {i}', created_at=now.replace(microsecond=0) - timezone.timedelta(seconds=i // 3))
+            for i in range(23)
+        ]
+        self.client.force_login(self.user)
+
+    def _walk(self, url, next_cursor=lambda data: data['pagination']['next_cursor']):
+        seen, cursor = [], None
+        while True:
+            res = self.client.get(url, {'cursor': cursor} if cursor else {})
+            data = json.loads(res.content)
+            seen.extend(p['id'] for p in data['posts'])
+            cursor = next_cursor(data)
+            if not cursor:
+                return seen
+
+    def test_post_list_api_walks_every_post_once(self):
+        seen = self._walk('/api/posts/')
+        self.assertEqual(len(seen), 23)
+        self.assertEqual(len(set(seen)), 23)
+
+    def test_load_more_and_user_posts_accept_cursor(self):
+        seen = self._walk('/api/load-more-posts/', lambda data: data['next_cursor'])
+        self.assertEqual(sorted(seen), sorted(p.id for p in self.posts))
+        seen = self._walk(f'/api/user-posts/{self.user.id}/', lambda data: data['next_cursor'])
+        self.assertEqual(len(set(seen)), 23)
+
+    def test_new_posts_do_not_shift_pages(self):
+        first = json.loads(self.client.get('/api/posts/').content)
+        Post.objects.create(author=self.user, content='Fresh')
+        second = json.loads(self.client.get('/api/posts/', {'cursor': first['pagination']['next_cursor']}).content)
+        first_ids = {p['id'] for p in first['posts']}
+        self.assertFalse(first_ids & {p['id'] for p in second['posts']})
+        self.assertEqual(len(second['posts']), 10)
+
+    def test_no_count_query_by_default(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = json.loads(self.client.get('/api/posts/').content)
+        self.assertNotIn('total_posts', data['pagination'])
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql']])
+
+        data = json.loads(self.client.get('/api/posts/', {'include_total': '1'}).content)
+        self.assertEqual(data['pagination']['total_posts'], 23)
+
+    def test_invalid_cursor_rejected(self):
+        res = self.client.get('/api/posts/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(res.status_code, 400)
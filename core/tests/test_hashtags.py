@@ -0,0 +1,156 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.template import Context, Template
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from core.models import Hashtag, HashtagBucket, Job, Notification, Post
+from core import hashtags, jobs
+import json
+
+
+class ExtractionTests(SimpleTestCase):
+    def test_hashtags(self):
+        text = 'Loving #Django and #python! #django again, not an#anchor or &#39; or ##double'
+        self.assertEqual(hashtags.extract_hashtags(text), ['django', 'python'])
+
+    def test_mentions(self):
+        text = 'Thanks @alice, @bob.smith. and me@example.com (@carol)'
+        self.assertEqual(hashtags.extract_mentions(text), ['alice', 'bob.smith', 'carol'])
+
+    def test_linkify_escapes_text_and_links_tags(self):
+        rendered = Template('{% load mention_tags %}{{ text|linkify }}').render(
+            Context({'text': '<b>hi</b> #Mytro @alice.'})
+        )
+        self.assertEqual(
+            rendered,
+            '&lt;b&gt;hi&lt;/b&gt; <a href="/hashtag/mytro/">#Mytro</a> <a href="/profile/alice/">@alice</a>.'
+        )
+
+
+@override_settings(JOBS_INLINE=True)
+class HashtagPipelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', password='pass')
+        self.alice = User.objects.create_user(username='alice', password='pass')
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def tags(self, post):
+        return sorted(post.hashtags.values_list('name', flat=True))
+
+    def test_create_links_tags_counts_uses_and_notifies_mentions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(author=self.author, content='#Mytro launch with @alice #django')
+        self.assertEqual(self.tags(post), ['django', 'mytro'])
+        self.assertEqual(list(post.mentions.all()), [self.alice])
+        self.assertEqual(Hashtag.objects.get(name='mytro').usage_count, 1)
+        self.assertEqual(HashtagBucket.objects.get(hashtag__name='mytro').count, 1)
+        self.assertTrue(Notification.objects.filter(recipient=self.alice, notification_type='mention').exists())
+
+    def test_reposts_only_count_the_quote(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(author=self.author, content='#mytro with @alice')
+        bob = User.objects.create_user(username='bob', password='pass')
+        self.client.force_login(bob)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/posts/{post.id}/repost/', data='{}', content_type='application/json')
+            self.client.post(f'/api/posts/{post.id}/repost/', content_type='application/json',
+                             data=json.dumps({'is_quote': True, 'quote_text': 'Agreed #django'}))
+        repost, quote = Post.objects.filter(repost_parent=post).order_by('id')
+        self.assertEqual((self.tags(repost), list(repost.mentions.all())), ([], []))
+        self.assertEqual((self.tags(quote), list(quote.mentions.all())), (['django'], []))
+        self.assertEqual(dict(Hashtag.objects.values_list('name', 'usage_count')), {'mytro': 1, 'django': 1})
+        self.assertEqual(Notification.objects.filter(recipient=self.alice, notification_type='mention').count(), 1)
+
+    def test_edit_diffs_links(self):
+        post = Post.objects.create(author=self.author, content='#one #two')
+        post.content = '#two #three'
+        post.save()
+        self.assertEqual(self.tags(post), ['three', 'two'])
+        counts = dict(Hashtag.objects.values_list('name', 'usage_count'))
+        self.assertEqual(counts, {'one': 0, 'two': 1, 'three': 1})
+
+    def test_create_cost_does_not_grow_with_tag_count(self):
+        def cost(content):
+            with CaptureQueriesContext(connection) as queries:
+                Post.objects.create(author=self.author, content=content)
+            return len(queries)
+        cost('warm up per-process caches')
+        self.assertEqual(cost('#a1 #a2'), cost(' '.join(f'#b{i}' for i in range(30))))
+
+    def test_delete_releases_uses(self):
+        post = Post.objects.create(author=self.author, content='#gone')
+        post.delete()
+        self.assertEqual(Hashtag.objects.get(name='gone').usage_count, 0)
+
+    def test_trending_decays_with_age_and_is_served_from_cache(self):
+        now = timezone.now()
+        Post.objects.create(author=self.author, content='#old')
+        Post.objects.create(author=self.author, content='#fresh')
+        HashtagBucket.objects.filter(hashtag__name='old').update(
+            count=3, bucket_start=hashtags.bucket_start(now) - timedelta(hours=12)
+        )
+        trending = hashtags.roll_up(now)
+        # 3 uses 12h ago (two half-lives) weigh 0.75 against 1 use now
+        self.assertEqual([entry['name'] for entry in trending], ['fresh', 'old'])
+        self.assertEqual(trending[1]['count'], 3)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/trending-hashtags/')
+        self.assertEqual([tag['tag'] for tag in json.loads(response.content)['hashtags']], ['fresh', 'old'])
+        self.assertFalse([q for q in queries.captured_queries if 'hashtag' in q['sql']])
+
+        # A cold cache serves nothing until the next roll-up, instead of rolling up in the request
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(hashtags.trending(), [])
+        self.assertFalse([q for q in queries.captured_queries if 'hashtag' in q['sql']])
+
+        HashtagBucket.objects.filter(hashtag__name='old').update(
+            bucket_start=hashtags.bucket_start(now) - hashtags.TRENDING_WINDOW
+        )
+        self.assertEqual([entry['name'] for entry in hashtags.roll_up(now)], ['fresh'])
+        self.assertFalse(HashtagBucket.objects.filter(hashtag__name='old').exists())
+
+    @override_settings(JOBS_INLINE=False)
+    def test_roll_up_job_queues_the_next_slot(self):
+        Post.objects.create(author=self.author, content='#mytro')
+        hashtags.schedule_roll_up()
+        hashtags.schedule_roll_up()
+        job = Job.objects.get(task='core.hashtags.roll_up_job')
+        self.assertLessEqual(job.run_at - timezone.now(), hashtags.ROLLUP_INTERVAL)
+
+        with mock.patch('django.utils.timezone.now', return_value=job.run_at):
+            jobs.work(burst=True)
+        self.assertEqual([entry['name'] for entry in hashtags.trending()], ['mytro'])
+        following = Job.objects.get(task='core.hashtags.roll_up_job', status=Job.QUEUED)
+        self.assertAlmostEqual(following.run_at, job.run_at + hashtags.ROLLUP_INTERVAL, delta=timedelta(seconds=1))
+
+    def test_hashtag_page(self):
+        Post.objects.create(author=self.alice, content='Shipping #Mytro today')
+        response = self.client.get('/hashtag/MYTRO/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([post.content for post in response.context['posts']], ['Shipping #Mytro today'])
+        self.assertEqual(response.context['post_count'], 1)
+
+        response = self.client.get('/hashtag/nothing/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['posts'], [])
+
+    def test_reindex_command_backfills_without_notifying(self):
+        post = Post.objects.create(author=self.author, content='plain')
+        Post.objects.filter(pk=post.pk).update(content='#late @alice')
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reindex_hashtags', stdout=out)
+        self.assertEqual(self.tags(post), ['late'])
+        self.assertEqual(list(post.mentions.all()), [self.alice])
+        self.assertFalse(Notification.objects.exists())
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageFilter
+from core.models import Post
+from core import images
+import json
+
+ORIENTATION = 0x0112
+GPS_INFO = 0x8825
+
+
+def photo(width, height, rotated=False):
+    """A JPEG with camera-like noise and EXIF, optionally stored sideways (orientation 6)."""
+    noise = Image.effect_noise((width, height), 40).convert('RGB')
+    gradient = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    image = Image.blend(noise, gradient, 0.6).filter(ImageFilter.GaussianBlur(1))
+    exif = Image.Exif()
+    exif[ORIENTATION] = 6 if rotated else 1
+    exif[GPS_INFO] = {1: 'N', 2: (26.0, 55.0, 0.0)}
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=95, exif=exif)
+    return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(JOBS_INLINE=True)
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='alice', password='pass')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def open_derived(self, name, size, fmt):
+        with default_storage.open(images.derived_key(name, size, fmt)) as file:
+            image = Image.open(BytesIO(file.read()))
+            image.load()
+        return image
+
+    def test_render_applies_orientation_strips_exif_and_never_upscales(self):
+        name = default_storage.save('posts/photo.jpg', photo(1600, 1200, rotated=True))
+        keys = images.render(name, images.PHOTO_SIZES)
+        self.assertEqual(len(keys), len(images.PHOTO_SIZES) * len(images.FORMATS))
+
+        for fmt in images.FORMATS:
+            feed = self.open_derived(name, 'feed', fmt)
+            # Stored sideways: the derivative is upright and portrait
+            self.assertEqual(feed.size, (810, 1080))
+            self.assertFalse(feed.getexif())
+            self.assertEqual(self.open_derived(name, 'full', fmt).size, (1200, 1600))
+            self.assertEqual(self.open_derived(name, 'thumb', fmt).size, (240, 320))
+
+    def test_upload_renders_on_commit_and_feed_payload_uses_small_derivatives(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(author=self.user, content='Sunset', image=photo(3000, 2000))
+        name = post.image.name
+        for size in images.PHOTO_SIZES:
+            for fmt in images.FORMATS:
+                self.assertTrue(default_storage.exists(images.derived_key(name, size, fmt)))
+
+        data = json.loads(self.client.get('/api/posts/').content)['posts'][0]
+        self.assertEqual(data['image'], images.url(name, 'feed'))
+        self.assertEqual(data['image_original'], post.image.url)
+        self.assertTrue(data['image_srcset'].endswith(f"{images.url(name, 'full')} 2048w"))
+        self.assertEqual(set(data['image_sources']), {images.ENCODERS[fmt][2] for fmt in images.FORMATS})
+        self.assertEqual(data['author']['avatar'], images.url(self.user.profile.profile_pic.name, 'avatar'))
+
+        feed_bytes = default_storage.size(images.derived_key(name, 'feed', images.FALLBACK_FORMAT))
+        self.assertLess(feed_bytes * 10, post.image.size)
+
+    def test_unrelated_saves_do_not_queue_work(self):
+        post = Post.objects.create(author=self.user, content='Text only')
+        with self.captureOnCommitCallbacks() as callbacks:
+            post.save()
+        self.assertEqual(callbacks, [])
+
+    def test_missing_derivatives_are_rendered_on_request(self):
+        name = default_storage.save('posts/old.jpg', photo(800, 600))
+        response = self.client.get(images.url(name, 'thumb'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(Image.open(BytesIO(b''.join(response.streaming_content))).size, (320, 240))
+        self.assertTrue(default_storage.exists(images.derived_key(name, 'thumb', 'webp')))
+
+    def test_rerendering_replaces_derivatives_in_place(self):
+        name = default_storage.save('posts/old.jpg', photo(400, 300))
+        images.render(name, ['thumb'])
+        images.render(name, ['thumb'])
+        directory = os.path.dirname(default_storage.path(images.derived_key(name, 'thumb', 'webp')))
+        self.assertEqual(sorted(os.listdir(directory)), sorted(
+            os.path.basename(images.derived_key(name, 'thumb', fmt)) for fmt in images.FORMATS
+        ))
+
+    def test_decompression_bombs_are_not_found(self):
+        name = default_storage.save('posts/bomb.jpg', photo(200, 200))
+        with mock.patch('PIL.Image.MAX_IMAGE_PIXELS', 1000):
+            self.assertEqual(self.client.get(images.url(name, 'thumb')).status_code, 404)
+        self.assertFalse(default_storage.exists(images.derived_key(name, 'thumb', 'webp')))
+
+    def test_derived_view_only_serves_known_uploads(self):
+        default_storage.save('posts/old.jpg', photo(100, 100))
+        default_storage.save('private/secret.jpg', photo(100, 100))
+        for path in [
+            'derived/huge/posts/old.jpg.webp',
+            'derived/thumb/posts/old.jpg.gif',
+            'derived/thumb/private/secret.jpg.webp',
+            'derived/thumb/posts/../private/secret.jpg.webp',
+            'derived/thumb/posts/missing.jpg.webp',
+        ]:
+            self.assertEqual(self.client.get(f'/media/{path}').status_code, 404, path)
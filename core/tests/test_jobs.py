@@ -0,0 +1,118 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.utils import timezone
+from core.models import Job
+from core import jobs
+
+calls = []
+
+
+@jobs.task()
+def record(value):
+    calls.append(value)
+
+
+@jobs.task(priority=5)
+def urgent(value):
+    calls.append(value)
+
+
+@jobs.task(batch=3)
+def record_batch(items):
+    calls.append([item['value'] for item in items])
+
+
+@jobs.task(max_attempts=2)
+def flaky(value):
+    raise RuntimeError(f'boom {value}')
+
+
+@override_settings(JOBS_INLINE=False)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_idempotency_keys_queue_once(self):
+        first = jobs.enqueue(record, key='welcome:1', value=1)
+        second = jobs.enqueue(record, key='welcome:1', value=2)
+        self.assertIsNotNone(first)
+        self.assertIsNone(second)
+        self.assertEqual(list(Job.objects.values_list('kwargs', flat=True)), [{'value': 1}])
+
+    def test_priority_then_age_and_batches_of_one_task(self):
+        jobs.enqueue(record, value='old')
+        for value in range(4):
+            jobs.enqueue(record_batch, value=value)
+        jobs.enqueue(urgent, value='urgent')
+        jobs.enqueue(record, value='later', delay=timedelta(hours=1))
+
+        self.assertEqual(jobs.work(burst=True), 6)
+        self.assertEqual(calls, ['urgent', 'old', [0, 1, 2], [3]])
+        self.assertEqual(Job.objects.get(status=Job.QUEUED).kwargs, {'value': 'later'})
+
+    def test_failures_back_off_then_fail_and_release_their_key(self):
+        job = jobs.enqueue(flaky, key='flaky:1', value=1)
+        self.assertEqual(jobs.work(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=jobs.BACKOFF / 2 - 1))
+        self.assertIn('RuntimeError: boom 1', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.idempotency_key), (Job.FAILED, 2, None))
+        self.assertEqual(jobs.work(burst=True), 0)
+        self.assertIsNotNone(jobs.enqueue(flaky, key='flaky:1', value=1))
+
+    def test_backoff_grows_up_to_a_cap(self):
+        with mock.patch('core.jobs.random.uniform', lambda low, high: high):
+            self.assertEqual(jobs.backoff(1), timedelta(seconds=jobs.BACKOFF))
+            self.assertEqual(jobs.backoff(3), timedelta(seconds=jobs.BACKOFF * 4))
+            self.assertEqual(jobs.backoff(30), timedelta(seconds=jobs.MAX_BACKOFF))
+
+    def test_expired_leases_are_requeued(self):
+        jobs.enqueue(record, value=1, delay=-jobs.LEASE - timedelta(minutes=1))
+        job, = jobs.claim('dead-worker', now=timezone.now() - jobs.LEASE)
+        self.assertEqual(jobs.claim('other-worker'), [])
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(jobs.work(burst=True), 1)
+        self.assertEqual(calls, [1])
+
+    def test_rolled_back_work_is_never_queued(self):
+        try:
+            with transaction.atomic():
+                jobs.enqueue(record, value=1)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOBS_INLINE=True)
+    def test_inline_mode_runs_jobs_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.enqueue(record, value=1)
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, [1])
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    @override_settings(CHANNEL_LAYERS={}, CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_run_workers_burst(self):
+        jobs.enqueue(record, value=1)
+        out = StringIO()
+        call_command('run_workers', '--burst', stdout=out)
+        self.assertIn('Ran 1 jobs', out.getvalue())
+        self.assertEqual(calls, [1])
+        # Recurring jobs are queued for their next slot
+        self.assertTrue(Job.objects.filter(task='core.hashtags.roll_up_job', status=Job.QUEUED).exists())
+
+    def test_run_workers_refuses_process_local_backends(self):
+        jobs.enqueue(record, value=1)
+        with self.assertRaisesMessage(CommandError, 'the cache'):
+            call_command('run_workers', '--burst', stdout=StringIO())
+        self.assertEqual(calls, [])
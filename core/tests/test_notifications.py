@@ -0,0 +1,161 @@
+from unittest import mock
+
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from core.models import Like, Message, Notification, Post
+from core import notifications, views
+import json
+
+
+@override_settings(JOBS_INLINE=True)
+class NotificationPipelineTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='pass')
+        self.fan = User.objects.create_user(username='fan', password='pass')
+        self.post = Post.objects.create(author=self.author, content='Hello')
+        self.client = Client()
+        self.client.force_login(self.fan)
+
+    def test_like_and_unlike_go_through_the_pipeline(self):
+        url = f'/api/posts/{self.post.id}/like/'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url)
+        notification = Notification.objects.get()
+        self.assertEqual((notification.recipient, notification.sender), (self.author, self.fan))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_nothing_is_written_inside_the_request(self):
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertFalse(Notification.objects.exists())
+
+    def test_bursts_collapse_to_their_final_state(self):
+        key = (self.author.id, self.fan.id, 'like', self.post.id)
+        data = {'verb': 'liked your post', 'target_comment_id': None}
+        notifications.process([('add', key, data), ('remove', key, None), ('add', key, data)])
+        notifications.process([('add', key, data)])
+        self.assertEqual(Notification.objects.count(), 1)
+
+    def test_out_of_order_events_settle_on_the_current_state(self):
+        key = [self.author.id, self.fan.id, 'like', self.post.id]
+        add = {'op': 'add', 'target': key, 'data': {'verb': 'liked your post', 'target_comment_id': None}}
+        remove = {'op': 'remove', 'target': key, 'data': None}
+        like = Like.objects.create(user=self.fan, post=self.post)
+        # A retried unlike from before the current like runs last
+        notifications.deliver([add, remove])
+        self.assertEqual(Notification.objects.count(), 1)
+
+        like.delete()
+        # The like went again, but its add event was applied after the removal
+        notifications.deliver([remove, add])
+        self.assertFalse(Notification.objects.exists())
+
+    def test_summaries(self):
+        self.assertEqual(notifications.summarize(['ann'], 'liked your post'), 'ann liked your post')
+        self.assertEqual(notifications.summarize(['ann', 'bo'], 'liked your post'), 'ann and bo liked your post')
+        self.assertEqual(
+            notifications.summarize(['ann', 'bo', 'cy'], 'liked your post', total=13),
+            'ann and 12 others liked your post'
+        )
+
+    @mock.patch('core.notifications.BATCH_SIZE', 2)
+    def test_broadcast_writes_in_bulk_batches(self):
+        admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        for i in range(3):
+            User.objects.create_user(username=f'user{i}', password='pass')
+
+        def send(view, payload):
+            request = RequestFactory().post('/', json.dumps(payload), content_type='application/json')
+            request.user = admin
+            return view(request)
+
+        with CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = send(views.admin_send_notification, {'user_ids': ['all'], 'message': 'Hi'})
+        self.assertEqual(response.status_code, 200)
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "core_notification"')]
+        # 5 recipients (everyone but the sender) in chunks of 2
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(Notification.objects.filter(verb='Admin: Hi').count(), 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            send(views.admin_send_message, {'user_ids': [self.fan.id], 'message': 'Hi'})
+        self.assertEqual(Message.objects.get().recipient, self.fan)
+
+
+@override_settings(JOBS_INLINE=True)
+class NotificationApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', password='pass')
+        self.fans = [User.objects.create_user(username=f'fan{i}', password='pass') for i in range(5)]
+        self.post = Post.objects.create(author=self.author, content='Hello')
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def like(self, fan, post=None):
+        key = (self.author.id, fan.id, 'like', (post or self.post).id)
+        notifications.process([('add', key, {'verb': 'liked your post', 'target_comment_id': None})])
+
+    def test_groups_by_type_and_post_with_recent_actors(self):
+        for fan in self.fans:
+            self.like(fan)
+        Notification.objects.create(recipient=self.author, sender=self.fans[0],
+                                    notification_type='follow', verb='started following you')
+
+        data = json.loads(self.client.get('/api/notifications/').content)
+        self.assertEqual(data['unread_count'], 6)
+        follow, likes = data['notifications']
+        self.assertEqual(follow['type'], 'follow')
+        self.assertEqual(likes['actors_count'], 5)
+        self.assertEqual([a['username'] for a in likes['actors']], ['fan4', 'fan3', 'fan2'])
+        self.assertEqual(likes['message'], 'fan4 and 4 others liked your post')
+
+    def test_cursor_paging_over_groups(self):
+        posts = [Post.objects.create(author=self.author, content=f'p{i}') for i in range(3)]
+        for post in posts:
+            self.like(self.fans[0], post)
+
+        first = json.loads(self.client.get('/api/notifications/?limit=2').content)
+        self.assertEqual([g['post_id'] for g in first['notifications']], [posts[2].id, posts[1].id])
+        cursor = first['pagination']['next_cursor']
+        second = json.loads(self.client.get(f'/api/notifications/?limit=2&cursor={cursor}').content)
+        self.assertEqual([g['post_id'] for g in second['notifications']], [posts[0].id])
+        self.assertFalse(second['pagination']['has_next'])
+
+        response = self.client.get('/api/notifications/?cursor=garbage')
+        self.assertEqual(response.status_code, 400)
+
+    def test_count_endpoint_is_served_from_cache(self):
+        self.like(self.fans[0])
+        self.client.get('/api/notifications/unread_count/')
+        with CaptureQueriesContext(connection) as warm:
+            self.client.get('/api/notifications/unread_count/')
+        self.assertFalse([q for q in warm.captured_queries if 'core_notification' in q['sql']])
+
+        self.like(self.fans[1])
+        Notification.objects.create(recipient=self.author, sender=self.fans[2],
+                                    notification_type='follow', verb='started following you')
+        data = json.loads(self.client.get('/api/notifications/unread_count/').content)
+        self.assertEqual(data['unread_count'], 3)
+
+    def test_mark_read_updates_the_counter(self):
+        for fan in self.fans[:3]:
+            self.like(fan)
+        Notification.objects.create(recipient=self.author, sender=self.fans[0],
+                                    notification_type='follow', verb='started following you')
+        self.assertEqual(notifications.unread_count(self.author.id), 4)
+
+        like = Notification.objects.filter(notification_type='like').first()
+        data = json.loads(self.client.post(f'/api/notifications/{like.id}/read/').content)
+        self.assertEqual(data['unread_count'], 1)
+        self.assertFalse(Notification.objects.filter(notification_type='like', is_read=False).exists())
+
+        self.client.post('/api/notifications/mark-all-read/')
+        self.assertEqual(cache.get(notifications._unread_key(self.author.id)), 0)
+        self.assertFalse(Notification.objects.filter(is_read=False).exists())
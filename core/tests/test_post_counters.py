@@ -0,0 +1,76 @@
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from core.models import Post, Comment, Share
+import json
+
+
+class PostCounterTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='alice', password='pass')
+        self.other = User.objects.create_user(username='bob', password='pass')
+        self.post = Post.objects.create(author=self.other, content='Hello world')
+        self.client.force_login(self.user)
+
+    def test_like_toggle_updates_counter(self):
+        res = self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(json.loads(res.content)['like_count'], 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+        res = self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(json.loads(res.content)['like_count'], 0)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+
+    def test_comment_reply_and_delete_update_counter(self):
+        self.client.post('/api/comments/add/', data=json.dumps({'post_id': self.post.id, 'comment': 'Hi'}),
+                         content_type='application/json')
+        parent = Comment.objects.get(post=self.post)
+        self.client.post(f'/api/comments/{parent.id}/reply/', data=json.dumps({'content': 'Reply'}),
+                         content_type='application/json')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 2)
+
+        # Deleting the parent cascades to the reply
+        self.client.post(f'/api/comments/{parent.id}/delete/')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_repost_and_share_update_counters(self):
+        self.client.post(f'/api/posts/{self.post.id}/repost/', data='{}', content_type='application/json')
+        Share.objects.create(user=self.user, post=self.post)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.repost_count, 1)
+        self.assertEqual(self.post.share_count, 1)
+
+        res = self.client.post(f'/api/posts/{self.post.id}/repost/', data='{}', content_type='application/json')
+        self.assertEqual(json.loads(res.content)['repost_count'], 0)
+
+    def test_stale_instance_save_keeps_counters(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        stale.content = 'Edited'
+        stale.save()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.content, 'Edited')
+        self.assertEqual(self.post.likes_count, 1)
+
+    def test_recount_command_repairs_drift(self):
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        Post.objects.filter(pk=self.post.pk).update(likes_count=42, comments_count=7)
+        call_command('recount_post_counters', stdout=open('/dev/null', 'w'))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_feed_reads_counts_without_extra_queries(self):
+        for i in range(5):
+            Post.objects.create(author=self.user, content=f'Post {i}')
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get('/api/load-more-posts/')
+        self.assertEqual(len(json.loads(res.content)['posts']), 5)
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql']])
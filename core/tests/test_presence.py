@@ -0,0 +1,67 @@
+from unittest import mock
+
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from core.models import Conversation, Follow
+from core import presence
+import json
+
+
+class PresenceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice', password='pass')
+        self.bob = User.objects.create_user(username='bob', password='pass')
+        self.carol = User.objects.create_user(username='carol', password='pass')
+        self.client = Client()
+        self.client.force_login(self.alice)
+
+    def test_requests_are_heartbeats(self):
+        bob = Client()
+        bob.force_login(self.bob)
+        bob.get('/api/presence/')
+
+        data = json.loads(self.client.get(f'/api/presence/?user_ids={self.bob.id},{self.carol.id}').content)
+        self.assertTrue(data['presence'][str(self.bob.id)]['is_online'])
+        self.assertIsNotNone(data['presence'][str(self.bob.id)]['last_seen'])
+        self.assertEqual(data['presence'][str(self.carol.id)], {'is_online': False, 'last_seen': None})
+
+        with mock.patch('core.presence.ONLINE_WINDOW', 0):
+            self.assertFalse(presence.is_online(self.bob.id))
+
+    def test_presence_never_writes_to_the_database(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(f'/api/presence/?user_ids={self.bob.id}')
+            self.client.get(f'/api/users/{self.bob.id}/online-status/')
+        writes = [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')) and 'django_session' not in q['sql']
+        ]
+        self.assertEqual(writes, [])
+
+    def test_online_friends_come_first(self):
+        for friend in (self.bob, self.carol):
+            Follow.objects.create(follower=self.alice, following=friend)
+            Follow.objects.create(follower=friend, following=self.alice)
+        presence.touch(self.carol.id)
+        data = json.loads(self.client.get('/api/online-users/').content)
+        self.assertEqual([u['id'] for u in data['online_users']], [self.carol.id, self.bob.id])
+        self.assertEqual(data['count'], 1)
+
+    def test_typing_state_is_recorded_for_members_only(self):
+        conversation = Conversation.objects.create()
+        conversation.participants.add(self.alice, self.bob)
+        body = json.dumps({'conversation_id': conversation.id})
+
+        self.client.post('/api/typing/start/', body, content_type='application/json')
+        self.assertEqual(presence.typing_user_ids(conversation.id), [self.alice.id])
+        self.client.post('/api/typing/stop/', body, content_type='application/json')
+        self.assertEqual(presence.typing_user_ids(conversation.id), [])
+
+        outsider = Client()
+        outsider.force_login(self.carol)
+        response = outsider.post('/api/typing/start/', body, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,77 @@
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from core.models import Post, Like, Comment, Follow, Conversation, ConversationMessage, Story
+
+
+class QueryBudgetTests(TestCase):
+    """Every list endpoint must cost a fixed number of queries, whatever the page size.
+
+    Budgets include the 5 queries each authenticated request spends on the
+    session (load, user lookup, and the SAVEPOINT/UPDATE/RELEASE from
+    SESSION_SAVE_EVERY_REQUEST).
+    """
+
+    BUDGETS = {
+        'post_list_api': ('/api/posts/', 11),
+        'load_more_posts': ('/api/load-more-posts/', 11),
+        'get_user_posts': ('/api/user-posts/{author}/', 11),
+        'get_liked_users': ('/api/posts/{post}/liked-users/', 7),
+        'get_comments': ('/api/comments/{post}/', 7),
+        'search_api': ('/api/search/?q=topic', 11),
+        'suggested_users': ('/api/suggested-users/', 6),
+        'feed_view': ('/feed/', 15),
+        'get_conversations': ('/api/conversations/', 8),
+        'get_messages': ('/api/conversations/{conversation}/messages/', 9),
+        'get_stories': ('/api/stories/', 6),
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.viewer = User.objects.create_user(username='viewer', password='pass')
+        self.author = User.objects.create_user(username='author', password='pass')
+        Follow.objects.create(follower=self.viewer, following=self.author)
+        self.post = Post.objects.create(author=self.author, content='First topic')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.viewer, self.author)
+        self.client.force_login(self.viewer)
+        self.grow(1)
+
+    def grow(self, n):
+        """Add n more of everything the endpoints list."""
+        offset = User.objects.count()
+        for i in range(n):
+            user = User.objects.create_user(username=f'user{offset + i}', password='pass')
+            Like.objects.create(user=user, post=self.post)
+            Comment.objects.create(user=user, post=self.post, content='Nice')
+            post = Post.objects.create(author=self.author, content=f'Another topic {i}')
+            Post.objects.create(author=user, content='Quoting topic', repost_parent=post, is_quote=True)
+            conversation = Conversation.objects.create()
+            conversation.participants.add(self.viewer, user)
+            ConversationMessage.objects.create(conversation=conversation, sender=user, content='Hi')
+            ConversationMessage.objects.create(conversation=self.conversation, sender=self.author, content='Hey')
+            Story.objects.create(user=user, text_content='Hello')
+            Story.objects.create(user=self.author, text_content='Hello')
+
+    def count(self, name):
+        url = self.BUDGETS[name][0].format(
+            author=self.author.id, post=self.post.id, conversation=self.conversation.id
+        )
+        # Warm per-user caches (e.g. suggestions) so we measure the steady state
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, 200, name)
+        return len(ctx.captured_queries)
+
+    def test_budgets_hold_as_pages_grow(self):
+        small = {name: self.count(name) for name in self.BUDGETS}
+        self.grow(8)
+        for name, (_, budget) in self.BUDGETS.items():
+            with self.subTest(endpoint=name):
+                large = self.count(name)
+                self.assertEqual(large, small[name])
+                self.assertLessEqual(large, budget)
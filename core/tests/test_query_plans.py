@@ -0,0 +1,126 @@
+import re
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from core.models import (
+    Comment, Conversation, ConversationMember, ConversationMessage, Follow, Like, Notification, PollVote, Post,
+    Profile, Story,
+)
+
+# "SCAN core_post" is a full table scan; "SCAN core_post USING INDEX ..." walks
+# an index in order and "SEARCH ..." is an index lookup, both fine.
+FULL_SCAN = re.compile(r'\bSCAN (\w+)(?: AS \w+)?$')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite-specific')
+class QueryPlanTests(TestCase):
+    """Every query a hot endpoint runs must be served by an index on a large fixture."""
+
+    ENDPOINTS = {
+        'post_list_api': '/api/posts/',
+        'load_more_posts': '/api/load-more-posts/',
+        'get_user_posts': '/api/user-posts/{author}/',
+        'get_liked_users': '/api/posts/{post}/liked-users/',
+        'get_comments': '/api/comments/{post}/',
+        'feed_view': '/feed/',
+        'get_conversations': '/api/conversations/',
+        'get_messages': '/api/conversations/{conversation}/messages/',
+        'notifications_api': '/api/notifications/',
+        'unread_notification_count': '/api/notifications/unread_count/',
+        'get_stories': '/api/stories/',
+        'get_user_stories': '/api/stories/user/{author}/',
+        'get_followers': '/api/followers/{author_name}/',
+        'get_following': '/api/following/{author_name}/',
+    }
+
+    # Tables an endpoint may scan on purpose, with the reason
+    ALLOWED_SCANS = {
+        # Small lookup tables read whole by design
+        'django_content_type': 'tiny',
+    }
+
+    USERS = 200
+    POSTS_PER_USER = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        users = User.objects.bulk_create([User(username=f'user{i}') for i in range(cls.USERS)])
+        Profile.objects.bulk_create([Profile(user=user) for user in users])
+        cls.viewer, cls.author = users[0], users[1]
+        Follow.objects.bulk_create([Follow(follower=cls.viewer, following=user) for user in users[1:50]] +
+                                   [Follow(follower=user, following=cls.author) for user in users[2:]])
+        posts = Post.objects.bulk_create([
+            Post(author=user, content=f'Post {i}', created_at=now - timedelta(minutes=i),
+                 post_type='poll' if i % 7 == 0 else 'text', poll_options=['a', 'b'] if i % 7 == 0 else None)
+            for user in users for i in range(cls.POSTS_PER_USER)
+        ])
+        cls.post = next(post for post in posts if post.author_id == cls.author.id)
+        Like.objects.bulk_create([Like(user=user, post=cls.post) for user in users])
+        Comment.objects.bulk_create([Comment(user=user, post=cls.post, content='Nice') for user in users])
+        PollVote.objects.bulk_create([PollVote(user=user, post=cls.post, option_index=0) for user in users])
+        Notification.objects.bulk_create([
+            Notification(recipient=cls.viewer, sender=user, verb='liked your post',
+                         target_post=posts[i % len(posts)], is_read=i % 3 == 0)
+            for i, user in enumerate(users[1:])
+        ])
+        Story.objects.bulk_create([
+            Story(user=user, text_content='Hi', expires_at=now + timedelta(hours=i % 48 - 24))
+            for i, user in enumerate(users)
+        ])
+        cls.conversation = Conversation.objects.create()
+        cls.conversation.participants.add(cls.viewer, cls.author)
+        ConversationMessage.objects.bulk_create([
+            ConversationMessage(conversation=cls.conversation, sender=cls.author, content=f'Hey {i}')
+            for i in range(200)
+        ])
+        for user in users[2:40]:
+            conversation = Conversation.objects.create()
+            conversation.participants.add(cls.viewer, user)
+            ConversationMessage.objects.create(conversation=conversation, sender=user, content='Hi')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.viewer)
+
+    def full_scans(self, sql):
+        tables = set(connection.introspection.table_names()) - set(self.ALLOWED_SCANS)
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            details = [row[-1] for row in cursor.fetchall()]
+        # Scans of subquery results (e.g. the window-function wrapper) are fine
+        return [detail for detail in details if (match := FULL_SCAN.search(detail)) and match.group(1) in tables]
+
+    def test_hot_endpoints_use_indexes(self):
+        for name, url in self.ENDPOINTS.items():
+            url = url.format(author=self.author.id, author_name=self.author.username, post=self.post.id,
+                             conversation=self.conversation.id)
+            with self.subTest(endpoint=name):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                for query in queries.captured_queries:
+                    sql = query['sql']
+                    if not sql.lstrip().upper().startswith('SELECT'):
+                        continue
+                    self.assertEqual(self.full_scans(sql), [], sql)
+
+    def test_unread_count_reads_only_the_index(self):
+        # The count behind ConversationMember.mark_read must range over the
+        # messages past the watermark without touching the table
+        first = self.conversation.messages.order_by('id').values_list('id', flat=True).first()
+        with CaptureQueriesContext(connection) as queries:
+            ConversationMember.mark_read(self.conversation.id, self.viewer.id, first)
+        [update] = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {update}')
+            details = [row[-1] for row in cursor.fetchall()]
+        self.assertTrue(any('USING COVERING INDEX convmsg_conv_unread_idx (conversation_id=? AND id>?)' in detail
+                            for detail in details), details)
@@ -0,0 +1,75 @@
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser, User
+from django.test import TransactionTestCase
+from core.consumers import FeedConsumer
+from core.models import Conversation, ConversationMessage, Like, Post
+from core import realtime
+
+
+class RealtimeTests(TransactionTestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='pass')
+        self.bob = User.objects.create_user(username='bob', password='pass')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.alice, self.bob)
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(FeedConsumer.as_asgi(), '/ws/feed/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    def test_anonymous_sockets_are_rejected(self):
+        async def scenario():
+            communicator, connected = await self.connect(AnonymousUser())
+            self.assertFalse(connected)
+        async_to_sync(scenario)()
+
+    def test_push_reaches_only_the_target_user(self):
+        async def scenario():
+            alice, _ = await self.connect(self.alice)
+            bob, _ = await self.connect(self.bob)
+            await sync_to_async(realtime._send)([self.alice.id], 'hello', {'n': 1})
+            self.assertEqual(await alice.receive_json_from(), {'type': 'hello', 'n': 1})
+            self.assertTrue(await bob.receive_nothing())
+            await alice.disconnect()
+            await bob.disconnect()
+        async_to_sync(scenario)()
+
+    def test_new_message_and_like_are_pushed_after_commit(self):
+        post = Post.objects.create(author=self.alice, content='Hello')
+
+        async def scenario():
+            alice, _ = await self.connect(self.alice)
+            await sync_to_async(ConversationMessage.objects.create)(
+                conversation=self.conversation, sender=self.bob, content='Hi'
+            )
+            event = await alice.receive_json_from()
+            self.assertEqual(event['type'], 'message.new')
+            self.assertEqual(event['message']['content'], 'Hi')
+
+            await sync_to_async(Like.objects.create)(user=self.bob, post=post)
+            event = await alice.receive_json_from()
+            self.assertEqual((event['type'], event['post_id'], event['likes_count']), ('post.liked', post.id, 1))
+            await alice.disconnect()
+        async_to_sync(scenario)()
+
+    def test_typing_is_relayed_to_other_members_only(self):
+        outsider = User.objects.create_user(username='carol', password='pass')
+
+        async def scenario():
+            alice, _ = await self.connect(self.alice)
+            bob, _ = await self.connect(self.bob)
+            carol, _ = await self.connect(outsider)
+            await alice.send_json_to({'type': 'typing', 'conversation_id': self.conversation.id})
+            event = await bob.receive_json_from()
+            self.assertEqual((event['type'], event['user_id'], event['is_typing']), ('typing', self.alice.id, True))
+            self.assertTrue(await alice.receive_nothing())
+
+            # Non-members can't spoof typing into the conversation
+            await carol.send_json_to({'type': 'typing', 'conversation_id': self.conversation.id})
+            self.assertTrue(await bob.receive_nothing())
+            for communicator in (alice, bob, carol):
+                await communicator.disconnect()
+        async_to_sync(scenario)()
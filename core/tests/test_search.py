@@ -0,0 +1,107 @@
+from io import StringIO
+from unittest import skipUnless
+
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from core.models import Conversation, ConversationMessage, Post
+from core import search, typeahead
+import json
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        typeahead.reset()
+        self.client = Client()
+        self.user = User.objects.create_user(username='alice', password='pass')
+        self.abhi = User.objects.create_user(username='abhimanyu', first_name='Abhimanyu',
+                                             last_name='Vaishnav', password='pass')
+        self.bob = User.objects.create_user(username='bob', password='pass')
+        self.client.force_login(self.user)
+
+    def test_posts_match_word_prefixes_and_rank_best_first(self):
+        weak = Post.objects.create(author=self.bob, content='Cooking tonight, then a long walk by the river')
+        strong = Post.objects.create(author=self.bob, content='Cooking cooking cooking!')
+        Post.objects.create(author=self.bob, content='Nothing to see here')
+
+        found = list(search.search_posts(Post.objects.all(), 'cook'))
+        self.assertEqual(found, [strong, weak])
+        self.assertEqual(list(search.search_posts(Post.objects.all(), 'cook riv')), [weak])
+
+    def test_index_follows_edits_bulk_writes_and_deletes(self):
+        post = Post.objects.create(author=self.bob, content='First draft')
+        Post.objects.filter(pk=post.pk).update(content='Final version')
+        self.assertFalse(search.search_posts(Post.objects.all(), 'draft').exists())
+        self.assertTrue(search.search_posts(Post.objects.all(), 'final').exists())
+
+        Post.objects.bulk_create([Post(author=self.bob, content='Bulk loaded')])
+        self.assertTrue(search.search_posts(Post.objects.all(), 'bulk').exists())
+
+        Post.objects.all().delete()
+        self.assertFalse(search.search_posts(Post.objects.all(), 'final').exists())
+
+    def test_users_match_names_and_bio(self):
+        self.bob.profile.bio = 'Photographer and traveller'
+        self.bob.profile.save()
+
+        users = search.search_users(User.objects.all(), 'abhi vai')
+        self.assertEqual(list(users), [self.abhi])
+        if connection.vendor == 'sqlite':
+            self.assertEqual(list(search.search_users(User.objects.all(), 'photo')), [self.bob])
+
+        self.abhi.username = 'mytro_admin'
+        self.abhi.first_name = ''
+        self.abhi.save()
+        self.assertFalse(search.search_users(User.objects.all(), 'abhi').exists())
+
+    def test_query_syntax_is_not_interpreted(self):
+        Post.objects.create(author=self.bob, content='Quotes "and" stars')
+        for query in ['"', 'and OR', 'NEAR(a b)', '*', 'col:stars', '-']:
+            list(search.search_posts(Post.objects.all(), query))
+        self.assertFalse(search.search_posts(Post.objects.all(), '!!').exists())
+
+    def test_search_api(self):
+        Post.objects.create(author=self.bob, content='Hello from Jaipur')
+        response = self.client.get('/api/search/', {'q': 'jaip'})
+        data = json.loads(response.content)
+        self.assertTrue(data['success'])
+        self.assertEqual([post['content'] for post in data['posts']], ['Hello from Jaipur'])
+
+        data = json.loads(self.client.get('/api/search/', {'q': 'abhim'}).content)
+        self.assertEqual([user['username'] for user in data['users']], ['abhimanyu'])
+
+    def test_search_users_excludes_the_viewer(self):
+        response = self.client.get('/api/search-users/', {'q': 'al'})
+        self.assertEqual(json.loads(response.content)['users'], [])
+
+    def test_search_messages_stays_inside_the_conversation(self):
+        conversation = Conversation.objects.create()
+        conversation.participants.add(self.user, self.bob)
+        other = Conversation.objects.create()
+        other.participants.add(self.abhi, self.bob)
+        ConversationMessage.objects.create(conversation=conversation, sender=self.bob, content='Lunch at noon?')
+        ConversationMessage.objects.create(conversation=other, sender=self.bob, content='Lunch tomorrow?')
+
+        response = self.client.get(f'/api/conversations/{conversation.id}/search/', {'q': 'lunch'})
+        data = json.loads(response.content)
+        self.assertEqual([message['content'] for message in data['results']], ['Lunch at noon?'])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'FTS5 index')
+class SearchIndexMaintenanceTests(TestCase):
+    def test_repair_restores_dropped_triggers_and_reindexes(self):
+        author = User.objects.create_user(username='writer', password='pass')
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER core_post_fts_insert')
+        Post.objects.create(author=author, content='Written while the trigger was gone')
+        self.assertFalse(search.search_posts(Post.objects.all(), 'trigger').exists())
+
+        self.assertTrue(search.repair(connection))
+        self.assertTrue(search.search_posts(Post.objects.all(), 'trigger').exists())
+        self.assertFalse(search.repair(connection))
+
+    def test_rebuild_command(self):
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Rebuilt the search index', out.getvalue())
@@ -0,0 +1,144 @@
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.utils import timezone
+from PIL import Image
+from core.models import MediaBlob, Post
+from core import images
+from core.storage import media_storage, reclaim
+
+
+def jpeg(color='teal', name='photo.jpg'):
+    buffer = BytesIO()
+    Image.new('RGB', (40, 30), color).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(JOBS_INLINE=True)
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='alice', password='pass')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def refcount(self, name):
+        return MediaBlob.objects.filter(name=name).values_list('refcount', flat=True).first()
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(directory, name), self.media)
+            for directory, _, names in os.walk(self.media) for name in names
+        )
+
+    def test_identical_bytes_are_stored_once(self):
+        first = Post.objects.create(author=self.user, content='Meme', image=jpeg(name='meme.jpg'))
+        second = Post.objects.create(author=self.user, content='Same meme', image=jpeg(name='copy.JPG'))
+        other = Post.objects.create(author=self.user, content='Different', image=jpeg('navy'))
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith('cas/') and first.image.name.endswith('.jpg'))
+        self.assertNotEqual(first.image.name, other.image.name)
+        self.assertEqual(self.stored_files(), sorted([first.image.name, other.image.name]))
+        self.assertEqual(self.refcount(first.image.name), 2)
+
+    def test_files_go_with_their_last_reference(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            original = Post.objects.create(author=self.user, content='Sunset', image=jpeg())
+        name = original.image.name
+        self.assertTrue(media_storage.exists(images.derived_key(name, 'thumb', images.FALLBACK_FORMAT)))
+
+        self.client.post(f'/api/posts/{original.id}/repost/')
+        self.assertEqual(self.refcount(name), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/remove-post-image/{original.id}/')
+        self.assertTrue(response.json()['success'])
+        self.assertTrue(media_storage.exists(name))
+        self.assertEqual(self.refcount(name), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.filter(repost_parent=original).delete()
+        self.assertFalse(media_storage.exists(name))
+        self.assertEqual(self.stored_files(), [])
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_reused_files_survive_a_concurrent_last_release(self):
+        original = Post.objects.create(author=self.user, content='Meme', image=jpeg())
+        name = original.image.name
+        # Another request stores the same bytes but has not saved its row yet
+        self.assertEqual(media_storage.save('posts/copy.jpg', jpeg()), name)
+        with self.captureOnCommitCallbacks(execute=True):
+            original.delete()
+        self.assertTrue(media_storage.exists(name))
+
+        copy = Post.objects.create(author=self.user, content='Copy', image=name)
+        self.assertEqual(self.refcount(copy.image.name), 1)
+
+        # Once the grace period is over an unreferenced blob goes as usual
+        MediaBlob.objects.filter(name=name).update(refcount=0, touched_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(reclaim([name]), [name])
+        self.assertFalse(media_storage.exists(name))
+
+    def test_replacing_an_avatar_releases_the_old_one(self):
+        profile = self.user.profile
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.profile_pic = jpeg('red')
+            profile.save()
+        old = profile.profile_pic.name
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.profile_pic = jpeg('blue')
+            profile.save()
+        self.assertFalse(media_storage.exists(old))
+        self.assertEqual(self.refcount(profile.profile_pic.name), 1)
+
+        # Re-uploading the same picture again keeps a single reference
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.profile_pic = jpeg('blue')
+            profile.save()
+        self.assertEqual(self.refcount(profile.profile_pic.name), 1)
+
+    def test_gc_recounts_and_reclaims_orphans(self):
+        kept = Post.objects.create(author=self.user, content='Kept', image=jpeg())
+        images.render(kept.image.name, images.PHOTO_SIZES)
+        dropped = Post.objects.create(author=self.user, content='Dropped', image=jpeg('navy'))
+        dropped_name = dropped.image.name
+        # Bypasses signals, so the count drifts
+        Post.objects.filter(pk=dropped.pk).update(image=None)
+
+        legacy = os.path.join(self.media, 'posts', 'legacy.jpg')
+        os.makedirs(os.path.dirname(legacy))
+        with open(legacy, 'wb') as file:
+            file.write(b'orphan')
+        fresh = os.path.join(self.media, 'posts', 'in-flight.jpg')
+        with open(fresh, 'wb') as file:
+            file.write(b'still being attached')
+        hour_ago = time.time() - 2 * 60 * 60
+        os.utime(legacy, (hour_ago, hour_ago))
+
+        out = StringIO()
+        call_command('gc_media', '--dry-run', stdout=out)
+        self.assertIn('Would remove posts/legacy.jpg', out.getvalue())
+        self.assertTrue(os.path.exists(legacy))
+
+        call_command('gc_media', stdout=StringIO())
+        self.assertFalse(os.path.exists(legacy))
+        self.assertTrue(os.path.exists(fresh))
+        self.assertFalse(media_storage.exists(dropped_name))
+        self.assertTrue(media_storage.exists(kept.image.name))
+        self.assertTrue(media_storage.exists(images.derived_key(kept.image.name, 'feed', images.FALLBACK_FORMAT)))
+        self.assertEqual(list(MediaBlob.objects.values_list('name', 'refcount')), [(kept.image.name, 1)])
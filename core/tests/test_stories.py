@@ -0,0 +1,128 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from core.models import Follow, Job, MediaBlob, Story, StoryRing, StoryView
+from core import stories
+from core.storage import media_storage
+import json
+
+
+def jpeg(color='teal'):
+    buffer = BytesIO()
+    Image.new('RGB', (40, 30), color).save(buffer, 'JPEG')
+    return SimpleUploadedFile('story.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(JOBS_INLINE=False)
+class StoryRingTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media)
+        self.settings_override.enable()
+        self.viewer = User.objects.create_user(username='viewer', password='pass')
+        self.friend = User.objects.create_user(username='friend', password='pass')
+        self.stranger = User.objects.create_user(username='stranger', password='pass')
+        Follow.objects.create(follower=self.viewer, following=self.friend)
+        self.client = Client()
+        self.client.force_login(self.viewer)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def story(self, user, hours=24, **fields):
+        return Story.objects.create(user=user, expires_at=timezone.now() + timedelta(hours=hours), **fields)
+
+    def test_tray_is_one_query_over_precomputed_rings(self):
+        self.story(self.friend, hours=2)
+        latest = self.story(self.friend)
+        self.story(self.viewer)
+        self.story(self.stranger)
+
+        with self.assertNumQueries(1):
+            rings = stories.tray(self.viewer)
+            users = [ring.user.profile.full_name for ring in rings]
+        self.assertEqual(users, ['viewer', 'friend'])
+        self.assertEqual((rings[1].story_count, rings[1].latest_story_id), (2, latest.id))
+
+        data = json.loads(self.client.get('/api/stories/').content)['stories']
+        self.assertEqual([entry['user']['username'] for entry in data], ['viewer', 'friend'])
+        self.assertEqual(data[1]['story_count'], 2)
+        self.assertEqual(data[1]['latest_story']['id'], latest.id)
+
+    def test_rings_follow_deletes_and_expiry(self):
+        first = self.story(self.friend)
+        second = self.story(self.friend, hours=1)
+        self.client.force_login(self.friend)
+        self.client.post(f'/api/stories/{first.id}/delete/')
+        ring = StoryRing.objects.get(user=self.friend)
+        self.assertEqual((ring.story_count, ring.latest_story_id), (1, second.id))
+
+        # Expired but not yet swept: the tray refreshes a ring whose counts went stale
+        third = self.story(self.friend)
+        later = timezone.now() + timedelta(hours=2)
+        ring, = stories.tray(self.viewer, now=later)
+        self.assertEqual((ring.story_count, ring.latest_story_id), (1, third.id))
+        self.assertEqual(stories.tray(self.viewer, now=later + timedelta(days=1)), [])
+
+        stories.sweep(now=later + timedelta(days=1))
+        self.assertFalse(StoryRing.objects.exists())
+
+    def test_creating_a_story_queues_one_sweep_per_slot(self):
+        story = self.story(self.friend)
+        Story.objects.create(user=self.viewer, expires_at=story.expires_at)
+        job = Job.objects.get(task='core.stories.sweep_job')
+        self.assertGreaterEqual(job.run_at, story.expires_at)
+        self.assertLessEqual(job.run_at, story.expires_at + stories.SWEEP_INTERVAL)
+
+    @override_settings(JOBS_INLINE=True)
+    def test_inline_mode_runs_the_sweep_once_it_is_due(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            story = self.story(self.friend, hours=1)
+        self.client.get('/api/stories/')
+        self.assertTrue(Story.objects.filter(pk=story.pk).exists())
+
+        # No worker: the first request after the slot's sweep is due runs it
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(hours=2)):
+            self.client.get('/api/stories/')
+        self.assertFalse(Story.objects.filter(pk=story.pk).exists())
+        self.assertEqual(Job.objects.get(task='core.stories.sweep_job').status, Job.DONE)
+
+    def test_sweep_deletes_expired_stories_views_and_files(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            expired = self.story(self.friend, image=jpeg())
+        name = expired.image.name
+        StoryView.objects.create(story=expired, viewer=self.viewer)
+        kept = self.story(self.friend, hours=48)
+
+        later = timezone.now() + timedelta(hours=25)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(stories.sweep(now=later), 1)
+        self.assertEqual(list(Story.objects.values_list('id', flat=True)), [kept.id])
+        self.assertFalse(StoryView.objects.exists())
+        self.assertFalse(media_storage.exists(name))
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+        self.assertEqual(StoryRing.objects.get(user=self.friend).story_count, 1)
+
+    def test_sweep_works_in_batches(self):
+        for _ in range(5):
+            self.story(self.stranger, hours=-1)
+        out = StringIO()
+        with mock.patch('core.stories.BATCH_SIZE', 2), \
+                CaptureQueriesContext(connection) as ctx:
+            call_command('sweep_stories', stdout=out)
+        deletes = [q for q in ctx.captured_queries if q['sql'].startswith('DELETE FROM "core_story"')]
+        self.assertEqual(len(deletes), 3)
+        self.assertIn('Deleted 5 expired stories', out.getvalue())
+        self.assertFalse(Story.objects.exists())
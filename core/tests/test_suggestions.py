@@ -0,0 +1,84 @@
+from django.test import TestCase, Client, RequestFactory
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from core.models import Follow, Interest
+from core import suggestions
+import json
+
+
+class SuggestionEngineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='alice', password='pass')
+        self.friend = User.objects.create_user(username='bob', password='pass')
+        self.fof = User.objects.create_user(username='carol', password='pass')
+        self.stranger = User.objects.create_user(username='dave', password='pass')
+        Follow.objects.create(follower=self.user, following=self.friend)
+        Follow.objects.create(follower=self.friend, following=self.fof)
+        self.client.force_login(self.user)
+
+    def test_friends_of_friends_and_interests_rank_first(self):
+        music = Interest.objects.create(name='Music')
+        self.user.profile.interests.add(music)
+        self.stranger.profile.interests.add(music)
+        Follow.objects.create(follower=self.fof, following=self.stranger)
+
+        ranked = suggestions.compute_candidates(self.user)
+        self.assertEqual(ranked[:2], [self.fof.id, self.stranger.id])
+        self.assertNotIn(self.user.id, ranked)
+        self.assertNotIn(self.friend.id, ranked)
+
+    def test_served_from_cache_without_random_ordering(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/suggested-users/')
+        self.assertFalse([q for q in ctx.captured_queries if 'RANDOM()' in q['sql']])
+
+        with CaptureQueriesContext(connection) as ctx:
+            suggestions.suggested_user_ids(self.user)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_follow_invalidates_cached_candidates(self):
+        self.assertIn(self.fof.id, suggestions.candidate_ids(self.user))
+        self.client.post(f'/api/follow/{self.fof.id}/')
+        self.assertNotIn(self.fof.id, suggestions.candidate_ids(self.user))
+
+    def test_random_fallback_samples_by_id_range(self):
+        ids = suggestions.random_user_ids(3, exclude={self.user.id})
+        self.assertEqual(len(ids), 3)
+        self.assertNotIn(self.user.id, ids)
+
+    def test_suggested_users_endpoint(self):
+        data = json.loads(self.client.get('/api/suggested-users/').content)
+        self.assertTrue(data['success'])
+        returned = {u['id'] for u in data['users']}
+        self.assertIn(self.fof.id, returned)
+        self.assertNotIn(self.friend.id, returned)
+
+
+class SidebarContextProcessorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='erin', password='pass')
+        self.other = User.objects.create_user(username='frank', password='pass')
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def test_pages_without_sidebar_run_no_suggestion_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = Client().get('/login/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in ctx.captured_queries if 'auth_user' in q['sql']])
+
+    def test_evaluates_lazily_and_caches_per_user(self):
+        from core.context_processors import suggestions_context
+        with self.assertNumQueries(0):
+            lazy = suggestions_context(self.request)['suggestions']
+        self.assertEqual([u.id for u in lazy], [self.other.id])
+
+        ids = suggestions.sidebar_user_ids(self.user)
+        Follow.objects.create(follower=self.user, following=self.other)
+        self.assertIsNone(cache.get(suggestions._sidebar_key(self.user.id)))
+        self.assertNotEqual(suggestions.sidebar_user_ids(self.user), ids)
@@ -0,0 +1,79 @@
+from unittest import mock
+
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from core.models import Post, Follow, TimelineEntry
+from core.timeline import home_timeline
+import json
+
+
+class HomeTimelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='alice', password='pass')
+        self.author = User.objects.create_user(username='bob', password='pass')
+        self.client.force_login(self.user)
+
+    def _feed_ids(self):
+        data = json.loads(self.client.get('/api/posts/').content)
+        return [p['id'] for p in data['posts']]
+
+    def test_new_post_fans_out_to_followers(self):
+        Follow.objects.create(follower=self.user, following=self.author)
+        post = Post.objects.create(author=self.author, content='Hi followers')
+        self.assertTrue(TimelineEntry.objects.filter(user=self.user, post=post).exists())
+        self.assertEqual(self._feed_ids(), [post.id])
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        old = [Post.objects.create(author=self.author, content=f'Old {i}') for i in range(3)]
+        self.assertEqual(self._feed_ids(), [])
+
+        self.client.post(f'/api/follow/{self.author.id}/')
+        self.assertEqual(sorted(self._feed_ids()), sorted(p.id for p in old))
+
+        self.client.post(f'/api/follow/{self.author.id}/')
+        self.assertEqual(self._feed_ids(), [])
+
+    def test_repost_reaches_reposters_followers(self):
+        reader = User.objects.create_user(username='carol', password='pass')
+        Follow.objects.create(follower=reader, following=self.user)
+        original = Post.objects.create(author=self.author, content='Original')
+        self.client.post(f'/api/posts/{original.id}/repost/', data='{}', content_type='application/json')
+        repost = Post.objects.get(repost_parent=original)
+        self.assertTrue(TimelineEntry.objects.filter(user=reader, post=repost).exists())
+
+    def test_celebrity_posts_are_pulled_on_read(self):
+        Follow.objects.create(follower=self.user, following=self.author)
+        mine = Post.objects.create(author=self.user, content='Mine')
+        with mock.patch('core.timeline.FANOUT_LIMIT', 0):
+            cache.clear()
+            celeb_posts = [Post.objects.create(author=self.author, content=f'Celeb {i}') for i in range(12)]
+            self.assertFalse(TimelineEntry.objects.filter(user=self.user, post__in=celeb_posts).exists())
+
+            posts, cursor = home_timeline(self.user, limit=10)
+            rest, last_cursor = home_timeline(self.user, cursor, limit=10)
+        ids = [p.id for p in posts + rest]
+        self.assertEqual(len(ids), 13)
+        self.assertEqual(len(set(ids)), 13)
+        self.assertIn(mine.id, ids)
+        self.assertIsNone(last_cursor)
+
+    @override_settings(JOBS_INLINE=True)
+    def test_crossing_the_fanout_limit_reconciles_timelines(self):
+        fan = User.objects.create_user(username='carol', password='pass')
+        Follow.objects.create(follower=self.user, following=self.author)
+        with mock.patch('core.timeline.FANOUT_LIMIT', 1), self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(follower=fan, following=self.author)
+        # Now pulled on read, so the fanned-out copies go
+        self.assertFalse(TimelineEntry.objects.filter(author=self.author).exclude(user=self.author).exists())
+
+        with mock.patch('core.timeline.FANOUT_LIMIT', 1):
+            missed = Post.objects.create(author=self.author, content='While famous')
+            self.assertEqual([p.id for p in home_timeline(self.user)[0]], [missed.id])
+            with self.captureOnCommitCallbacks(execute=True):
+                Follow.objects.filter(follower=fan).delete()
+        # Back under the limit: the post that was never fanned out is backfilled
+        self.assertTrue(TimelineEntry.objects.filter(user=self.user, post=missed).exists())
+        self.assertEqual(self._feed_ids(), [missed.id])
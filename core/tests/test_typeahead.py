@@ -0,0 +1,127 @@
+from io import StringIO
+
+from django.test import SimpleTestCase, TestCase, Client
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from core.models import Follow
+from core import typeahead
+from core.typeahead import PrefixIndex
+import json
+
+
+class PrefixIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = PrefixIndex([
+            (1, 'abhimanyu', 'Abhimanyu', 'Vaishnav'),
+            (2, 'abby', 'Abigail', 'Stone'),
+            (3, 'jose', 'José', 'García'),
+            (4, 'vai_fan', '', ''),
+        ])
+
+    def test_username_matches_come_before_name_matches(self):
+        self.assertEqual(self.index.search('ab'), [2, 1])
+        self.assertEqual(self.index.search('vai'), [4, 1])
+
+    def test_every_word_must_match_and_accents_are_ignored(self):
+        self.assertEqual(self.index.search('abhi vai'), [1])
+        self.assertEqual(self.index.search('GARC'), [3])
+        self.assertEqual(self.index.search('abhi stone'), [])
+
+    def test_limit_and_accept(self):
+        self.assertEqual(self.index.search('a', limit=1), [2])
+        self.assertEqual(self.index.search('ab', accept=lambda user_id: user_id != 2), [1])
+
+    def test_add_replaces_and_remove_forgets(self):
+        self.index.add(2, 'abigail', 'Abigail', 'Brook')
+        self.assertEqual(self.index.search('stone'), [])
+        self.assertEqual(self.index.search('brook'), [2])
+        self.assertIsNone(self.index.username_owner('abby'))
+        self.index.remove(1)
+        self.assertEqual(self.index.search('vai'), [4])
+        self.assertEqual(len(self.index), 3)
+
+    def test_username_owner_ignores_case_but_not_accents(self):
+        self.assertEqual(self.index.username_owner('ABBY'), 2)
+        self.assertIsNone(self.index.username_owner('josé'))
+
+
+class TypeaheadSyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        typeahead.reset()
+        self.client = Client()
+        self.user = User.objects.create_user(username='alice', password='pass')
+        self.friend = User.objects.create_user(username='bob', first_name='Bobby', last_name='Tables', password='pass')
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        typeahead.reset()
+
+    def test_saves_and_deletes_reach_the_index_on_commit(self):
+        self.assertEqual(typeahead.search('tab'), [self.friend.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.friend.last_name = 'Chairs'
+            self.friend.save()
+        self.assertEqual(typeahead.search('tab'), [])
+        self.assertEqual(typeahead.search('chai'), [self.friend.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.friend.delete()
+        self.assertEqual(typeahead.search('chai'), [])
+
+    def test_changes_made_by_other_processes_are_replayed_from_the_changelog(self):
+        typeahead.get_index()
+        # Another process renamed bob: the row changed and the change was logged, nothing else
+        User.objects.filter(pk=self.friend.pk).update(username='robert')
+        typeahead._log_change(self.friend.id)
+        self.assertEqual(typeahead.search('rob'), [self.friend.id])
+        self.assertIsNone(typeahead.username_owner('bob'))
+
+    def test_login_saves_do_not_touch_the_index(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.friend.save(update_fields=['last_login'])
+        self.assertEqual(callbacks, [])
+
+    def test_username_check_confirms_free_names_in_the_database(self):
+        typeahead.get_index()
+        with CaptureQueriesContext(connection) as queries:
+            taken = json.loads(self.client.get('/api/check-username/', {'username': 'BOB'}).content)
+            own = json.loads(self.client.get('/api/check-username/', {'username': 'alice'}).content)
+        self.assertFalse(taken['available'])
+        self.assertTrue(own['available'])
+        # Names the index knows are answered without looking users up
+        lookups = [q['sql'] for q in queries.captured_queries if 'FROM "auth_user"' in q['sql']]
+        self.assertFalse([sql for sql in lookups if 'WHERE "auth_user"."id" = ' not in sql])
+
+        free = json.loads(self.client.get('/api/check-username/', {'username': 'carol'}).content)
+        self.assertTrue(free['available'])
+        # Another process signed carol up and this index hasn't heard yet
+        User.objects.bulk_create([User(username='Carol')])
+        taken = json.loads(self.client.get('/api/check-username/', {'username': 'carol'}).content)
+        self.assertFalse(taken['available'])
+
+    def test_search_users_endpoints(self):
+        data = json.loads(self.client.get('/api/search-users/', {'q': 'bobby ta'}).content)
+        self.assertEqual([user['username'] for user in data['users']], ['bob'])
+        data = json.loads(self.client.get('/api/search-users/', {'q': 'ali'}).content)
+        self.assertEqual(data['users'], [])
+
+        # The chat picker only offers people you follow or who follow you
+        data = json.loads(self.client.get('/api/messages/search-users/', {'q': 'bo'}).content)
+        self.assertEqual(data['users'], [])
+        Follow.objects.create(follower=self.user, following=self.friend)
+        data = json.loads(self.client.get('/api/messages/search-users/', {'q': 'bo'}).content)
+        self.assertEqual([user['username'] for user in data['users']], ['bob'])
+
+
+class TypeaheadBenchTests(SimpleTestCase):
+    def test_bench_reports_every_lookup_kind(self):
+        out = StringIO()
+        call_command('typeahead_bench', users=2000, queries=50, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('2000 users indexed'))
+        self.assertEqual([line.rsplit(None, 2)[0] for line in lines[2:]],
+                         ['prefix', 'first last', 'username taken', 'add/remove'])
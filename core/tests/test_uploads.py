@@ -0,0 +1,195 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
+
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+from PIL import Image
+from core.models import Post, Story, Upload
+from core import uploads
+import json
+
+
+def png_bytes(size=(64, 48)):
+    buffer = BytesIO()
+    Image.effect_noise(size, 50).convert('RGB').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class BrokenStream:
+    """A request body whose connection drops after `data`."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def read(self, size):
+        if not self.data:
+            raise OSError('connection reset')
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.media = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media)
+        self.settings_override.enable()
+        self.dir_patch = mock.patch.object(uploads, 'UPLOAD_DIR', self.dir)
+        self.dir_patch.start()
+        self.user = User.objects.create_user(username='alice', password='pass')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        self.dir_patch.stop()
+        self.settings_override.disable()
+        shutil.rmtree(self.dir, ignore_errors=True)
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def start(self, data, content_type='image/png', filename='cat.png'):
+        response = self.client.post('/api/uploads/', {
+            'filename': filename, 'size': len(data), 'content_type': content_type,
+        })
+        return response, json.loads(response.content)
+
+    def send(self, upload_id, offset, chunk):
+        response = self.client.patch(
+            f'/api/uploads/{upload_id}/', chunk,
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+        return response, json.loads(response.content)
+
+    def upload(self, data, chunk_size=1000, **kwargs):
+        upload_id = self.start(data, **kwargs)[1]['upload']['id']
+        for offset in range(0, len(data), chunk_size):
+            self.send(upload_id, offset, data[offset:offset + chunk_size])
+        return upload_id
+
+    def test_chunks_resume_after_a_dropped_connection(self):
+        data = png_bytes()
+        upload = uploads.start(self.user, 'cat.png', len(data), 'image/png')
+        uploads.append(upload, 0, BrokenStream(data[:150]))
+        upload.refresh_from_db()
+        self.assertEqual(upload.received, 150)
+        self.assertFalse(upload.is_complete)
+
+        status = json.loads(self.client.get(f'/api/uploads/{upload.id}/').content)['upload']
+        self.assertEqual(status['offset'], 150)
+        response, body = self.send(upload.id, 0, data)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(body['upload']['offset'], 150)
+
+        response, body = self.send(upload.id, 150, data[150:])
+        self.assertTrue(body['upload']['complete'])
+        with open(uploads.part_path(upload), 'rb') as part:
+            self.assertEqual(part.read(), data)
+
+    def test_overlapping_chunks_for_one_offset_append_once(self):
+        data = png_bytes()
+        upload = uploads.start(self.user, 'cat.png', len(data), 'image/png')
+        stale = Upload.objects.get(pk=upload.pk)
+        uploads.append(upload, 0, BytesIO(data[:100]))
+        # A second request for offset 0 read the row before the first one finished
+        with self.assertRaises(uploads.InvalidUpload) as raised:
+            uploads.append(stale, 0, BytesIO(data[:200]))
+        self.assertEqual(raised.exception.status, 409)
+        self.assertEqual(raised.exception.upload.received, 100)
+        with open(uploads.part_path(upload), 'rb') as part:
+            self.assertEqual(part.read(), data[:100])
+        self.assertEqual(os.listdir(self.dir), [f'{upload.pk}.part'])
+
+    def test_body_is_read_in_bounded_pieces(self):
+        data = png_bytes((600, 400))
+        upload = uploads.start(self.user, 'big.png', len(data), 'image/png')
+        reads = []
+        stream = BytesIO(data)
+
+        class Recorder:
+            def read(self, size):
+                reads.append(size)
+                return stream.read(size)
+        uploads.append(upload, 0, Recorder())
+        self.assertEqual(set(reads), {uploads.READ_SIZE})
+        self.assertTrue(upload.is_complete)
+
+    def test_declared_type_and_size_are_enforced(self):
+        response, body = self.start(b'x' * 10, content_type='application/x-sh', filename='run.sh')
+        self.assertEqual(response.status_code, 415)
+        response, body = self.start(b'x' * (uploads.MAX_SIZES['image'] + 1))
+        self.assertEqual(response.status_code, 413)
+
+        # Content that does not match the declared kind is rejected as soon as its header arrives
+        upload_id = self.start(b'#!/bin/sh\necho pwned\n' * 10)[1]['upload']['id']
+        response, body = self.send(upload_id, 0, b'#!/bin/sh\necho pwned\n')
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(Upload.objects.filter(id=upload_id).exists())
+        self.assertEqual(os.listdir(self.dir), [])
+
+        data = png_bytes()
+        upload_id = self.start(data)[1]['upload']['id']
+        response, body = self.send(upload_id, 0, data + b'extra')
+        self.assertEqual(response.status_code, 413)
+
+    def test_truncated_image_is_rejected_on_completion(self):
+        data = png_bytes()[:-30] + b'\0' * 30
+        upload_id = self.start(data)[1]['upload']['id']
+        response, body = self.send(upload_id, 0, data)
+        self.assertEqual(response.status_code, 415)
+
+    def test_post_story_and_avatar_attach_finished_uploads(self):
+        data = png_bytes()
+        post_upload = self.upload(data, filename='holiday.jpeg')
+        response = self.client.post('/post/new/', {'content': 'Holiday', 'image_upload': post_upload})
+        post = Post.objects.get(id=json.loads(response.content)['post_id'])
+        # The extension follows the content, not the declared file name
+        self.assertTrue(post.image.name.endswith('.png'))
+        with post.image.open('rb') as stored:
+            self.assertEqual(stored.read(), data)
+
+        story_upload = self.upload(data)
+        self.client.post('/api/stories/create/', {'story_type': 'image', 'story_upload': story_upload})
+        self.assertTrue(Story.objects.get(user=self.user).image)
+
+        avatar_upload = self.upload(data)
+        response = self.client.post('/api/profile/update-pic/', {'upload_id': avatar_upload})
+        self.assertTrue(json.loads(response.content)['success'])
+
+        self.assertFalse(Upload.objects.exists())
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_uploads_are_private_and_single_use(self):
+        upload_id = self.upload(png_bytes())
+        other = Client()
+        other.force_login(User.objects.create_user(username='mallory', password='pass'))
+        response = other.post('/post/new/', {'content': 'Mine now', 'image_upload': upload_id})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(other.get(f'/api/uploads/{upload_id}/').status_code, 404)
+
+        self.client.post('/post/new/', {'content': 'First', 'image_upload': upload_id})
+        response = self.client.post('/post/new/', {'content': 'Again', 'image_upload': upload_id})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Post.objects.count(), 1)
+
+    def test_unfinished_or_wrong_kind_uploads_are_refused(self):
+        data = png_bytes()
+        upload_id = self.start(data)[1]['upload']['id']
+        self.send(upload_id, 0, data[:50])
+        response = self.client.post('/post/new/', {'content': 'Too soon', 'image_upload': upload_id})
+        self.assertEqual(response.status_code, 409)
+
+        image_id = self.upload(data)
+        response = self.client.post('/post/new/', {'content': 'Clip', 'video_upload': image_id})
+        self.assertEqual(response.status_code, 415)
+
+    def test_purge_removes_stale_uploads_and_their_parts(self):
+        data = png_bytes()
+        upload_id = self.start(data)[1]['upload']['id']
+        self.send(upload_id, 0, data[:50])
+        self.assertEqual(uploads.purge(), 0)
+        self.assertEqual(uploads.purge(timezone.now() + uploads.STALE_AFTER + timedelta(minutes=1)), 1)
+        self.assertEqual(os.listdir(self.dir), [])
@@ -0,0 +1,61 @@
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from core.models import Post, Like, SavedPost, PollVote
+from core.viewer_state import load_viewer_state
+import json
+
+
+class ViewerStateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='alice', password='pass')
+        self.client.force_login(self.user)
+
+    def _make_posts(self, n):
+        return [Post.objects.create(author=self.user, content=f'Post {i}') for i in range(n)]
+
+    def test_loader_resolves_every_relation(self):
+        liked, saved, poll, plain = self._make_posts(4)
+        Like.objects.create(user=self.user, post=liked)
+        SavedPost.objects.create(user=self.user, post=saved)
+        PollVote.objects.create(user=self.user, post=poll, option_index=1)
+        Post.objects.create(author=self.user, content='rt', repost_parent=plain)
+
+        with self.assertNumQueries(4):
+            state = load_viewer_state(self.user, [liked.id, saved.id, poll.id, plain.id])
+        self.assertEqual(state.liked, {liked.id})
+        self.assertEqual(state.saved, {saved.id})
+        self.assertEqual(set(state.votes), {poll.id})
+        self.assertEqual(state.reposted, {plain.id})
+        self.assertEqual(state.for_post(poll.id)['voted_options'], [1])
+
+    def _count_queries(self, url):
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_independent_of_page_size(self):
+        self._make_posts(3)
+        small = self._count_queries('/api/posts/')
+        for post in self._make_posts(7):
+            Like.objects.create(user=self.user, post=post)
+        self.assertEqual(self._count_queries('/api/posts/'), small)
+
+        small = self._count_queries('/feed/')
+        self._make_posts(5)
+        self.assertEqual(self._count_queries('/feed/'), small)
+
+    def test_bulk_like_status_endpoint(self):
+        a, b = self._make_posts(2)
+        Like.objects.create(user=self.user, post=a)
+        res = self.client.get('/api/posts/like-status/', {'post_ids': f'{a.id},{b.id}'})
+        data = json.loads(res.content)['posts']
+        self.assertTrue(data[str(a.id)]['is_liked'])
+        self.assertFalse(data[str(b.id)]['is_liked'])
+        self.assertEqual(data[str(a.id)]['like_count'], 1)
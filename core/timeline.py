@@ -0,0 +1,152 @@
+"""
+Precomputed home timelines (fan-out-on-write inbox).
+
+Every new post is copied into a TimelineEntry row for the author and each
+of their followers, so reading a feed is a single range scan over
+(user, created_at) instead of an OR across the whole Post table.
+
+Authors with more than TIMELINE_FANOUT_LIMIT followers are not fanned out;
+their posts are pulled at read time and merged into the page instead
+(fan-out-on-read), which keeps one celebrity post from writing millions
+of rows inside a request. When a follow or unfollow moves an author across
+the limit, a background job (reconcile_author) backfills their followers'
+timelines or drops the copies that read time now pulls in.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from . import jobs
+from .models import Follow, Post, TimelineEntry
+from .pagination import DEFAULT_PAGE_SIZE, encode_cursor, keyset_filter
+
+FANOUT_LIMIT = getattr(settings, 'TIMELINE_FANOUT_LIMIT', 5000)
+BACKFILL_LIMIT = getattr(settings, 'TIMELINE_BACKFILL_LIMIT', 100)
+BATCH_SIZE = 1000
+CELEBRITY_CACHE_KEY = 'timeline:celebrity_ids'
+CELEBRITY_CACHE_TIMEOUT = 300
+
+
+def _entry(user_id, post):
+    return TimelineEntry(user_id=user_id, post_id=post.pk, author_id=post.author_id,
+                         created_at=post.created_at)
+
+
+def celebrity_ids():
+    """IDs of authors whose posts are served with fan-out-on-read."""
+    ids = cache.get(CELEBRITY_CACHE_KEY)
+    if ids is None:
+        ids = set(
+            Follow.objects.values('following')
+            .annotate(n=Count('id')).filter(n__gt=FANOUT_LIMIT)
+            .values_list('following', flat=True)
+        )
+        cache.set(CELEBRITY_CACHE_KEY, ids, CELEBRITY_CACHE_TIMEOUT)
+    return ids
+
+
+def is_celebrity(author_id):
+    return author_id in celebrity_ids()
+
+
+def fan_out_post(post):
+    """Deliver a new post to its author's and followers' timelines."""
+    TimelineEntry.objects.bulk_create([_entry(post.author_id, post)], ignore_conflicts=True)
+    if is_celebrity(post.author_id):
+        return
+
+    follower_ids = Follow.objects.filter(following_id=post.author_id).values_list('follower_id', flat=True)
+    batch = []
+    for follower_id in follower_ids.iterator(chunk_size=BATCH_SIZE):
+        batch.append(_entry(follower_id, post))
+        if len(batch) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill_author(user_id, author_id):
+    """Copy an author's recent posts into a new follower's timeline."""
+    if is_celebrity(author_id):
+        return
+    recent = Post.objects.filter(author_id=author_id).order_by('-created_at')[:BACKFILL_LIMIT]
+    TimelineEntry.objects.bulk_create([_entry(user_id, post) for post in recent], ignore_conflicts=True)
+
+
+def remove_author(user_id, author_id):
+    """Drop an author's posts from a timeline after an unfollow."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def followers_changed(author_id, delta):
+    """After `author_id` gained (delta=1) or lost (-1) a follower, handle crossing FANOUT_LIMIT."""
+    count = Follow.objects.filter(following_id=author_id).count()
+    if (delta > 0 and count == FANOUT_LIMIT + 1) or (delta < 0 and count == FANOUT_LIMIT):
+        cache.delete(CELEBRITY_CACHE_KEY)
+        jobs.enqueue(reconcile_author, author_id=author_id)
+
+
+@jobs.task(priority=-5)
+def reconcile_author(author_id):
+    """Job task: match followers' timelines to the side of FANOUT_LIMIT `author_id` is on now."""
+    cache.delete(CELEBRITY_CACHE_KEY)
+    follower_ids = Follow.objects.filter(following_id=author_id).values_list('follower_id', flat=True)
+    if follower_ids.count() > FANOUT_LIMIT:
+        copies = TimelineEntry.objects.filter(author_id=author_id).exclude(user_id=author_id)
+        while ids := list(copies.values_list('id', flat=True)[:BATCH_SIZE]):
+            TimelineEntry.objects.filter(id__in=ids).delete()
+        return
+
+    # Posts written while the author was pulled on read were never fanned out
+    recent = list(Post.objects.filter(author_id=author_id).order_by('-created_at')[:BACKFILL_LIMIT])
+    batch = []
+    for follower_id in follower_ids.iterator(chunk_size=BATCH_SIZE):
+        batch.extend(_entry(follower_id, post) for post in recent)
+        if len(batch) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def rebuild_timeline(user):
+    """Recreate a user's timeline from scratch (own posts + followed authors)."""
+    TimelineEntry.objects.filter(user=user).delete()
+    backfill_author(user.pk, user.pk)
+    for author_id in Follow.objects.filter(follower=user).values_list('following_id', flat=True):
+        backfill_author(user.pk, author_id)
+
+
+def home_timeline(user, cursor=None, limit=DEFAULT_PAGE_SIZE, queryset=None):
+    """Return ``(posts, next_cursor)`` for one page of a user's home feed.
+
+    Cursors are compatible with core.pagination, so the feed APIs can hand
+    them back to the client unchanged. `queryset` lets callers attach their
+    own select_related/prefetch_related to the posts.
+    """
+    if queryset is None:
+        queryset = Post.objects.all()
+
+    entries = keyset_filter(
+        TimelineEntry.objects.filter(user=user), cursor, tiebreaker='post_id'
+    ).values_list('post_id', flat=True)[:limit + 1]
+    post_ids = list(entries)
+
+    posts = list(queryset.filter(pk__in=post_ids)) if post_ids else []
+
+    celebrities = celebrity_ids()
+    if celebrities:
+        followed = list(Follow.objects.filter(
+            follower=user, following_id__in=celebrities
+        ).values_list('following_id', flat=True))
+        if followed:
+            pulled = keyset_filter(queryset.filter(author_id__in=followed), cursor)[:limit + 1]
+            known = {post.pk for post in posts}
+            posts.extend(post for post in pulled if post.pk not in known)
+
+    posts.sort(key=lambda post: (post.created_at, post.pk), reverse=True)
+    has_more = len(posts) > limit
+    posts = posts[:limit]
+    next_cursor = encode_cursor(posts[-1]) if has_more and posts else None
+    return posts, next_cursor
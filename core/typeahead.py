@@ -0,0 +1,281 @@
+"""
+In-memory typeahead over usernames and display names.
+
+Each process keeps a PrefixIndex: sorted arrays of normalized usernames
+and of the words in first/last names, each with a parallel array of user
+ids. A prefix lookup is a bisect plus a short forward scan, and a
+username lookup is an exact bisect; neither touches the database. Search
+views then load the handful of matching users by primary key. Lookups
+hold the same lock as the updates, which shift the arrays in place.
+
+The index is built from one query on first use and kept current by the
+User save/delete signals once the transaction commits. Other processes
+learn about a change through a changelog in the cache: every change
+stores the user id under the next sequence number, and a lookup first
+replays any sequence numbers this process hasn't seen (one cache read,
+plus one query for the changed rows when there are any). A process that
+falls more than CHANGELOG_SIZE changes behind, or whose index is older
+than TYPEAHEAD_MAX_AGE, rebuilds instead. With a per-process cache (the
+development LocMemCache) that age limit is the only cross-process refresh,
+so anything that must not be stale, like username availability, checks
+the database as well.
+
+Lookups cost microseconds; a write shifts the sorted arrays, a few
+milliseconds at a million users. `manage.py typeahead_bench` measures
+build time, memory and latency on synthetic users (1M by default).
+"""
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from sys import intern
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+
+MAX_AGE = getattr(settings, 'TYPEAHEAD_MAX_AGE', 15 * 60)
+CHANGELOG_SIZE = 1000
+CHANGELOG_TTL = 60 * 60
+# Entries examined per lookup before giving up on filling `limit`
+MAX_SCAN = 2000
+
+SEQ_KEY = 'typeahead:seq'
+NAME_FIELDS = ('username', 'first_name', 'last_name')
+WORD_RE = re.compile(r'\w+')
+
+
+def _change_key(seq):
+    return f'typeahead:change:{seq}'
+
+
+def fold(text):
+    """Case- and accent-insensitive form used for every key and query."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+class PrefixIndex:
+    """Sorted-array prefix index of users; not thread-safe on its own.
+
+    Both arrays are ordered by (key, user id), so any entry is found by
+    bisection even under a key thousands of users share.
+    """
+
+    def __init__(self, rows=()):
+        """`rows` are (user_id, username, first_name, last_name) tuples."""
+        # user id -> (casefolded username, " username word word" as folded for matching)
+        self._users = {}
+        usernames, words = [], []
+        for user_id, username, first_name, last_name in rows:
+            entry = self._entry(username, first_name, last_name)
+            self._users[user_id] = entry
+            key, *names = entry[1].split()
+            usernames.append((key, user_id))
+            words.extend((intern(word), user_id) for word in names)
+        usernames.sort()
+        words.sort()
+        self._username_keys = [key for key, _ in usernames]
+        self._username_ids = array('q', (user_id for _, user_id in usernames))
+        self._word_keys = [key for key, _ in words]
+        self._word_ids = array('q', (user_id for _, user_id in words))
+
+    def __len__(self):
+        return len(self._users)
+
+    @staticmethod
+    def _entry(username, first_name, last_name):
+        words = dict.fromkeys(WORD_RE.findall(fold(f'{first_name} {last_name}')))
+        return username.casefold(), ' ' + ' '.join([fold(username), *words])
+
+    @staticmethod
+    def _position(keys, ids, key, user_id):
+        lo = bisect_left(keys, key)
+        return bisect_left(ids, user_id, lo, bisect_right(keys, key, lo))
+
+    @classmethod
+    def _insert(cls, keys, ids, key, user_id):
+        position = cls._position(keys, ids, key, user_id)
+        keys.insert(position, key)
+        ids.insert(position, user_id)
+
+    @classmethod
+    def _delete(cls, keys, ids, key, user_id):
+        position = cls._position(keys, ids, key, user_id)
+        if position < len(keys) and keys[position] == key and ids[position] == user_id:
+            del keys[position]
+            del ids[position]
+
+    def add(self, user_id, username, first_name='', last_name=''):
+        """Index a user, replacing whatever was indexed for them before."""
+        self.remove(user_id)
+        entry = self._entry(username, first_name, last_name)
+        self._users[user_id] = entry
+        key, *names = entry[1].split()
+        self._insert(self._username_keys, self._username_ids, key, user_id)
+        for word in names:
+            self._insert(self._word_keys, self._word_ids, intern(word), user_id)
+
+    def remove(self, user_id):
+        entry = self._users.pop(user_id, None)
+        if entry is None:
+            return
+        key, *names = entry[1].split()
+        self._delete(self._username_keys, self._username_ids, key, user_id)
+        for word in names:
+            self._delete(self._word_keys, self._word_ids, word, user_id)
+
+    def username_owner(self, username):
+        """Id of the user whose username equals `username` ignoring case, or None."""
+        wanted, key = username.casefold(), fold(username)
+        keys, ids = self._username_keys, self._username_ids
+        position = bisect_left(keys, key)
+        while position < len(keys) and keys[position] == key:
+            if self._users[ids[position]][0] == wanted:
+                return ids[position]
+            position += 1
+        return None
+
+    @staticmethod
+    def _range(keys, prefix):
+        return bisect_left(keys, prefix), bisect_left(keys, prefix + '\U0010ffff')
+
+    def search(self, query, limit=10, accept=None):
+        """Ids of up to `limit` users matching every word of `query` as a prefix.
+
+        Username matches come first, then name matches, each in
+        alphabetical order. `accept`, if given, is a predicate on user ids.
+        """
+        terms = WORD_RE.findall(fold(query))
+        if not terms:
+            return []
+        # Walk the ranges of the most selective word and check the others per user
+        sources = ((self._username_keys, self._username_ids), (self._word_keys, self._word_ids))
+        ranges = {term: [(ids, *self._range(keys, term)) for keys, ids in sources] for term in terms}
+        lead = min(terms, key=lambda term: sum(hi - lo for _, lo, hi in ranges[term]))
+        needles = [' ' + term for term in terms if term != lead]
+
+        seen, found, scanned = set(), [], 0
+        for ids, lo, hi in ranges[lead]:
+            for position in range(lo, min(hi, lo + MAX_SCAN - scanned)):
+                user_id = ids[position]
+                if user_id in seen:
+                    continue
+                seen.add(user_id)
+                if accept is not None and not accept(user_id):
+                    continue
+                haystack = self._users[user_id][1]
+                if all(needle in haystack for needle in needles):
+                    found.append(user_id)
+                    if len(found) >= limit:
+                        return found
+            scanned += min(hi - lo, MAX_SCAN - scanned)
+        return found
+
+
+_index = None
+_built_at = 0.0
+_seen_seq = 0
+_lock = threading.RLock()
+
+
+def _current_seq():
+    return cache.get(SEQ_KEY, 0)
+
+
+def _build():
+    global _index, _built_at, _seen_seq
+    # Read the sequence first: changes made during the build get replayed, not lost
+    seq = _current_seq()
+    _index = PrefixIndex(User.objects.values_list('id', *NAME_FIELDS).iterator(chunk_size=10000))
+    _built_at = time.monotonic()
+    _seen_seq = seq
+
+
+def _reload(user_ids):
+    rows = {row[0]: row for row in User.objects.filter(id__in=user_ids).values_list('id', *NAME_FIELDS)}
+    for user_id in user_ids:
+        if user_id in rows:
+            _index.add(*rows[user_id])
+        else:
+            _index.remove(user_id)
+
+
+def _catch_up():
+    global _seen_seq
+    seq = _current_seq()
+    if seq == _seen_seq:
+        return
+    # A counter behind ours was evicted and restarted; we can't tell what changed
+    if seq < _seen_seq or seq - _seen_seq > CHANGELOG_SIZE:
+        _build()
+        return
+    keys = [_change_key(n) for n in range(_seen_seq + 1, seq + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) < len(keys):
+        # Part of the changelog expired before we read it
+        _build()
+        return
+    _reload(set(changes.values()))
+    _seen_seq = seq
+
+
+def get_index():
+    """This process's index, built or brought up to date as needed."""
+    with _lock:
+        if _index is None or time.monotonic() - _built_at > MAX_AGE:
+            _build()
+        else:
+            _catch_up()
+        return _index
+
+
+def reset():
+    """Drop this process's index; the next lookup rebuilds it."""
+    global _index
+    with _lock:
+        _index = None
+
+
+def _log_change(user_id):
+    cache.add(SEQ_KEY, 0, None)
+    try:
+        seq = cache.incr(SEQ_KEY)
+    except ValueError:
+        # Evicted between add() and incr(); readers rebuild when they see it missing
+        return
+    cache.set(_change_key(seq), user_id, CHANGELOG_TTL)
+
+
+def user_saved(user):
+    """Update the index once the transaction that saved `user` commits."""
+    row = (user.id, user.username, user.first_name, user.last_name)
+
+    def apply():
+        _log_change(row[0])
+        with _lock:
+            if _index is not None:
+                _index.add(*row)
+    transaction.on_commit(apply)
+
+
+def user_deleted(user_id):
+    def apply():
+        _log_change(user_id)
+        with _lock:
+            if _index is not None:
+                _index.remove(user_id)
+    transaction.on_commit(apply)
+
+
+def search(query, limit=10, accept=None):
+    with _lock:
+        return get_index().search(query, limit, accept)
+
+
+def username_owner(username):
+    with _lock:
+        return get_index().username_owner(username)
@@ -0,0 +1,290 @@
+"""
+Chunked, resumable uploads.
+
+A client declares a file (name, size, content type) with POST
+/api/uploads/ and then sends its bytes in order with PATCH
+/api/uploads/<id>/, each request carrying an Upload-Offset header with
+the position its body starts at. Bodies are streamed to a part file
+under CHUNKED_UPLOAD_DIR READ_SIZE bytes at a time, so a request costs
+the same memory whatever the size of the file. If a connection drops,
+GET /api/uploads/<id>/ reports how many bytes arrived and the client
+carries on from there. Each body lands in a file of its own and is only
+appended to the part file under a lock on the Upload row (see append()),
+so overlapping requests for the same offset can't corrupt it.
+
+Files are checked while they stream: the declared size may not exceed
+MAX_SIZES for its kind, no byte past it is accepted, the first bytes
+must match the declared kind (SIGNATURES) and a finished image must
+open in Pillow.
+
+Views that attach media take the id of a finished upload instead of a
+multipart file: claim() returns it as an UploadedFile that storage can
+move into place without copying, and release() deletes the Upload once
+the model using it has been saved. `manage.py purge_uploads` removes
+uploads abandoned for longer than STALE_AFTER.
+"""
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from .models import Upload
+
+UPLOAD_DIR = getattr(settings, 'CHUNKED_UPLOAD_DIR', os.path.join(settings.BASE_DIR, 'uploads_tmp'))
+READ_SIZE = 64 * 1024
+MAX_SIZES = {
+    'image': getattr(settings, 'UPLOAD_MAX_IMAGE_SIZE', 20 * 1024 * 1024),
+    'video': getattr(settings, 'UPLOAD_MAX_VIDEO_SIZE', 200 * 1024 * 1024),
+}
+STALE_AFTER = timedelta(hours=getattr(settings, 'UPLOAD_STALE_HOURS', 24))
+
+# content type -> extension given to the stored file
+EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'image/avif': '.avif',
+    'video/mp4': '.mp4',
+    'video/quicktime': '.mov',
+    'video/webm': '.webm',
+}
+# (offset, magic bytes, content type); ISO media (ftyp) files are told apart by brand below
+SIGNATURES = [
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (8, b'WEBP', 'image/webp'),
+    (0, b'\x1aE\xdf\xa3', 'video/webm'),
+]
+SNIFF_SIZE = 16
+
+
+class InvalidUpload(Exception):
+    """An upload request that cannot be honoured; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400, upload=None):
+        super().__init__(message)
+        self.status = status
+        self.upload = upload
+
+
+def kind(content_type):
+    return content_type.partition('/')[0]
+
+
+def sniff(header):
+    """Content type of a file starting with `header`, or None if it is not one we accept."""
+    if header[4:8] == b'ftyp':
+        brand = header[8:12]
+        if brand in (b'avif', b'avis'):
+            return 'image/avif'
+        if brand == b'qt  ':
+            return 'video/quicktime'
+        return 'video/mp4'
+    for offset, magic, content_type in SIGNATURES:
+        if header[offset:offset + len(magic)] == magic:
+            return content_type
+    return None
+
+
+def part_path(upload):
+    return os.path.join(UPLOAD_DIR, f'{upload.pk}.part')
+
+
+def remove_part(upload):
+    try:
+        os.remove(part_path(upload))
+    except FileNotFoundError:
+        pass
+
+
+def start(user, filename, size, content_type):
+    """Declare a new upload and return it."""
+    content_type = (content_type or '').lower()
+    if content_type not in EXTENSIONS:
+        raise InvalidUpload(f'Unsupported file type: {content_type or "unknown"}', 415)
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise InvalidUpload('Invalid size')
+    limit = MAX_SIZES[kind(content_type)]
+    if size <= 0 or size > limit:
+        raise InvalidUpload(f'{kind(content_type).title()}s must be at most {limit // (1024 * 1024)}MB', 413)
+    name = os.path.splitext(os.path.basename(filename or ''))[0][:100] or 'upload'
+    return Upload.objects.create(
+        user=user, filename=name + EXTENSIONS[content_type], content_type=content_type, size=size
+    )
+
+
+def _check_header(upload, part):
+    part.seek(0)
+    found = sniff(part.read(SNIFF_SIZE))
+    part.seek(0, os.SEEK_END)
+    if found is None or kind(found) != kind(upload.content_type):
+        raise InvalidUpload(f'File content is not a valid {kind(upload.content_type)}', 415)
+    if found != upload.content_type:
+        upload.content_type = found
+        upload.filename = os.path.splitext(upload.filename)[0] + EXTENSIONS[found]
+
+
+def _check_image(upload):
+    try:
+        with Image.open(part_path(upload)) as image:
+            image.verify()
+    except Exception:
+        raise InvalidUpload('File content is not a valid image', 415)
+
+
+def append(upload, offset, stream):
+    """Write `stream` into `upload` starting at byte `offset`; returns the updated upload.
+
+    Whatever arrived before the stream ended or broke is kept, so the
+    client can resume from upload.received. Content that fails a check
+    discards the whole upload.
+
+    The body is streamed to a file of its own first and only appended to
+    the part file while the Upload row is locked, after checking the
+    offset again: two requests sending the same chunk at once can't
+    interleave their writes, and the slower one gets a 409.
+    """
+    _check_offset(upload, offset)
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    try:
+        chunk = _receive(upload, offset, stream)
+    except InvalidUpload:
+        upload.delete()
+        raise
+
+    rejected = None
+    try:
+        with transaction.atomic():
+            try:
+                locked = Upload.objects.select_for_update().get(pk=upload.pk)
+            except Upload.DoesNotExist:
+                raise InvalidUpload('Unknown upload', 404)
+            _check_offset(locked, offset)
+            try:
+                received = _extend(locked, offset, chunk)
+            except InvalidUpload as e:
+                rejected = e
+            else:
+                locked.received = received
+                locked.completed_at = timezone.now() if received == locked.size else None
+                locked.save(update_fields=['received', 'completed_at', 'content_type', 'filename', 'updated_at'])
+    finally:
+        os.remove(chunk)
+    if rejected is not None:
+        locked.delete()
+        raise rejected
+    for field in ('received', 'completed_at', 'content_type', 'filename', 'updated_at'):
+        setattr(upload, field, getattr(locked, field))
+    return upload
+
+
+def _check_offset(upload, offset):
+    if upload.is_complete:
+        raise InvalidUpload('Upload is already complete', 409, upload)
+    if offset != upload.received:
+        raise InvalidUpload(f'Expected offset {upload.received}', 409, upload)
+
+
+def _receive(upload, offset, stream):
+    """Stream a request body to a new file beside the part file; returns its path."""
+    with tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, prefix=f'{upload.pk}.', suffix='.chunk', delete=False) as chunk:
+        # Only the first chunk holds the whole header; reject a bad one as soon as it arrives
+        checked = offset != 0
+        try:
+            while True:
+                data = stream.read(READ_SIZE)
+                if not data:
+                    break
+                if offset + chunk.tell() + len(data) > upload.size:
+                    raise InvalidUpload('More data than the declared size', 413)
+                chunk.write(data)
+                if not checked and chunk.tell() >= min(SNIFF_SIZE, upload.size):
+                    _check_header(upload, chunk)
+                    checked = True
+        except OSError:
+            # Client went away mid-chunk; keep what arrived
+            pass
+        except InvalidUpload:
+            chunk.close()
+            os.remove(chunk.name)
+            raise
+    return chunk.name
+
+
+def _extend(upload, offset, chunk):
+    """Append file `chunk` to the part file at `offset` and check the result; returns its length."""
+    path = part_path(upload)
+    with open(path, 'r+b' if os.path.exists(path) else 'w+b') as part:
+        # Drop anything past the acknowledged offset, e.g. a half-written chunk
+        part.truncate(offset)
+        part.seek(offset)
+        with open(chunk, 'rb') as source:
+            shutil.copyfileobj(source, part, READ_SIZE)
+        received = part.tell()
+        if offset < SNIFF_SIZE and received >= min(SNIFF_SIZE, upload.size):
+            _check_header(upload, part)
+    if received == upload.size and kind(upload.content_type) == 'image':
+        _check_image(upload)
+    return received
+
+
+class CompletedUpload(UploadedFile):
+    """A finished upload, ready to assign to a FileField."""
+
+    def __init__(self, upload):
+        self.upload = upload
+        super().__init__(open(part_path(upload), 'rb'), upload.filename, upload.content_type, upload.size)
+
+    def temporary_file_path(self):
+        # Lets FileSystemStorage move the part file into place instead of copying it
+        return part_path(self.upload)
+
+    def release(self):
+        """Forget the upload once the model it was attached to has been saved."""
+        self.close()
+        self.upload.delete()
+
+
+def claim(user, upload_id, kinds=('image',)):
+    """`user`'s finished upload `upload_id` as a CompletedUpload; raises InvalidUpload."""
+    try:
+        upload = Upload.objects.get(pk=int(upload_id), user=user)
+    except (Upload.DoesNotExist, TypeError, ValueError):
+        raise InvalidUpload('Unknown upload', 404)
+    if not upload.is_complete:
+        raise InvalidUpload('Upload is not complete', 409, upload)
+    if kind(upload.content_type) not in kinds:
+        raise InvalidUpload(f'Expected {" or ".join(kinds)}, got {kind(upload.content_type)}', 415)
+    return CompletedUpload(upload)
+
+
+def purge(now=None):
+    """Delete uploads untouched for STALE_AFTER; returns how many went."""
+    stale = Upload.objects.filter(updated_at__lt=(now or timezone.now()) - STALE_AFTER)
+    count = 0
+    for upload in stale.iterator():
+        upload.delete()
+        count += 1
+    return count
+
+
+def describe(upload):
+    return {
+        'id': upload.id,
+        'filename': upload.filename,
+        'content_type': upload.content_type,
+        'size': upload.size,
+        'offset': upload.received,
+        'complete': upload.is_complete,
+    }
@@ -95,6 +95,7 @@ urlpatterns = [
     path("api/typing/start/", views.start_typing, name="start_typing"),
     path("api/typing/stop/", views.stop_typing, name="stop_typing"),
     path("api/users/<int:user_id>/online-status/", views.get_online_status, name="get_online_status"),
+    path("api/presence/", views.presence_api, name="presence"),
 
     # Stories
     path("api/stories/", views.get_stories, name="get_stories"),
@@ -127,12 +128,16 @@ urlpatterns = [
     # Online Users
     path("api/online-users/", views.get_online_users, name="get_online_users"),
     path("api/trending-hashtags/", views.get_trending_hashtags, name="get_trending_hashtags"),
+    path("hashtag/<str:name>/", views.hashtag_posts, name="hashtag_posts"),
     path('api/search/', views.search_api, name='search_api'),
 
 
     # ==================== MEDIA & UPLOADS ====================
     path("api/upload-post-photo/", views.upload_post_photo, name="upload_post_photo"),
     path("api/remove-post-image/<int:post_id>/", views.remove_post_image, name="remove_post_image"),
+    path("api/uploads/", views.start_upload, name="start_upload"),
+    path("api/uploads/<int:upload_id>/", views.upload_detail, name="upload_detail"),
+    path(f"{settings.MEDIA_URL.lstrip('/')}derived/<path:key>", views.derived_image, name="derived_image"),
 
     # ==================== MODERATION ====================
     path("api/report/", views.report_content, name="report_content"),
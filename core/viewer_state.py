@@ -0,0 +1,66 @@
+"""
+Batched per-viewer state for lists of posts.
+
+Rendering a page of posts needs to know, for the current user, which of
+them are liked, saved, reposted or voted on. Asking each post separately
+costs one query per post per relation; load_viewer_state() answers all of
+them with one query per relation regardless of page size.
+"""
+from collections import defaultdict
+
+from .models import Like, PollVote, Post, SavedPost
+
+
+class ViewerState:
+    """What one viewer has done to a fixed set of posts."""
+
+    def __init__(self, liked=(), saved=(), reposted=(), votes=None):
+        self.liked = set(liked)
+        self.saved = set(saved)
+        self.reposted = set(reposted)
+        # post_id -> set of option indexes the viewer picked
+        self.votes = votes or {}
+
+    def for_post(self, post_id):
+        """Flags for one post, ready to merge into a JSON payload."""
+        return {
+            'is_liked': post_id in self.liked,
+            'is_saved': post_id in self.saved,
+            'is_reposted': post_id in self.reposted,
+            'has_voted': post_id in self.votes,
+            'voted_options': sorted(self.votes.get(post_id, ())),
+        }
+
+
+def load_viewer_state(user, post_ids):
+    """Resolve liked/saved/reposted/voted sets for `post_ids` in four queries."""
+    post_ids = list(post_ids)
+    if not post_ids or not user or not user.is_authenticated:
+        return ViewerState()
+
+    liked = Like.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', flat=True)
+    saved = SavedPost.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', flat=True)
+    reposted = Post.objects.filter(
+        author=user, repost_parent_id__in=post_ids, is_quote=False
+    ).values_list('repost_parent_id', flat=True)
+
+    votes = defaultdict(set)
+    for post_id, option_index in PollVote.objects.filter(
+        user=user, post_id__in=post_ids
+    ).values_list('post_id', 'option_index'):
+        votes[post_id].add(option_index)
+
+    return ViewerState(liked, saved, reposted, dict(votes))
+
+
+def attach_viewer_state(posts, user):
+    """Load state for `posts` and hang it on each instance as `viewer_state`.
+
+    The post_extras template tags read it from there instead of querying.
+    Returns the ViewerState so views can reuse it for JSON payloads.
+    """
+    posts = list(posts)
+    state = load_viewer_state(user, [post.pk for post in posts])
+    for post in posts:
+        post.viewer_state = state
+    return state
@@ -1,8 +1,9 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.http import JsonResponse
+from django.http import FileResponse, Http404, JsonResponse
+from django.core.files.storage import default_storage
+from django.db import transaction
 from django.db.models import Q
 from django.views.decorators.csrf import csrf_exempt
 from django.urls import reverse
@@ -12,9 +13,19 @@ from datetime import timedelta
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import update_session_auth_hash
 import json
+from PIL import Image
 
 from .forms import ProfileForm, PostForm, CommentForm, UserForm, CustomSignupForm
-from .models import Post, Like, Comment, Profile, Follow, Conversation, ConversationMessage
+from .models import Post, Like, Comment, Profile, Follow, Conversation, ConversationMember, ConversationMessage, Hashtag, Upload
+from .pagination import InvalidCursor, get_page_size, paginate_keyset
+from .timeline import home_timeline
+from .viewer_state import attach_viewer_state, load_viewer_state
+from .suggestions import get_suggested_users
+from . import db, hashtags, images, notifications, presence, search, stories, typeahead, uploads
+from .serializers import (
+    CommentSerializer, ConversationSerializer, MessageSerializer, NotificationGroupSerializer,
+    PostCardSerializer, PostSerializer, UserSerializer, UserWithStatsSerializer,
+)
 
 # ==================== AUTHENTICATION & BASIC VIEWS ====================
 
@@ -88,6 +99,14 @@ def edit_profile_view(request):
         # Ensure profile exists
         profile, created = Profile.objects.get_or_create(user=user)
         
+        try:
+            claimed = {
+                field: uploads.claim(user, request.POST[f'{field}_upload'])
+                for field in ('profile_pic', 'cover_pic') if request.POST.get(f'{field}_upload')
+            }
+        except uploads.InvalidUpload as e:
+            return JsonResponse({'success': False, 'message': str(e)}, status=e.status)
+
         # Handle basic user data
         user.first_name = request.POST.get('first_name', '')
         user.last_name = request.POST.get('last_name', '')
@@ -127,6 +146,10 @@ def edit_profile_view(request):
                 
         if 'cover_pic' in request.FILES:
             profile.cover_pic = request.FILES['cover_pic']
+
+        # Finished chunked uploads (see core.uploads)
+        for field, upload in claimed.items():
+            setattr(profile, field, upload)
             
         # Handle cropped image data
         try:
@@ -166,6 +189,8 @@ def edit_profile_view(request):
                 profile.cover_pic = None
                 
         profile.save()
+        for upload in claimed.values():
+            upload.release()
         
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or 'profile_pic_data' in request.POST or 'cover_pic_data' in request.POST:
             return JsonResponse({'success': True, 'message': 'Profile updated successfully'})
@@ -180,6 +205,8 @@ def edit_profile_view(request):
 
 # ==================== FEED & POST VIEWS ====================
 
+FEED_PAGE_SIZE = 20
+
 @login_required
 def feed_view(request):
     """Main feed with posts from followed users"""
@@ -187,23 +214,22 @@ def feed_view(request):
         # Ensure user has a profile
         profile, created = Profile.objects.get_or_create(user=request.user)
         
-        # Get users that current user follows
-        following_users = Follow.objects.filter(follower=request.user).values_list('following', flat=True)
-        
-        # Posts from followed users + own posts
-        posts = Post.objects.filter(
-            Q(author__in=following_users) | Q(author=request.user)
-        ).select_related('author').prefetch_related('likes', 'comments').order_by('-created_at')
+        # First page of posts from followed users + own posts, served from the
+        # precomputed timeline; the page continues via /api/load-more-posts/
+        posts, next_cursor = home_timeline(
+            request.user, None, FEED_PAGE_SIZE,
+            queryset=PostCardSerializer.prepare(Post.objects.all())
+        )
+        attach_viewer_state(posts, request.user)
         
         # User suggestions
-        suggestions = User.objects.exclude(
-            Q(id=request.user.id) | Q(id__in=following_users)
-        ).order_by('?')[:5]
+        suggestions = get_suggested_users(request.user, 5, queryset=UserSerializer.prepare(User.objects.all()))
         
         form = PostForm()
         
         context = {
             'posts': posts,
+            'next_cursor': next_cursor,
             'form': form,
             'suggestions': suggestions,
         }
@@ -284,6 +310,14 @@ def create_post_view(request):
         
         content = request.POST.get('content', '').strip()
         post_type = request.POST.get('post_type', 'text')
+
+        try:
+            image_upload = uploads.claim(request.user, request.POST['image_upload']) \
+                if request.POST.get('image_upload') else None
+            video_upload = uploads.claim(request.user, request.POST['video_upload'], ('video',)) \
+                if request.POST.get('video_upload') else None
+        except uploads.InvalidUpload as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=e.status)
         
         # Create post
         post = Post.objects.create(
@@ -294,11 +328,15 @@ def create_post_view(request):
         
         # Handle multiple images
         images = request.FILES.getlist('image')
-        if images:
+        if image_upload:
+            post.image = image_upload
+        elif images:
             # Save first image to post.image field
             post.image = images[0]
             # You might want to handle multiple images differently
             # depending on your model structure
+        if video_upload:
+            post.video = video_upload
         
         # Handle poll
         if post_type == 'poll':
@@ -325,6 +363,9 @@ def create_post_view(request):
                 print(f"Error parsing location: {e}")
         
         post.save()
+        for upload in (image_upload, video_upload):
+            if upload:
+                upload.release()
         
         # Return consistent JSON response
         return JsonResponse({
@@ -350,7 +391,8 @@ def delete_post(request, post_id):
 @login_required
 def post_detail(request, post_id):
     """Post detail view"""
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(PostCardSerializer.prepare(Post.objects.all()), id=post_id)
+    attach_viewer_state([post], request.user)
     return render(request, 'core/post_detail.html', {'post': post})
 
 @login_required
@@ -390,15 +432,8 @@ def unread_persons_count(request):
         return JsonResponse({'success': False, 'error': 'Authentication required'})
     
     try:
-        # Get conversations where user has unread messages
-        unread_conversations = Conversation.objects.filter(
-            Q(user1=request.user) | Q(user2=request.user),
-            messages__is_read=False,
-            messages__sender__ne=request.user
-        ).distinct()
-        
-        # Count unique persons with unread messages
-        unread_persons_count = unread_conversations.count()
+        # Conversations where the user's read watermark is behind
+        unread_persons_count = request.user.conversation_memberships.filter(unread_count__gt=0).count()
         
         return JsonResponse({
             'success': True,
@@ -419,38 +454,24 @@ def like_post(request, post_id):
     """Like/unlike a post"""
     try:
         post = get_object_or_404(Post, id=post_id)
-        like, created = Like.objects.get_or_create(user=request.user, post=post)
-        
-        if not created:
-            like.delete()
-            liked = False
-            # Remove notification if exists
-            from .models import Notification
-            Notification.objects.filter(
-                sender=request.user,
-                recipient=post.author,
-                target_post=post,
-                notification_type='like'
-            ).delete()
+        with transaction.atomic():
+            created = db.insert_ignore(Like, user=request.user, post=post)[1]
+            if not created:
+                Like.objects.filter(user=request.user, post=post).delete()
+        
+        # Notifications are written by the batched pipeline after commit
+        liked = created
+        if created:
+            notifications.notify(post.author_id, request.user.id, 'like', 'liked your post', target_post_id=post.id)
         else:
-            liked = True
-            # Create notification if not liking own post
-            if post.author != request.user:
-                from .models import Notification
-                Notification.objects.get_or_create(
-                    sender=request.user,
-                    recipient=post.author,
-                    target_post=post,
-                    notification_type='like',
-                    verb=f'liked your post'
-                )
+            notifications.retract(post.author_id, request.user.id, 'like', target_post_id=post.id)
         
-        like_count = post.likes.count()
+        post.refresh_from_db(fields=['likes_count'])
         
         return JsonResponse({
             'success': True,
             'liked': liked,
-            'like_count': like_count
+            'like_count': post.likes_count
         })
     except Exception as e:
         return JsonResponse({
@@ -465,12 +486,11 @@ def get_post_like_status(request, post_id):
     try:
         post = get_object_or_404(Post, id=post_id)
         is_liked = post.likes.filter(user=request.user).exists()
-        like_count = post.likes.count()
         
         return JsonResponse({
             'success': True,
             'is_liked': is_liked,
-            'like_count': like_count
+            'like_count': post.likes_count
         })
     except Exception as e:
         return JsonResponse({
@@ -484,21 +504,13 @@ def get_liked_users(request, post_id):
     """Get users who liked a post"""
     try:
         post = get_object_or_404(Post, id=post_id)
-        likes = post.likes.select_related('user', 'user__profile')[:20]
-        
-        liked_users = []
-        for like in likes:
-            liked_users.append({
-                'id': like.user.id,
-                'username': like.user.username,
-                'name': like.user.profile.full_name,
-                'avatar': like.user.profile.profile_pic.url if like.user.profile.profile_pic else None
-            })
+        users = UserSerializer.prepare(User.objects.filter(likes__post=post)).order_by('-likes__created_at')[:20]
+        liked_users = [UserSerializer.serialize(user) for user in users]
         
         return JsonResponse({
             'success': True,
             'liked_users': liked_users,
-            'total_likes': post.likes.count()
+            'total_likes': post.likes_count
         })
     except Exception as e:
         return JsonResponse({
@@ -532,17 +544,7 @@ def add_comment(request):
         
         response_data = {
             'success': True,
-            'comment': {
-                'id': comment.id,
-                'content': comment.content,
-                'user': {
-                    'username': comment.user.username,
-                    'name': comment.user.profile.full_name,
-                    'avatar': comment.user.profile.profile_pic.url if comment.user.profile.profile_pic else None
-                },
-                'created_at': comment.created_at.strftime('%b %d, %Y %H:%M'),
-                'is_owner': True
-            }
+            'comment': CommentSerializer.serialize(comment, request.user)
         }
         
         return JsonResponse(response_data)
@@ -558,21 +560,8 @@ def get_comments(request, post_id):
     """Get comments for a post"""
     try:
         post = get_object_or_404(Post, id=post_id)
-        comments = post.comments.select_related('user', 'user__profile').order_by('created_at')
-        
-        comments_data = []
-        for comment in comments:
-            comments_data.append({
-                'id': comment.id,
-                'content': comment.content,
-                'user': {
-                    'username': comment.user.username,
-                    'name': comment.user.profile.full_name,
-                    'avatar': comment.user.profile.profile_pic.url if comment.user.profile.profile_pic else None
-                },
-                'created_at': comment.created_at.strftime('%b %d, %Y %H:%M'),
-                'is_owner': comment.user == request.user
-            })
+        comments = CommentSerializer.prepare(post.comments.all()).order_by('created_at')
+        comments_data = [CommentSerializer.serialize(comment, request.user) for comment in comments]
         
         return JsonResponse({
             'success': True,
@@ -645,40 +634,20 @@ def follow_user(request, user_id):
                 'error': 'Cannot follow yourself'
             }, status=400)
         
-        # Check if already following
-        follow_relation = Follow.objects.filter(
-            follower=request.user,
-            following=user_to_follow
-        ).first()
+        # Follow, or unfollow if the row was already there
+        with transaction.atomic():
+            created = db.insert_ignore(Follow, follower=request.user, following=user_to_follow)[1]
+            if not created:
+                Follow.objects.filter(follower=request.user, following=user_to_follow).delete()
         
-        if follow_relation:
-            # Unfollow
-            follow_relation.delete()
+        if not created:
             action = 'unfollowed'
             is_following = False
-            # Remove notification
-            from .models import Notification
-            Notification.objects.filter(
-                sender=request.user,
-                recipient=user_to_follow,
-                notification_type='follow'
-            ).delete()
+            notifications.retract(user_to_follow.id, request.user.id, 'follow')
         else:
-            # Follow
-            Follow.objects.create(
-                follower=request.user,
-                following=user_to_follow
-            )
             action = 'followed'
             is_following = True
-            # Create notification
-            from .models import Notification
-            Notification.objects.get_or_create(
-                sender=request.user,
-                recipient=user_to_follow,
-                notification_type='follow',
-                verb=f'started following you'
-            )
+            notifications.notify(user_to_follow.id, request.user.id, 'follow', 'started following you')
         
         # Get updated counts
         followers_count = Follow.objects.filter(following=user_to_follow).count()
@@ -769,7 +738,17 @@ def update_profile_pic(request):
     try:
         profile, created = Profile.objects.get_or_create(user=request.user)
         
-        if 'profile_pic' in request.FILES:
+        if request.POST.get('upload_id'):
+            upload = uploads.claim(request.user, request.POST['upload_id'])
+            profile.profile_pic = upload
+            profile.save()
+            upload.release()
+            return JsonResponse({
+                'success': True,
+                'message': 'Profile picture updated successfully',
+                'new_image_url': profile.profile_pic.url
+            })
+        elif 'profile_pic' in request.FILES:
             profile.profile_pic = request.FILES['profile_pic']
             profile.save()
             
@@ -783,6 +762,8 @@ def update_profile_pic(request):
                 'success': False,
                 'error': 'No image provided'
             }, status=400)
+    except uploads.InvalidUpload as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=e.status)
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -823,7 +804,17 @@ def update_cover_pic(request):
     try:
         profile, created = Profile.objects.get_or_create(user=request.user)
         
-        if 'cover_pic' in request.FILES:
+        if request.POST.get('upload_id'):
+            upload = uploads.claim(request.user, request.POST['upload_id'])
+            profile.cover_pic = upload
+            profile.save()
+            upload.release()
+            return JsonResponse({
+                'success': True,
+                'message': 'Cover photo updated successfully',
+                'new_image_url': profile.cover_pic.url
+            })
+        elif 'cover_pic' in request.FILES:
             profile.cover_pic = request.FILES['cover_pic']
             profile.save()
             
@@ -837,6 +828,8 @@ def update_cover_pic(request):
                 'success': False,
                 'error': 'No image provided'
             }, status=400)
+    except uploads.InvalidUpload as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=e.status)
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -919,6 +912,11 @@ def update_profile_info(request):
 
 # ==================== SEARCH & SUGGESTIONS ====================
 
+def _users_in_order(ids):
+    """Users (with profiles) for typeahead result ids, keeping their order."""
+    users = User.objects.select_related('profile').in_bulk(ids)
+    return [users[user_id] for user_id in ids if user_id in users]
+
 @login_required
 @require_GET
 def search_users(request):
@@ -933,11 +931,8 @@ def search_users(request):
             })
         
         # Search users excluding current user
-        users = User.objects.filter(
-            Q(username__icontains=query) |
-            Q(first_name__icontains=query) |
-            Q(last_name__icontains=query)
-        ).exclude(id=request.user.id).select_related('profile')[:10]
+        ids = typeahead.search(query, 10, accept=lambda user_id: user_id != request.user.id)
+        users = _users_in_order(ids)
         
         users_data = []
         for user in users:
@@ -971,23 +966,12 @@ def search_users(request):
 def suggested_users(request):
     """Get user suggestions"""
     try:
-        # Get users that current user follows
-        following_users = Follow.objects.filter(follower=request.user).values_list('following', flat=True)
-        
         # Suggest users not followed by current user
-        suggestions = User.objects.exclude(
-            Q(id=request.user.id) | Q(id__in=following_users)
-        ).order_by('?')[:10]
+        suggestions = get_suggested_users(
+            request.user, 10, queryset=UserWithStatsSerializer.prepare(User.objects.all())
+        )
         
-        users_data = []
-        for user in suggestions:
-            users_data.append({
-                'id': user.id,
-                'username': user.username,
-                'name': user.profile.full_name,
-                'avatar': user.profile.profile_pic.url if user.profile.profile_pic else None,
-                'posts_count': user.post_set.count()
-            })
+        users_data = [UserWithStatsSerializer.serialize(user) for user in suggestions]
         
         return JsonResponse({
             'success': True,
@@ -1004,96 +988,59 @@ def suggested_users(request):
 @login_required
 @require_GET
 def post_list_api(request):
-    """API: Get paginated posts"""
+    """API: Get posts page by page using ?cursor= (keyset pagination)"""
     try:
-        page = int(request.GET.get('page', 1))
-        posts_per_page = 10
-        
-        # Get users that current user follows
-        following_users = Follow.objects.filter(follower=request.user).values_list('following', flat=True)
+        limit = get_page_size(request)
         
         # Posts from followed users + own posts
-        posts = Post.objects.filter(
-            Q(author__in=following_users) | Q(author=request.user)
-        ).select_related('author', 'author__profile').prefetch_related('likes', 'comments').order_by('-created_at')
-        
-        # Manual pagination
-        total_posts = posts.count()
-        total_pages = (total_posts + posts_per_page - 1) // posts_per_page
-        start_idx = (page - 1) * posts_per_page
-        end_idx = start_idx + posts_per_page
-        
-        paginated_posts = posts[start_idx:end_idx]
-        
-        posts_data = []
-        for post in paginated_posts:
-            posts_data.append({
-                'id': post.id,
-                'content': post.content,
-                'author': {
-                    'id': post.author.id,
-                    'username': post.author.username,
-                    'name': post.author.profile.full_name,
-                    'avatar': post.author.profile.profile_pic.url if post.author.profile.profile_pic else None
-                },
-                'image': post.image.url if post.image else None,
-                'video': post.video.url if post.video else None,
-                'created_at': post.created_at.strftime('%b %d, %Y %H:%M'),
-                'like_count': post.likes.count(),
-                'comment_count': post.comments.count(),
-                'is_liked': post.likes.filter(user=request.user).exists(),
-                'is_owner': post.author == request.user
-            })
+        paginated_posts, next_cursor = home_timeline(
+            request.user, request.GET.get('cursor'), limit,
+            queryset=PostSerializer.prepare(Post.objects.all())
+        )
+        posts_data = PostSerializer.serialize_many(paginated_posts, request.user)
+        
+        pagination = {
+            'next_cursor': next_cursor,
+            'has_next': next_cursor is not None,
+        }
+        # Counting the whole timeline is expensive, only do it on request
+        if request.GET.get('include_total') == '1':
+            pagination['total_posts'] = request.user.timeline_entries.count()
         
         return JsonResponse({
             'success': True,
             'posts': posts_data,
-            'pagination': {
-                'current_page': page,
-                'total_pages': total_pages,
-                'has_next': page < total_pages,
-                'has_previous': page > 1,
-                'total_posts': total_posts
-            }
+            'pagination': pagination
         })
+    except InvalidCursor as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({
             'success': False,
             'error': str(e)
         }, status=500)
 
+NOTIFICATIONS_PAGE_SIZE = 20
+
 @login_required
 @require_GET
 def notifications_api(request):
-    """API: Get notifications"""
+    """API: Get notifications grouped by (type, post), newest group first"""
     try:
-        from .models import Notification
-        
-        notifications_qs = Notification.objects.filter(
-            recipient=request.user
-        ).select_related('sender', 'sender__profile').order_by('-timestamp')[:20]
-        
-        notifications = []
-        for notification in notifications_qs:
-            notifications.append({
-                'id': notification.id,
-                'type': notification.notification_type,
-                'actor': {
-                    'username': notification.sender.username,
-                    'full_name': notification.sender.profile.full_name,
-                    'profile_pic': notification.sender.profile.profile_pic.url if notification.sender.profile.profile_pic else None
-                },
-                'message': notification.verb,
-                'created_at': notification.timestamp.strftime('%b %d, %Y %H:%M'),
-                'is_read': notification.is_read
-            })
-        
-        unread_count = Notification.objects.filter(recipient=request.user, is_read=False).count()
-        
+        limit = get_page_size(request, default=NOTIFICATIONS_PAGE_SIZE)
+        groups, next_cursor = notifications.grouped(request.user, request.GET.get('cursor'), limit)
+
         return JsonResponse({
-            'notifications': notifications,
-            'unread_count': unread_count
+            'success': True,
+            'notifications': [NotificationGroupSerializer.serialize(group) for group in groups],
+            'unread_count': notifications.unread_count(request.user.id),
+            'pagination': {
+                'next_cursor': next_cursor,
+                'has_next': next_cursor is not None,
+            }
         })
+    except InvalidCursor as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({
             'notifications': [],
@@ -1103,13 +1050,10 @@ def notifications_api(request):
 @login_required
 @require_GET
 def unread_notification_count(request):
-    """API: Get unread notification count"""
+    """API: Get unread notification count (served from cache)"""
     try:
-        from .models import Notification
-        unread_count = Notification.objects.filter(recipient=request.user, is_read=False).count()
-        
         return JsonResponse({
-            'unread_count': unread_count
+            'unread_count': notifications.unread_count(request.user.id)
         })
     except Exception as e:
         return JsonResponse({
@@ -1119,16 +1063,15 @@ def unread_notification_count(request):
 @login_required
 @require_POST
 def mark_notification_read(request, notification_id):
-    """Mark notification as read"""
+    """Mark a notification, and the rest of its group, as read"""
     try:
-        from .models import Notification
-        notification = get_object_or_404(Notification, id=notification_id, recipient=request.user)
-        notification.is_read = True
-        notification.save()
-        
+        if notifications.mark_group_read(request.user, notification_id) is None:
+            return JsonResponse({'success': False, 'error': 'Notification not found'}, status=404)
+
         return JsonResponse({
             'success': True,
-            'message': 'Notification marked as read'
+            'message': 'Notification marked as read',
+            'unread_count': notifications.unread_count(request.user.id)
         })
     except Exception as e:
         return JsonResponse({
@@ -1143,10 +1086,12 @@ def mark_all_notifications_read(request):
     try:
         from .models import Notification
         Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
-        
+        notifications.reset_unread(request.user.id)
+
         return JsonResponse({
             'success': True,
-            'message': 'All notifications marked as read'
+            'message': 'All notifications marked as read',
+            'unread_count': 0
         })
     except Exception as e:
         return JsonResponse({
@@ -1156,35 +1101,31 @@ def mark_all_notifications_read(request):
 
 # ==================== UTILITY VIEWS ====================
 
+ONLINE_FRIENDS_SCAN_LIMIT = 500
+PRESENCE_BATCH_LIMIT = 200
+
 @login_required
 @require_GET
 def get_online_users(request):
     """Get list of actual online friends"""
     try:
-        # Get users that current user follows (friends)
-        following_users = Follow.objects.filter(follower=request.user).values_list('following', flat=True)
-        
-        # Get actual friends who are following back (mutual follows)
-        mutual_friends = User.objects.filter(
-            id__in=following_users,
-            following__follower=request.user
-        ).select_related('profile')[:10]
+        # Mutual follows, online ones first, by presence heartbeat
+        friend_ids = list(User.objects.filter(
+            followers__follower=request.user,
+            following__following=request.user,
+        ).values_list('id', flat=True)[:ONLINE_FRIENDS_SCAN_LIMIT])
+        states = presence.get_presence(friend_ids)
+        friend_ids.sort(key=lambda pk: states[pk]['is_online'], reverse=True)
+        shown = friend_ids[:10]
+        users = UserSerializer.prepare(User.objects.filter(id__in=shown)).in_bulk()
         
         users_data = []
-        for user in mutual_friends:
-            # Check if user has been active recently (last 30 minutes)
-            is_online = user.last_login and (timezone.now() - user.last_login) < timedelta(minutes=30)
-            
-            users_data.append({
-                'id': user.id,
-                'username': user.username,
-                'name': user.profile.full_name,
-                'avatar': user.profile.profile_pic.url if user.profile.profile_pic else None,
-                'is_online': is_online
-            })
-        
-        # Sort by online status
-        users_data.sort(key=lambda x: x['is_online'], reverse=True)
+        for user_id in shown:
+            if user_id not in users:
+                continue
+            data = UserSerializer.serialize(users[user_id])
+            data['is_online'] = states[user_id]['is_online']
+            users_data.append(data)
         
         return JsonResponse({
             'success': True,
@@ -1197,23 +1138,22 @@ def get_online_users(request):
             'error': str(e)
         }, status=500)
 
+TRENDING_LIMIT = 10
+
 @login_required
 @require_GET
 def get_trending_hashtags(request):
-    """Get trending hashtags"""
-    try:
-        # Placeholder implementation
-        hashtags = [
-            {'name': 'mytro', 'count': 150},
-            {'name': 'socialmedia', 'count': 89},
-            {'name': 'django', 'count': 67},
-            {'name': 'python', 'count': 45},
-            {'name': 'webdev', 'count': 32}
+    """Get trending hashtags from the last roll-up (see core.hashtags)"""
+    try:
+        trending = [
+            # `tag` is the key the feed sidebar reads
+            {'name': entry['name'], 'tag': entry['name'], 'count': entry['count'], 'score': entry['score']}
+            for entry in hashtags.trending(TRENDING_LIMIT)
         ]
         
         return JsonResponse({
             'success': True,
-            'hashtags': hashtags
+            'hashtags': trending
         })
     except Exception as e:
         return JsonResponse({
@@ -1221,6 +1161,30 @@ def get_trending_hashtags(request):
             'error': str(e)
         }, status=500)
 
+@login_required
+def hashtag_posts(request, name):
+    """Posts tagged #name, newest first, continuing from ?cursor="""
+    name = name.casefold()
+    hashtag = Hashtag.objects.filter(name=name).first()
+    posts, next_cursor = [], None
+    if hashtag is not None:
+        try:
+            posts, next_cursor = paginate_keyset(
+                PostCardSerializer.prepare(Post.objects.filter(hashtags=hashtag)),
+                request.GET.get('cursor'), FEED_PAGE_SIZE,
+            )
+        except InvalidCursor:
+            return redirect('hashtag_posts', name=name)
+        attach_viewer_state(posts, request.user)
+    
+    return render(request, 'core/hashtag_posts.html', {
+        'hashtag': name,
+        'posts': posts,
+        'next_cursor': next_cursor,
+        'post_count': hashtag.usage_count if hashtag else 0,
+        'trending_hashtags': hashtags.trending(TRENDING_LIMIT),
+    })
+
 @login_required
 @require_GET
 def check_profile_completion(request):
@@ -1276,8 +1240,14 @@ def check_username_availability(request):
                 'message': 'Username must be at least 3 characters'
             })
         
-        # Check if username exists (excluding current user)
-        exists = User.objects.filter(username__iexact=username).exclude(id=request.user.id).exists()
+        # Check if username exists (excluding current user). The index
+        # answers "taken" on its own; "available" is confirmed against the
+        # database since another process's signup may not have reached it.
+        owner = typeahead.username_owner(username)
+        if owner is None:
+            exists = User.objects.filter(username__iexact=username).exclude(id=request.user.id).exists()
+        else:
+            exists = owner != request.user.id
         
         if exists:
             return JsonResponse({
@@ -1336,12 +1306,12 @@ def repost_post(request, post_id):
             reposted = True
             message = "Quoted post" if is_quote else "Reposted successfully"
         
-        repost_count = Post.objects.filter(repost_parent=original_post).count()
+        original_post.refresh_from_db(fields=['repost_count'])
         
         return JsonResponse({
             'success': True,
             'reposted': reposted,
-            'repost_count': repost_count,
+            'repost_count': original_post.repost_count,
             'message': message
         })
     except Exception as e:
@@ -1355,40 +1325,24 @@ def repost_post(request, post_id):
 @login_required
 @require_GET
 def load_more_posts(request):
-    """Load more posts for infinite scroll"""
+    """Load more posts for infinite scroll, continuing from ?cursor="""
     try:
-        offset = int(request.GET.get('offset', 0))
-        limit = 10
+        limit = get_page_size(request)
         
-        # Get users that current user follows
-        following_users = Follow.objects.filter(follower=request.user).values_list('following', flat=True)
-        
-        posts = Post.objects.filter(
-            Q(author__in=following_users) | Q(author=request.user)
-        ).select_related('author', 'author__profile').prefetch_related('likes', 'comments').order_by('-created_at')[offset:offset + limit]
-        
-        posts_data = []
-        for post in posts:
-            posts_data.append({
-                'id': post.id,
-                'content': post.content,
-                'author': {
-                    'username': post.author.username,
-                    'name': post.author.profile.full_name,
-                    'avatar': post.author.profile.profile_pic.url if post.author.profile.profile_pic else None
-                },
-                'image': post.image.url if post.image else None,
-                'like_count': post.likes.count(),
-                'comments_count': post.comments.count(),
-                'is_liked': post.likes.filter(user=request.user).exists(),
-                'created_at': post.created_at.strftime('%b %d, %Y')
-            })
+        posts, next_cursor = home_timeline(
+            request.user, request.GET.get('cursor'), limit,
+            queryset=PostSerializer.prepare(Post.objects.all())
+        )
+        posts_data = PostSerializer.serialize_many(posts, request.user)
         
         return JsonResponse({
             'success': True,
             'posts': posts_data,
-            'has_more': len(posts_data) == limit
+            'has_more': next_cursor is not None,
+            'next_cursor': next_cursor
         })
+    except InvalidCursor as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -1453,19 +1407,20 @@ def get_posts_like_status(request):
     """Get like status for multiple posts"""
     try:
         post_ids = request.GET.get('post_ids', '').split(',')
-        post_ids = [pid.strip() for pid in post_ids if pid.strip().isdigit()]
+        post_ids = [int(pid) for pid in post_ids if pid.strip().isdigit()]
         
         if not post_ids:
             return JsonResponse({'success': True, 'posts': {}})
         
-        posts = Post.objects.filter(id__in=post_ids)
+        posts = Post.objects.filter(id__in=post_ids).only('id', 'likes_count')
+        viewer_state = load_viewer_state(request.user, post_ids)
         result = {}
         
         for post in posts:
-            is_liked = post.likes.filter(user=request.user).exists()
             result[str(post.id)] = {
-                'is_liked': is_liked,
-                'like_count': post.likes.count()
+                'is_liked': post.id in viewer_state.liked,
+                'is_saved': post.id in viewer_state.saved,
+                'like_count': post.likes_count
             }
         
         return JsonResponse({
@@ -1534,23 +1489,17 @@ def create_group(request):
 @login_required
 @require_GET
 def get_unread_message_count(request):
-    """Get unread message count for notifications - FIXED"""
+    """Get unread message count for notifications, from the stored per-member counters"""
     try:
-        from .models import ConversationMessage
-        
-        # Total unread messages count from Conversation system
-        total_unread = ConversationMessage.objects.filter(
-            conversation__participants=request.user,
-            is_read=False
-        ).exclude(sender=request.user).count()
+        from django.db.models import Count, Sum
         
-        # Unique senders with unread messages
-        unique_senders = ConversationMessage.objects.filter(
-            conversation__participants=request.user,
-            is_read=False
-        ).exclude(sender=request.user).values('sender').distinct().count()
-        
-        print(f"📊 Unread counts - Total: {total_unread}, Senders: {unique_senders}")
+        counts = request.user.conversation_memberships.aggregate(
+            total_unread=Sum('unread_count'),
+            # Conversations with unread messages, i.e. people waiting on a reply
+            unique_senders=Count('id', filter=Q(unread_count__gt=0)),
+        )
+        total_unread = counts['total_unread'] or 0
+        unique_senders = counts['unique_senders']
         
         return JsonResponse({
             'success': True,
@@ -1570,22 +1519,20 @@ def get_unread_message_count(request):
 @login_required
 @require_POST
 def mark_conversation_read(request, conversation_id):
-    """Mark all messages in conversation as read - FIXED"""
+    """Mark all messages in conversation as read by moving the reader's watermark"""
     try:
-        from .models import ConversationMessage
+        from django.db.models import Max
         
-        # Mark all messages in conversation as read
-        updated_count = ConversationMessage.objects.filter(
-            conversation_id=conversation_id,
-            is_read=False
-        ).exclude(sender=request.user).update(is_read=True)
-        
-        print(f"✅ Marked {updated_count} messages as read in conversation {conversation_id}")
+        latest = ConversationMessage.objects.filter(
+            conversation_id=conversation_id
+        ).aggregate(last=Max('id'))['last']
+        updated_count = 0
+        if latest:
+            updated_count = ConversationMember.mark_read(conversation_id, request.user.id, latest)
         
         return JsonResponse({'success': True, 'updated_count': updated_count})
         
     except Exception as e:
-        print(f"❌ Error in mark_conversation_read: {e}")
         return JsonResponse({'success': False, 'error': str(e)})
 
 # ==================== LEGACY COMPATIBILITY ====================
@@ -1667,17 +1614,7 @@ def reply_comment(request, comment_id):
         
         return JsonResponse({
             'success': True,
-            'reply': {
-                'id': reply.id,
-                'content': reply.content,
-                'user': {
-                    'username': reply.user.username,
-                    'name': reply.user.profile.full_name,
-                    'avatar': reply.user.profile.profile_pic.url if reply.user.profile.profile_pic else None
-                },
-                'created_at': reply.created_at.strftime('%b %d, %Y %H:%M'),
-                'is_owner': True
-            }
+            'reply': CommentSerializer.serialize(reply, request.user)
         })
     except Exception as e:
         return JsonResponse({
@@ -1776,6 +1713,9 @@ def debug_urls(request):
 
 # ==================== MESSAGING SYSTEM ====================
 
+CONVERSATIONS_PAGE_SIZE = 30
+MESSAGES_PAGE_SIZE = 30
+
 @login_required
 @require_GET
 def messages_view(request):
@@ -1786,67 +1726,34 @@ def messages_view(request):
 @login_required
 @require_GET
 def get_conversations(request):
-    """Get user's conversations with proper unread count - FIXED"""
-    try:
-        from .models import Conversation, ConversationMessage
-        
-        conversations = request.user.conversations.all().order_by('-updated_at')
-        
-        conversations_data = []
-        for conv in conversations:
-            if conv.is_group:
-                # Group conversation
-                name = conv.group_name or "Group Chat"
-                avatar = conv.group_photo.url if conv.group_photo else None
-                other_user_id = None
-            else:
-                # One-on-one conversation
-                other_user = conv.get_other_participant(request.user)
-                if other_user:
-                    name = other_user.profile.full_name if hasattr(other_user, 'profile') else other_user.username
-                    avatar = other_user.profile.profile_pic.url if other_user.profile and other_user.profile.profile_pic else None
-                    other_user_id = other_user.id
-                else:
-                    name = "Unknown User"
-                    avatar = None
-                    other_user_id = None
-            
-            last_message = conv.messages.last()
-            
-            # Calculate unread count - FIXED
-            unread_count = conv.messages.filter(is_read=False).exclude(sender=request.user).count()
-            
-            conversations_data.append({
-                'id': conv.id,
-                'is_group': conv.is_group,
-                'name': name,
-                'avatar': avatar,
-                'other_user_id': other_user_id,
-                'last_message': {
-                    'content': last_message.content if last_message else 'No messages yet',
-                    'timestamp': last_message.timestamp.strftime('%H:%M') if last_message else '',
-                    'sender': last_message.sender.username if last_message else '',
-                    'unread': unread_count,
-                    'is_own': last_message.sender == request.user if last_message else False
-                } if last_message else {
-                    'content': 'No messages yet',
-                    'timestamp': '',
-                    'sender': '',
-                    'unread': 0,
-                    'is_own': False
-                },
-                'unread_count': unread_count,
-                'online': False  # You can implement online status later
-            })
+    """Get user's conversations, most recently active first (?cursor=&limit=)
+
+    The cursor pages on `updated_at`, which moves whenever a message
+    arrives: a conversation that becomes active mid-scroll jumps above the
+    cursor and is not repeated on later pages, so clients merge it in from
+    the realtime 'message.new' event (or a refetch of the first page)
+    rather than expecting every conversation to appear exactly once.
+    """
+    try:
+        limit = get_page_size(request, CONVERSATIONS_PAGE_SIZE)
+        conversations, next_cursor = paginate_keyset(
+            ConversationSerializer.prepare(request.user.conversations.all(), request.user),
+            request.GET.get('cursor'), limit, field='updated_at'
+        )
+        conversations_data = ConversationSerializer.serialize_many(conversations, request.user)
         
-        print(f"💬 Loaded {len(conversations_data)} conversations")
         return JsonResponse({
             'success': True,
-            'conversations': conversations_data
+            'conversations': conversations_data,
+            'pagination': {
+                'next_cursor': next_cursor,
+                'has_next': next_cursor is not None,
+            }
         })
         
+    except InvalidCursor as e:
+        return JsonResponse({'success': False, 'conversations': [], 'error': str(e)}, status=400)
     except Exception as e:
-        print(f"❌ Error in get_conversations: {e}")
         return JsonResponse({
             'success': False, 
             'conversations': [],
@@ -1897,18 +1804,7 @@ def send_message(request):
         return JsonResponse({
             'success': True,
             'conversation_id': conversation.id,
-            'message': {
-                'id': message.id,
-                'content': message.content,
-                'sender': {
-                    'id': message.sender.id,
-                    'name': message.sender.profile.full_name if hasattr(message.sender, 'profile') else message.sender.username,
-                    'avatar': message.sender.profile.profile_pic.url if message.sender.profile and message.sender.profile.profile_pic else None
-                },
-                'timestamp': message.timestamp.strftime('%H:%M'),
-                'is_read': message.is_read,
-                'is_own': True
-            }
+            'message': MessageSerializer.serialize(message, request.user)
         })
         
     except Exception as e:
@@ -1956,42 +1852,57 @@ def start_conversation(request):
 @login_required
 @require_GET
 def get_messages(request, conversation_id):
-    """Get messages for a conversation - FIXED"""
+    """Get a page of messages, oldest first.
+
+    Without parameters returns the newest page. ?before=<id> pages back
+    through older history and ?after=<id> returns only messages newer than
+    the client's last one, which is what the poller uses.
+    """
     try:
-        from .models import Conversation, ConversationMessage
+        from .models import Conversation, ConversationMember
         
         conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
-        messages = conversation.messages.all().order_by('timestamp')
-        
-        messages_data = []
-        for message in messages:
-            messages_data.append({
-                'id': message.id,
-                'content': message.content,
-                'sender': {
-                    'id': message.sender.id,
-                    'name': message.sender.profile.full_name if hasattr(message.sender, 'profile') else message.sender.username,
-                    'avatar': message.sender.profile.profile_pic.url if message.sender.profile and message.sender.profile.profile_pic else None
-                },
-                'timestamp': message.timestamp.strftime('%H:%M'),
-                'is_read': message.is_read,
-                'is_own': message.sender == request.user,
-                'type': 'text'  # Default type
-            })
+        try:
+            before = int(request.GET['before']) if request.GET.get('before') else None
+            after = int(request.GET['after']) if request.GET.get('after') else None
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid message cursor'}, status=400)
+        limit = get_page_size(request, MESSAGES_PAGE_SIZE)
+        
+        messages = MessageSerializer.prepare(conversation.messages.all())
+        if after is not None:
+            # Delta sync: everything since the client's last message
+            page = list(messages.filter(id__gt=after).order_by('id')[:limit + 1])
+            has_older = False
+            has_newer = len(page) > limit
+            page = page[:limit]
+        else:
+            if before is not None:
+                messages = messages.filter(id__lt=before)
+            page = list(messages.order_by('-id')[:limit + 1])
+            has_older = len(page) > limit
+            has_newer = before is not None
+            page = page[:limit][::-1]
         
-        # Mark messages as read - FIXED
-        unread_messages = conversation.messages.filter(is_read=False).exclude(sender=request.user)
-        updated_count = unread_messages.update(is_read=True)
-        print(f"📖 Marked {updated_count} messages as read in conversation {conversation_id}")
+        # Move the reader's watermark up to what they just received
+        if page and before is None:
+            ConversationMember.mark_read(conversation.id, request.user.id, page[-1].id)
+        watermarks = dict(conversation.members.values_list('user_id', 'last_read_message_id'))
+        messages_data = [MessageSerializer.serialize(message, request.user, watermarks) for message in page]
         
         return JsonResponse({
             'success': True,
             'messages': messages_data,
-            'conversation_id': conversation_id
+            'conversation_id': conversation_id,
+            'pagination': {
+                'before': page[0].id if page else before,
+                'last_id': page[-1].id if page else after,
+                'has_older': has_older,
+                'has_newer': has_newer,
+            }
         })
         
     except Exception as e:
-        print(f"❌ Error in get_messages: {e}")
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
 @login_required
@@ -2003,6 +1914,8 @@ def create_story(request):
         
         story_type = request.POST.get('story_type', 'text')
         text_content = request.POST.get('story_text', '')
+        upload = uploads.claim(request.user, request.POST['story_upload'], ('image', 'video')) \
+            if request.POST.get('story_upload') else None
         
         story = Story.objects.create(
             user=request.user,
@@ -2010,57 +1923,50 @@ def create_story(request):
             text_content=text_content
         )
         
-        if 'story_image' in request.FILES:
+        if upload:
+            # The file's content decides whether this is a photo or a video story
+            setattr(story, uploads.kind(upload.content_type), upload)
+            story.save()
+            upload.release()
+        elif 'story_image' in request.FILES:
             story.image = request.FILES['story_image']
             story.save()
+        elif 'story_video' in request.FILES:
+            story.video = request.FILES['story_video']
+            story.save()
         
         return JsonResponse({
             'success': True,
             'story_id': story.id,
             'message': 'Story created successfully'
         })
+    except uploads.InvalidUpload as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=e.status)
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
 @login_required
 @require_GET
 def get_stories(request):
-    """Get all active stories grouped by user"""
+    """Get the stories tray: one entry per user with active stories, from their story rings"""
     try:
-        from .models import Story
-        from django.db.models import Count
-        
-        # Get non-expired stories from followed users and self
-        following_users = Follow.objects.filter(follower=request.user).values_list('following', flat=True)
-        
-        # Get users who have active stories
-        users_with_stories = User.objects.filter(
-            Q(id__in=following_users) | Q(id=request.user.id),
-            stories__expires_at__gt=timezone.now()
-        ).distinct().select_related('profile')
-        
         stories_data = []
-        for user in users_with_stories:
-            user_stories = Story.objects.filter(
-                user=user,
-                expires_at__gt=timezone.now()
-            ).order_by('-created_at')
-            
-            if user_stories.exists():
-                stories_data.append({
-                    'user': {
-                        'id': user.id,
-                        'name': user.profile.full_name,
-                        'username': user.username,
-                        'avatar': user.profile.profile_pic.url if user.profile.profile_pic else None
-                    },
-                    'story_count': user_stories.count(),
-                    'latest_story': {
-                        'id': user_stories.first().id,
-                        'created_at': user_stories.first().created_at.strftime('%H:%M')
-                    },
-                    'is_viewed': False  # TODO: Implement story views
-                })
+        for ring in stories.tray(request.user):
+            user = ring.user
+            stories_data.append({
+                'user': {
+                    'id': user.id,
+                    'name': user.profile.full_name,
+                    'username': user.username,
+                    'avatar': user.profile.profile_pic.url if user.profile.profile_pic else None
+                },
+                'story_count': ring.story_count,
+                'latest_story': {
+                    'id': ring.latest_story_id,
+                    'created_at': ring.latest_at.strftime('%H:%M')
+                },
+                'is_viewed': False  # TODO: Implement story views
+            })
         
         return JsonResponse({
             'success': True,
@@ -2116,13 +2022,13 @@ def get_user_stories(request, user_id):
         if user != request.user and user.id not in following_users:
             return JsonResponse({'success': False, 'error': 'Not authorized'}, status=403)
         
-        stories = Story.objects.filter(
+        user_stories = Story.objects.filter(
             user=user,
             expires_at__gt=timezone.now()
         ).order_by('-created_at')
         
         stories_data = []
-        for story in stories:
+        for story in user_stories:
             stories_data.append({
                 'id': story.id,
                 'story_type': story.story_type,
@@ -2232,50 +2138,28 @@ def delete_story(request, story_id):
 @login_required
 @require_GET
 def get_user_posts(request, user_id):
-    """Get paginated posts from a specific user"""
+    """Get posts from a specific user, continuing from ?cursor="""
     try:
         user = get_object_or_404(User, id=user_id)
-        page = int(request.GET.get('page', 1))
         exclude_id = request.GET.get('exclude')
-        posts_per_page = 5
+        limit = get_page_size(request, default=5)
         
-        posts_query = Post.objects.filter(author=user).select_related('author', 'author__profile').prefetch_related('likes', 'comments').order_by('-created_at')
+        posts_query = PostSerializer.prepare(Post.objects.filter(author=user))
         
         if exclude_id:
             posts_query = posts_query.exclude(id=exclude_id)
         
-        total_posts = posts_query.count()
-        total_pages = (total_posts + posts_per_page - 1) // posts_per_page
-        start_idx = (page - 1) * posts_per_page
-        end_idx = start_idx + posts_per_page
-        
-        posts = posts_query[start_idx:end_idx]
-        
-        posts_data = []
-        for post in posts:
-            posts_data.append({
-                'id': post.id,
-                'content': post.content,
-                'author': {
-                    'id': post.author.id,
-                    'username': post.author.username,
-                    'name': post.author.profile.full_name or post.author.username,
-                    'avatar': post.author.profile.profile_pic.url if post.author.profile.profile_pic else None
-                },
-                'image': post.image.url if post.image else None,
-                'created_at': post.created_at.strftime('%b %d, %Y'),
-                'like_count': post.likes.count(),
-                'comment_count': post.comments.count(),
-                'is_liked': post.likes.filter(user=request.user).exists()
-            })
+        posts, next_cursor = paginate_keyset(posts_query, request.GET.get('cursor'), limit)
+        posts_data = PostSerializer.serialize_many(posts, request.user)
         
         return JsonResponse({
             'success': True,
             'posts': posts_data,
-            'has_next': page < total_pages,
-            'current_page': page,
-            'total_pages': total_pages
+            'has_next': next_cursor is not None,
+            'next_cursor': next_cursor
         })
+    except InvalidCursor as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -2558,7 +2442,6 @@ def admin_send_notification(request):
         return JsonResponse({'success': False, 'message': 'POST required'}, status=405)
     
     try:
-        from .models import Notification
         data = json.loads(request.body)
         
         user_ids = data.get('user_ids', [])
@@ -2570,25 +2453,15 @@ def admin_send_notification(request):
         if not user_ids:
             return JsonResponse({'success': False, 'message': 'Select at least one user'}, status=400)
         
-        # Send to all users or specific users
-        if 'all' in user_ids:
-            users = User.objects.filter(is_active=True).exclude(id=request.user.id)
-        else:
-            users = User.objects.filter(id__in=user_ids, is_active=True).exclude(id=request.user.id)
-        
-        notifications_created = 0
-        for user in users:
-            Notification.objects.create(
-                sender=request.user,
-                recipient=user,
-                notification_type='mention',
-                verb=f'Admin: {message}'
-            )
-            notifications_created += 1
+        # Written in batches by the notification worker, not in this request
+        notifications.broadcast(
+            request.user.id, f'Admin: {message}',
+            user_ids=None if 'all' in user_ids else user_ids,
+        )
         
         return JsonResponse({
             'success': True,
-            'message': f'Notification sent to {notifications_created} users'
+            'message': 'Notification queued for delivery'
         })
     except Exception as e:
         return JsonResponse({'success': False, 'message': str(e)}, status=500)
@@ -2602,7 +2475,6 @@ def admin_send_message(request):
         return JsonResponse({'success': False, 'message': 'POST required'}, status=405)
     
     try:
-        from .models import Message
         data = json.loads(request.body)
         
         user_ids = data.get('user_ids', [])
@@ -2614,24 +2486,14 @@ def admin_send_message(request):
         if not user_ids:
             return JsonResponse({'success': False, 'message': 'Select at least one user'}, status=400)
         
-        # Send to all users or specific users
-        if 'all' in user_ids:
-            users = User.objects.filter(is_active=True).exclude(id=request.user.id)
-        else:
-            users = User.objects.filter(id__in=user_ids, is_active=True).exclude(id=request.user.id)
-        
-        messages_sent = 0
-        for user in users:
-            Message.objects.create(
-                sender=request.user,
-                recipient=user,
-                content=f'Admin Message: {message_content}'
-            )
-            messages_sent += 1
+        notifications.broadcast(
+            request.user.id, f'Admin Message: {message_content}',
+            user_ids=None if 'all' in user_ids else user_ids, as_message=True,
+        )
         
         return JsonResponse({
             'success': True,
-            'message': f'Message sent to {messages_sent} users'
+            'message': 'Message queued for delivery'
         })
     except Exception as e:
         return JsonResponse({'success': False, 'message': str(e)}, status=500)
@@ -2696,14 +2558,10 @@ def search_users_for_chat(request):
         print(f"👥 [SERVER] Connected users count: {len(connected_users)}")
         
         # Search in connected users first
-        users = User.objects.filter(
-            Q(id__in=connected_users) &
-            (Q(username__icontains=query) |
-             Q(first_name__icontains=query) |
-             Q(last_name__icontains=query))
-        ).exclude(id=request.user.id).select_related('profile')[:20]
+        connected_users.discard(request.user.id)
+        users = _users_in_order(typeahead.search(query, 20, accept=connected_users.__contains__))
         
-        print(f"✅ [SERVER] Found {users.count()} users")
+        print(f"✅ [SERVER] Found {len(users)} users")
         
         users_data = []
         for user in users:
@@ -2848,8 +2706,7 @@ def mark_message_unread(request, message_id):
         message = get_object_or_404(ConversationMessage, id=message_id)
         # Only mark as unread if you're the recipient
         if request.user in message.conversation.participants.all() and message.sender != request.user:
-            message.is_read = False
-            message.save()
+            ConversationMember.mark_unread_from(message, request.user.id)
             
             return JsonResponse({
                 'success': True,
@@ -2883,9 +2740,9 @@ def search_messages(request, conversation_id):
         conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
         
         # Search messages containing query
-        messages = conversation.messages.filter(
-            content__icontains=query
-        ).order_by('-timestamp')[:50]
+        messages = search.search_messages(
+            conversation.messages.select_related('sender__profile'), query
+        )[:50]
         
         messages_data = []
         for message in messages:
@@ -2916,35 +2773,32 @@ def search_messages(request, conversation_id):
 @login_required
 @require_POST
 def start_typing(request):
-    """Start typing indicator"""
-    try:
-        data = json.loads(request.body)
-        conversation_id = data.get('conversation_id')
-        
-        # Here you would typically use WebSockets
-        # For now, we'll just return success
-        return JsonResponse({
-            'success': True,
-            'typing': True
-        })
-        
-    except Exception as e:
-        return JsonResponse({
-            'success': False,
-            'error': str(e)
-        }, status=500)
+    """Start typing indicator (HTTP fallback for the ws/feed/ socket)"""
+    return _set_typing(request, True)
 
 @login_required
 @require_POST
 def stop_typing(request):
     """Stop typing indicator"""
+    return _set_typing(request, False)
+
+def _set_typing(request, is_typing):
     try:
         data = json.loads(request.body)
-        conversation_id = data.get('conversation_id')
+        conversation_id = int(data.get('conversation_id'))
+    except (ValueError, TypeError):
+        return JsonResponse({'success': False, 'error': 'Invalid conversation'}, status=400)
+    try:
+        members = set(
+            ConversationMember.objects.filter(conversation_id=conversation_id).values_list('user_id', flat=True)
+        )
+        if request.user.id not in members:
+            return JsonResponse({'success': False, 'error': 'Not a participant'}, status=403)
         
+        presence.set_typing(conversation_id, request.user, is_typing, members)
         return JsonResponse({
             'success': True,
-            'typing': False
+            'typing': is_typing
         })
         
     except Exception as e:
@@ -2959,70 +2813,20 @@ def search_api(request):
     if not query or len(query) < 2:
         return JsonResponse({'users': [], 'posts': [], 'success': True})
     
-    results = {
-        'users': [],
-        'posts': [],
-        'success': True
-    }
-    
     try:
         # Search users - basic search
-        users = User.objects.filter(
-            Q(username__icontains=query) |
-            Q(first_name__icontains=query) |
-            Q(last_name__icontains=query)
-        )[:10]
+        users = UserSerializer.prepare(search.search_users(User.objects.all(), query))[:10]
         
-        for user in users:
-            user_data = {
-                'id': user.id,
-                'username': user.username,
-                'full_name': user.get_full_name() or user.username,
-                'profile_pic': None
-            }
-            
-            # Safely get profile data
-            try:
-                if hasattr(user, 'profile'):
-                    user_data['full_name'] = user.profile.full_name or user.get_full_name() or user.username
-                    if user.profile.profile_pic:
-                        user_data['profile_pic'] = user.profile.profile_pic.url
-            except ObjectDoesNotExist:
-                pass
-                
-            results['users'].append(user_data)
+        results = {
+            'users': [UserSerializer.serialize(user) for user in users],
+            'posts': [],
+            'success': True
+        }
         
         # Search posts - only if user authenticated
         if request.user.is_authenticated:
-            try:
-                from .models import Post  # Import your Post model
-                
-                posts = Post.objects.filter(
-                    Q(content__icontains=query)
-                ).select_related('user')[:10]
-                
-                for post in posts:
-                    post_data = {
-                        'id': post.id,
-                        'content': post.content[:200],  # Limit content length
-                        'author_name': post.user.username,
-                        'author_profile_pic': None
-                    }
-                    
-                    # Safely get author profile
-                    try:
-                        if hasattr(post.user, 'profile'):
-                            post_data['author_name'] = post.user.profile.full_name or post.user.username
-                            if post.user.profile.profile_pic:
-                                post_data['author_profile_pic'] = post.user.profile.profile_pic.url
-                    except ObjectDoesNotExist:
-                        pass
-                        
-                    results['posts'].append(post_data)
-                    
-            except Exception as post_error:
-                print(f"Post search error: {post_error}")
-                # Continue without posts if there's an error
+            posts = PostSerializer.prepare(search.search_posts(Post.objects.all(), query))[:10]
+            results['posts'] = PostSerializer.serialize_many(posts, request.user)
         
     except Exception as e:
         print(f"Search API error: {e}")
@@ -3039,21 +2843,103 @@ def search_api(request):
 @login_required
 @require_GET
 def get_online_status(request, user_id):
-    """Get user online status"""
+    """Get user online status from the presence store"""
     try:
-        user = get_object_or_404(User, id=user_id)
-        
-        is_online = user.last_login and (timezone.now() - user.last_login) < timedelta(minutes=5)
-        last_seen = user.last_login.strftime('%H:%M') if user.last_login else 'Never'
+        state = presence.get_presence([user_id])[user_id]
+        last_seen = state['last_seen']
         
         return JsonResponse({
             'success': True,
-            'is_online': is_online,
-            'last_seen': last_seen
+            'is_online': state['is_online'],
+            'last_seen': timezone.localtime(last_seen).strftime('%H:%M') if last_seen else 'Never'
         })
         
     except Exception as e:
         return JsonResponse({
             'success': False,
             'error': str(e)
-        }, status=500)
\ No newline at end of file
+        }, status=500)
+
+@login_required
+@require_GET
+def presence_api(request):
+    """Batch presence lookup: ?user_ids=1,2,3"""
+    try:
+        user_ids = [int(pk) for pk in request.GET.get('user_ids', '').split(',') if pk.strip()]
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid user_ids'}, status=400)
+    if len(user_ids) > PRESENCE_BATCH_LIMIT:
+        return JsonResponse({'success': False, 'error': f'At most {PRESENCE_BATCH_LIMIT} users per request'}, status=400)
+    
+    states = presence.get_presence(user_ids)
+    return JsonResponse({
+        'success': True,
+        'presence': {
+            str(user_id): {
+                'is_online': state['is_online'],
+                'last_seen': state['last_seen'].isoformat() if state['last_seen'] else None,
+            }
+            for user_id, state in states.items()
+        }
+    })
+
+
+@require_GET
+def derived_image(request, key):
+    """Serve a resized image, rendering it first if it has not been rendered yet."""
+    key = f'{images.PREFIX}/{key}'
+    parsed = images.parse_key(key)
+    if parsed is None:
+        raise Http404('Unknown image size or format')
+    name, size, fmt = parsed
+    if not default_storage.exists(key):
+        if not default_storage.exists(name):
+            raise Http404('No such image')
+        try:
+            images.render(name, [size], [fmt])
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+            # Not an image Pillow can decode, or too many pixels to decode safely
+            raise Http404('No such image')
+    response = FileResponse(default_storage.open(key, 'rb'), content_type=images.ENCODERS[fmt][2])
+    # Keys are derived from the upload's unique name, so the bytes never change
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+# ==================== CHUNKED UPLOADS ====================
+
+@login_required
+@require_POST
+def start_upload(request):
+    """Declare a chunked upload: filename, size and content_type."""
+    try:
+        upload = uploads.start(
+            request.user, request.POST.get('filename'), request.POST.get('size'), request.POST.get('content_type')
+        )
+    except uploads.InvalidUpload as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=e.status)
+    return JsonResponse({'success': True, 'upload': uploads.describe(upload)}, status=201)
+
+
+@login_required
+@require_http_methods(["GET", "PATCH", "DELETE"])
+def upload_detail(request, upload_id):
+    """GET reports the resume offset, PATCH appends the body at Upload-Offset, DELETE cancels."""
+    upload = get_object_or_404(Upload, id=upload_id, user=request.user)
+    if request.method == 'DELETE':
+        upload.delete()
+        return JsonResponse({'success': True})
+    if request.method == 'PATCH':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Upload-Offset header required'}, status=400)
+        try:
+            # Read the body as a stream; request.body would buffer the whole chunk
+            upload = uploads.append(upload, offset, request)
+        except uploads.InvalidUpload as e:
+            data = {'success': False, 'error': str(e)}
+            if e.upload is not None:
+                data['upload'] = uploads.describe(e.upload)
+            return JsonResponse(data, status=e.status)
+    return JsonResponse({'success': True, 'upload': uploads.describe(upload)})
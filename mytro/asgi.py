@@ -2,6 +2,8 @@
 ASGI config for mytro project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django; websockets are routed to core.routing with the
+session user attached, when Channels is installed.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +15,21 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mytro.settings')
 
-application = get_asgi_application()
+# Initialise Django before importing anything that touches models
+django_asgi_app = get_asgi_application()
+
+try:
+    from channels.auth import AuthMiddlewareStack
+    from channels.routing import ProtocolTypeRouter, URLRouter
+    from channels.security.websocket import AllowedHostsOriginValidator
+
+    from core.routing import websocket_urlpatterns
+
+    application = ProtocolTypeRouter({
+        'http': django_asgi_app,
+        'websocket': AllowedHostsOriginValidator(
+            AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+        ),
+    })
+except ImportError:
+    application = django_asgi_app
@@ -720,9 +720,10 @@ window.handleCreatePost = async function(event) {
         }
         
         if (window.uploadedFiles && window.uploadedFiles.length > 0) {
-            window.uploadedFiles.forEach((file, index) => {
-                formData.append(`image`, file);
-            });
+            // Posts carry one attachment; send it in resumable chunks
+            const file = window.uploadedFiles[0];
+            const field = file.type.startsWith('video/') ? 'video_upload' : 'image_upload';
+            formData.append(field, await window.chunkedUpload(file));
         }
         
         const response = await fetch('/create_post/', {
@@ -811,9 +812,10 @@ async function handleModernPostSubmit(e) {
         
         // Add media files
         if (window.uploadedMedia && window.uploadedMedia.length > 0) {
-            window.uploadedMedia.forEach((media, index) => {
-                formData.append('image', media.file);
-            });
+            // Posts carry one attachment; send it in resumable chunks
+            const file = window.uploadedMedia[0].file;
+            const field = file.type.startsWith('video/') ? 'video_upload' : 'image_upload';
+            formData.append(field, await window.chunkedUpload(file));
         }
         
         // Check if poll is created
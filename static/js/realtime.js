@@ -0,0 +1,88 @@
+// ==================== REAL-TIME PUSH (ws/feed/) ====================
+// One socket per tab. Server events are re-dispatched on `document` as
+// `realtime:<type>` CustomEvents (e.g. realtime:message.new) so each page
+// can listen for what it shows. While the socket is open, pages should
+// skip their polling timers (check `window.realtime.connected`).
+
+(function () {
+    const MAX_BACKOFF = 30000;
+    // Presence heartbeat; must stay under the server's PRESENCE_ONLINE_WINDOW
+    const HEARTBEAT_INTERVAL = 30000;
+    let socket = null;
+    let backoff = 1000;
+    let heartbeat = null;
+
+    const realtime = {
+        connected: false,
+
+        send(payload) {
+            if (!realtime.connected) return false;
+            socket.send(JSON.stringify(payload));
+            return true;
+        },
+
+        on(type, handler) {
+            document.addEventListener(`realtime:${type}`, (event) => handler(event.detail));
+        }
+    };
+
+    function emit(type, detail) {
+        document.dispatchEvent(new CustomEvent(`realtime:${type}`, { detail: detail }));
+    }
+
+    function connect() {
+        if (!('WebSocket' in window)) return;
+        const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        socket = new WebSocket(`${scheme}://${window.location.host}/ws/feed/`);
+
+        socket.onopen = () => {
+            realtime.connected = true;
+            backoff = 1000;
+            heartbeat = setInterval(() => realtime.send({ type: 'ping' }), HEARTBEAT_INTERVAL);
+            emit('open', {});
+        };
+
+        socket.onmessage = (message) => {
+            try {
+                const data = JSON.parse(message.data);
+                if (data.type) emit(data.type, data);
+            } catch (error) {
+                console.error('Bad realtime message:', error);
+            }
+        };
+
+        socket.onclose = () => {
+            const wasConnected = realtime.connected;
+            realtime.connected = false;
+            clearInterval(heartbeat);
+            if (wasConnected) emit('close', {});
+            // Pages fall back to polling until we reconnect
+            setTimeout(connect, backoff);
+            backoff = Math.min(backoff * 2, MAX_BACKOFF);
+        };
+    }
+
+    // Updates that apply on every page
+    realtime.on('notification.new', (data) => {
+        const badge = document.getElementById('notificationCount');
+        if (badge) {
+            const count = data && typeof data.unread_count === 'number'
+                ? data.unread_count
+                : (parseInt(badge.textContent, 10) || 0) + 1;
+            badge.textContent = count > 99 ? '99+' : count;
+            badge.style.display = 'flex';
+        }
+    });
+
+    function updateCounts(data) {
+        const likes = document.getElementById(`likeCount-${data.post_id}`);
+        if (likes) likes.textContent = data.likes_count;
+        const comments = document.getElementById(`commentCount-${data.post_id}`);
+        if (comments) comments.textContent = data.comments_count;
+    }
+    realtime.on('post.liked', updateCounts);
+    realtime.on('post.commented', updateCounts);
+
+    window.realtime = realtime;
+    connect();
+})();
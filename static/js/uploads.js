@@ -0,0 +1,80 @@
+/**
+ * Chunked, resumable uploads (server side: core/uploads.py).
+ *
+ *   const uploadId = await window.chunkedUpload(file, { onProgress: fraction => ... });
+ *
+ * The file is sent in CHUNK_SIZE pieces; after a network error the
+ * uploader asks the server how far it got and carries on from there.
+ * Pass the returned id to the view as e.g. image_upload or story_upload.
+ */
+(function () {
+    const CHUNK_SIZE = 4 * 1024 * 1024;
+    const MAX_RETRIES = 5;
+
+    function csrfToken() {
+        const match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+        return match ? decodeURIComponent(match[1]) : '';
+    }
+
+    async function request(url, options) {
+        const response = await fetch(url, {
+            credentials: 'same-origin',
+            ...options,
+            headers: { 'X-CSRFToken': csrfToken(), ...(options.headers || {}) },
+        });
+        const data = await response.json();
+        return { response, data };
+    }
+
+    async function currentOffset(id) {
+        const { data } = await request(`/api/uploads/${id}/`, { method: 'GET' });
+        return data.upload.offset;
+    }
+
+    async function chunkedUpload(file, { onProgress, filename } = {}) {
+        const body = new FormData();
+        body.append('filename', filename || file.name || 'upload');
+        body.append('size', file.size);
+        body.append('content_type', file.type);
+        const started = await request('/api/uploads/', { method: 'POST', body });
+        if (!started.data.success) throw new Error(started.data.error);
+
+        const id = started.data.upload.id;
+        let offset = 0;
+        let retries = 0;
+        while (offset < file.size) {
+            try {
+                const { response, data } = await request(`/api/uploads/${id}/`, {
+                    method: 'PATCH',
+                    headers: {
+                        'Content-Type': 'application/offset+octet-stream',
+                        'Upload-Offset': String(offset),
+                    },
+                    body: file.slice(offset, offset + CHUNK_SIZE),
+                });
+                if (response.status === 409 && data.upload) {
+                    offset = data.upload.offset;
+                    continue;
+                }
+                if (!data.success) throw Object.assign(new Error(data.error), { fatal: true });
+                offset = data.upload.offset;
+                retries = 0;
+                if (onProgress) onProgress(offset / file.size);
+            } catch (error) {
+                if (error.fatal || ++retries > MAX_RETRIES) throw error;
+                await new Promise(resolve => setTimeout(resolve, 500 * 2 ** retries));
+                offset = await currentOffset(id).catch(() => offset);
+            }
+        }
+        return id;
+    }
+
+    /** Upload a data: URL (e.g. a cropped image) without posting it as a form field. */
+    async function chunkedUploadDataUrl(dataUrl, filename, options = {}) {
+        const blob = await (await fetch(dataUrl)).blob();
+        return chunkedUpload(blob, { ...options, filename });
+    }
+
+    window.chunkedUpload = chunkedUpload;
+    window.chunkedUploadDataUrl = chunkedUploadDataUrl;
+})();